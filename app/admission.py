@@ -0,0 +1,350 @@
+"""Admission control for job submission.
+
+Job creation rejects work with ``429 Too Many Requests`` and a
+``Retry-After`` header instead of letting the backlog grow without bound:
+
+- Load shedding. ``monitor`` samples the backlog at most every
+  ``ADMISSION_SAMPLE_INTERVAL`` seconds: jobs waiting to be published
+  (outbox rows plus messages in the lanes' broker queues), the number of
+  PENDING jobs, and the rate at which workers finish jobs. The load is the
+  larger of the two backlogs relative to ``ADMISSION_MAX_QUEUED`` and
+  ``ADMISSION_MAX_PENDING``. Each priority is shed at its own level of
+  ``ADMISSION_SHED_LEVELS``, so low priority work is turned away first and
+  high priority work last, and ``Retry-After`` is the time the workers need
+  at the current drain rate to bring the backlog back under that level.
+- Rate limits. Each client (the caller's address) draws from a token
+  bucket in Redis: one token per job, refilled at ``ADMISSION_CLIENT_RATE``
+  jobs per second up to ``ADMISSION_CLIENT_BURST``. The batch endpoint
+  draws one token per job from a separate bucket sized by
+  ``ADMISSION_BATCH_RATE`` and ``ADMISSION_BATCH_BURST``, so bulk loads
+  cannot starve interactive submissions of their budget. Jobs naming a
+  ``tenant`` also draw from that tenant's bucket (``ADMISSION_TENANT_RATE``
+  and ``ADMISSION_TENANT_BURST``), shared by both endpoints. The tenant is
+  whatever the request says, so its bucket caps the tenant's share on top
+  of the caller's limit and never replaces it. A rate of 0 disables the
+  bucket.
+
+Admission fails open: if the backlog cannot be sampled or Redis cannot be
+reached, jobs are admitted, as they were before admission control.
+"""
+import logging
+import math
+import os
+import random
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Iterable, Optional
+
+from sqlalchemy import func, select
+
+from . import metrics, outbox
+from .db import Job, JobOutbox, JobPriority, JobStatus, read_session_maker
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Jobs waiting to be published (outbox and broker queues) at which the load is 1
+MAX_QUEUED = int(os.getenv("ADMISSION_MAX_QUEUED", "100000"))
+
+# PENDING jobs at which the load is 1
+MAX_PENDING = int(os.getenv("ADMISSION_MAX_PENDING", "200000"))
+
+
+def _parse_levels(value: str) -> Dict[JobPriority, float]:
+    levels = {}
+    for item in value.split(","):
+        name, _, level = item.partition("=")
+        levels[JobPriority(name.strip())] = float(level)
+    return levels
+
+
+# Load at which submissions of each priority are shed, e.g. "high=1,normal=0.9,low=0.75"
+SHED_LEVELS = _parse_levels(os.getenv("ADMISSION_SHED_LEVELS", "high=1,normal=0.9,low=0.75"))
+
+# How long a backlog sample is reused, in seconds
+SAMPLE_INTERVAL = float(os.getenv("ADMISSION_SAMPLE_INTERVAL", "1"))
+
+# Bounds of the Retry-After given to shed submissions, in seconds
+MIN_RETRY_AFTER = int(os.getenv("ADMISSION_MIN_RETRY_AFTER", "1"))
+MAX_RETRY_AFTER = int(os.getenv("ADMISSION_MAX_RETRY_AFTER", "120"))
+
+# Per-client token bucket of POST /, in jobs per second and jobs; rate 0 disables it
+CLIENT_RATE = float(os.getenv("ADMISSION_CLIENT_RATE", "0"))
+CLIENT_BURST = float(os.getenv("ADMISSION_CLIENT_BURST", "100"))
+
+# Per-client token bucket of POST /batch, in jobs per second and jobs; rate 0 disables it
+BATCH_RATE = float(os.getenv("ADMISSION_BATCH_RATE", "0"))
+BATCH_BURST = float(os.getenv("ADMISSION_BATCH_BURST", "10000"))
+
+# Per-tenant token bucket of both endpoints, in jobs per second and jobs; rate 0 disables it
+TENANT_RATE = float(os.getenv("ADMISSION_TENANT_RATE", "0"))
+TENANT_BURST = float(os.getenv("ADMISSION_TENANT_BURST", "1000"))
+
+# Window over which the drain rate is measured, in seconds
+DRAIN_WINDOW = int(os.getenv("ADMISSION_DRAIN_WINDOW", "60"))
+
+# Granularity of the drain counters in Redis, in seconds
+DRAIN_BUCKET = 5
+
+BUCKET_KEY_PREFIX = "admission-bucket:"
+DRAIN_KEY_PREFIX = "admission-drained:"
+
+# Spread retries of clients shed together over this fraction of Retry-After
+RETRY_JITTER = 0.1
+
+# Refills a bucket for the time since it was last used and takes ``cost``
+# tokens if it holds enough. Returns whether they were taken and, if not,
+# the seconds until it will hold enough. Uses the Redis clock so API
+# processes with skewed clocks share one bucket correctly.
+_TAKE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'at')
+local tokens = tonumber(state[1]) or burst
+local at = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(now - at, 0) * rate)
+local wait = 0
+if tokens >= cost then
+    tokens = tokens - cost
+else
+    wait = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'at', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+
+class AdmissionError(Exception):
+    """A submission was not admitted; retry after ``retry_after`` seconds."""
+
+    def __init__(self, message: str, retry_after: int, reason: str, status_code: int = 429):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.reason = reason
+        self.status_code = status_code
+
+
+@dataclass(frozen=True)
+class Load:
+    """One sample of the backlog."""
+    queued: int
+    pending: int
+    # Jobs finished per second over the last DRAIN_WINDOW
+    drain_rate: float
+    sampled_at: float
+
+    @property
+    def level(self) -> float:
+        return max(self.queued / MAX_QUEUED, self.pending / MAX_PENDING)
+
+    def retry_after(self, level: float) -> int:
+        """Seconds until draining brings the backlog under ``level``."""
+        excess = max(self.queued - level * MAX_QUEUED, self.pending - level * MAX_PENDING, 0)
+        if self.drain_rate <= 0:
+            seconds = MAX_RETRY_AFTER
+        else:
+            seconds = excess / self.drain_rate * random.uniform(1, 1 + RETRY_JITTER)
+        return int(min(max(math.ceil(seconds), MIN_RETRY_AFTER), MAX_RETRY_AFTER))
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {**asdict(self), "level": round(self.level, 4)}
+
+
+def _retry_seconds(seconds: float) -> int:
+    return max(math.ceil(seconds), MIN_RETRY_AFTER)
+
+
+async def _count(stmt, cap: int) -> int:
+    """``count(*)`` of ``stmt``, counting no further than ``cap`` rows."""
+    async with read_session_maker() as session:
+        return (await session.execute(
+            select(func.count()).select_from(stmt.limit(cap).subquery())
+        )).scalar_one()
+
+
+async def drain_rate(now: Optional[float] = None) -> float:
+    """Jobs finished per second by all workers over the last ``DRAIN_WINDOW``."""
+    now = time.time() if now is None else now
+    current = int(now // DRAIN_BUCKET)
+    buckets = max(DRAIN_WINDOW // DRAIN_BUCKET, 1)
+    counts = await get_redis().mget(
+        [f"{DRAIN_KEY_PREFIX}{bucket}" for bucket in range(current - buckets, current + 1)]
+    )
+    # The current bucket is only partly elapsed
+    elapsed = buckets * DRAIN_BUCKET + now % DRAIN_BUCKET
+    return sum(int(count) for count in counts if count is not None) / elapsed
+
+
+async def record_drained(count: int = 1) -> None:
+    """Count ``count`` jobs as finished; called by workers."""
+    key = f"{DRAIN_KEY_PREFIX}{int(time.time() // DRAIN_BUCKET)}"
+    try:
+        async with get_redis().pipeline(transaction=False) as pipe:
+            pipe.incrby(key, count)
+            pipe.expire(key, DRAIN_WINDOW + 2 * DRAIN_BUCKET)
+            await pipe.execute()
+    except Exception as e:
+        logger.debug("Failed to record drained jobs: %s", e)
+
+
+class LoadMonitor:
+    """Samples the backlog, reusing a sample for ``interval`` seconds."""
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        self.interval = interval
+        self._load: Optional[Load] = None
+        self._sampling = False
+
+    async def sample(self) -> Load:
+        # Counting stops a little past the limits; the excess only sets Retry-After
+        outbox_depth = await _count(select(JobOutbox.id), 4 * MAX_QUEUED)
+        pending = await _count(select(Job.id).where(Job.status == JobStatus.PENDING), 4 * MAX_PENDING)
+        depths = await outbox.broker_depths()
+        load = Load(
+            queued=outbox_depth + sum(depth or 0 for depth in depths.values()),
+            pending=pending,
+            drain_rate=await drain_rate(),
+            sampled_at=time.time(),
+        )
+        metrics.ADMISSION_LOAD.set(load.level)
+        return load
+
+    async def current(self) -> Optional[Load]:
+        """The latest sample, or None if the backlog cannot be read."""
+        load = self._load
+        fresh = load is not None and time.time() - load.sampled_at < self.interval
+        if fresh or (load is not None and self._sampling):
+            # Requests arriving while a sample is taken use the previous one
+            return load
+        self._sampling = True
+        try:
+            self._load = await self.sample()
+        except Exception as e:
+            logger.warning("Failed to sample the job backlog: %s", e)
+            # Keep admitting on the last sample until the next attempt
+            if load is not None:
+                self._load = Load(load.queued, load.pending, load.drain_rate, time.time())
+        finally:
+            self._sampling = False
+        return self._load
+
+    async def stats(self) -> Dict[str, Any]:
+        load = await self.current()
+        return {
+            "load": None if load is None else load.as_dict(),
+            "max_queued": MAX_QUEUED,
+            "max_pending": MAX_PENDING,
+            "shed_levels": {priority.value: level for priority, level in SHED_LEVELS.items()},
+            "shedding": [] if load is None else [
+                priority.value for priority, level in SHED_LEVELS.items() if load.level >= level
+            ],
+        }
+
+
+monitor = LoadMonitor()
+
+
+async def take(key: str, rate: float, burst: float, cost: float = 1) -> float:
+    """Take ``cost`` tokens from bucket ``key``; returns 0, or the seconds to wait."""
+    if rate <= 0:
+        return 0.0
+    try:
+        script = get_redis().register_script(_TAKE_SCRIPT)
+        return float(await script(keys=[f"{BUCKET_KEY_PREFIX}{key}"], args=[rate, burst, cost]))
+    except Exception as e:
+        logger.warning("Failed to apply the rate limit of %s: %s", key, e)
+        return 0.0
+
+
+def client_key(host: Optional[str]) -> str:
+    """Rate limit key of the caller.
+
+    Only the address identifies a caller; the ``tenant`` of a job is
+    unauthenticated and any client could pick a fresh one per request.
+    """
+    return f"addr:{host or 'unknown'}"
+
+
+def _reject(message: str, retry_after: int, reason: str, status_code: int = 429) -> AdmissionError:
+    metrics.ADMISSION_REJECTIONS.labels(reason=reason).inc()
+    return AdmissionError(message, retry_after, reason, status_code)
+
+
+async def _shed(priority: JobPriority) -> None:
+    load = await monitor.current()
+    if load is None:
+        return
+    level = SHED_LEVELS.get(priority, 1.0)
+    if load.level >= level:
+        raise _reject(
+            f"The job backlog is at {load.level:.0%} of capacity; "
+            f"{priority.value} priority jobs are not accepted until it drains",
+            load.retry_after(level),
+            "overload",
+        )
+
+
+async def _take_tenants(tenants: Dict[str, int]) -> None:
+    for tenant, count in tenants.items():
+        if TENANT_RATE > 0 and count > TENANT_BURST:
+            raise _reject(
+                f"Batch of {count} jobs for tenant {tenant} exceeds its budget of {TENANT_BURST:g} jobs",
+                MAX_RETRY_AFTER,
+                "tenant_limit",
+                status_code=413,
+            )
+        wait = await take(f"tenant:{tenant}", TENANT_RATE, TENANT_BURST, count)
+        if wait:
+            raise _reject(
+                f"Rate limit of {TENANT_RATE:g} jobs per second for tenant {tenant} exceeded",
+                _retry_seconds(wait),
+                "tenant_limit",
+            )
+
+
+async def admit(client: str, priority: JobPriority, tenant: Optional[str] = None) -> None:
+    """Admit one job submitted with ``POST /``; raises ``AdmissionError``."""
+    await _shed(priority)
+    wait = await take(f"job:{client}", CLIENT_RATE, CLIENT_BURST)
+    if wait:
+        raise _reject(
+            f"Rate limit of {CLIENT_RATE:g} jobs per second exceeded",
+            _retry_seconds(wait),
+            "rate_limit",
+        )
+    if tenant is not None:
+        await _take_tenants({tenant: 1})
+
+
+async def admit_batch(
+    client: str,
+    priorities: Iterable[JobPriority],
+    count: int,
+    tenants: Optional[Dict[str, int]] = None,
+) -> None:
+    """Admit a batch of ``count`` jobs, ``tenants`` of which name a tenant;
+    raises ``AdmissionError``.
+
+    A batch is shed at the level of its most urgent job.
+    """
+    ranks = list(JobPriority)
+    await _shed(min(priorities, key=ranks.index))
+    if BATCH_RATE > 0 and count > BATCH_BURST:
+        raise _reject(
+            f"Batch of {count} jobs exceeds the batch budget of {BATCH_BURST:g} jobs",
+            MAX_RETRY_AFTER,
+            "batch_budget",
+            status_code=413,
+        )
+    wait = await take(f"batch:{client}", BATCH_RATE, BATCH_BURST, count)
+    if wait:
+        raise _reject(
+            f"Batch budget of {BATCH_RATE:g} jobs per second exceeded",
+            _retry_seconds(wait),
+            "batch_budget",
+        )
+    await _take_tenants(tenants or {})
@@ -1,16 +1,170 @@
-from fastapi import APIRouter, HTTPException, Depends, status, Query, Body, Path
+from fastapi import APIRouter, HTTPException, Depends, status, Query, Body, Path, Request, WebSocket
+from fastapi.exceptions import RequestValidationError
+from pydantic import ValidationError
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from sqlalchemy import bindparam, delete, insert, tuple_, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from typing import List, Optional, Dict, Any
-from datetime import datetime
+from typing import AsyncIterator, List, Optional, Dict, Any, Tuple, Union
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+import asyncio
+import base64
+import binascii
+import json
+import os
+import time
 import uuid
 
-from ..db import Job, JobStatus, get_db, create_tables
-from ..schemas import JobCreate, JobResponse, JobStatusResponse, JobResultResponse, OperationType
-from .. import tasks
+import numpy as np
+
+from ..db import ACTIVE_STATUSES, DEFAULT_TENANT, Job, JobOutbox, JobStatus, TERMINAL_STATUSES, async_session_maker, get_db, get_read_db, is_replica, create_tables
+from ..schemas import JobAppend, JobCreate, JobListResponse, JobPriority, JobResponse, JobStatusResponse, JobResultResponse, JobTimelineResponse, OperationType
+from .. import admission, blobstore, cancellation, export, notifications, operations, outbox, result_cache, status_cache, tracing, uploads
+
+# Upper bound on the number of jobs accepted by a single batch submission
+MAX_BATCH_SIZE = int(os.getenv("JOB_BATCH_MAX_SIZE", "10000"))
+
+# Default and maximum page size of the job listing
+LIST_PAGE_SIZE = int(os.getenv("JOB_LIST_PAGE_SIZE", "50"))
+LIST_MAX_PAGE_SIZE = int(os.getenv("JOB_LIST_MAX_PAGE_SIZE", "1000"))
+
+# Longest a client may block in a long-poll request, in seconds
+LONG_POLL_MAX_WAIT = float(os.getenv("LONG_POLL_MAX_WAIT", "60"))
+
+# How often waiters re-read a job in case a notification was missed
+JOB_RECHECK_INTERVAL = float(os.getenv("JOB_RECHECK_INTERVAL", "5"))
 
 router = APIRouter()
 
+async def _job_input(data: Union[List[float], np.ndarray]) -> Dict[str, Any]:
+    """Return the ``input_data`` column value for ``data``.
+
+    Large inputs are written to the blob store and only its handle is kept.
+    """
+    if not blobstore.should_offload(len(data)):
+        if isinstance(data, np.ndarray):
+            data = data.tolist()
+        return {"data": data}
+    handle = await asyncio.to_thread(blobstore.put, operations.as_array(data))
+    return {"blob": handle, "size": len(data)}
+
+def _validate_json(model, body: bytes):
+    try:
+        return model.model_validate_json(body)
+    except ValidationError as e:
+        raise RequestValidationError(
+            [{**error, "loc": ("body", *error["loc"])} for error in e.errors(include_url=False)]
+        )
+
+async def _parse_upload(request: Request, content_type: str) -> Tuple[Optional[str], np.ndarray]:
+    try:
+        return await uploads.parse(content_type, request.stream())
+    except uploads.UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+async def _read_job_upload(
+    request: Request,
+    operation: Optional[List[OperationType]],
+    appendable: bool,
+    priority: JobPriority,
+    tenant: Optional[str],
+    deadline: Optional[datetime],
+    ttl: Optional[float]
+) -> JobCreate:
+    """Parse the body of ``POST /`` according to its content type.
+
+    For non-JSON bodies ``data`` is left as the parsed float64 array.
+    """
+    content_type = uploads.media_type(request.headers.get("content-type"))
+    if content_type not in uploads.CONTENT_TYPES:
+        return _validate_json(JobCreate, await request.body())
+
+    body_operation, values = await _parse_upload(request, content_type)
+    operation = body_operation or operation
+    if not operation:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="An operation is required, e.g. ?operation=square_sum"
+        )
+    try:
+        operation = operations.fused_name([operation] if isinstance(operation, str) else operation)
+    except (TypeError, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Unsupported operation: {operation}"
+        )
+    return JobCreate.model_construct(
+        data=values, operation=operation, appendable=appendable, priority=priority, tenant=tenant,
+        deadline=deadline, ttl=ttl
+    )
+
+def _job_deadline(job: JobCreate, now: datetime) -> Optional[datetime]:
+    """Deadline of ``job`` as naive UTC: the earlier of ``deadline`` and ``ttl`` from ``now``."""
+    deadlines = []
+    if job.deadline is not None:
+        deadlines.append(_utc_naive(job.deadline))
+    if job.ttl is not None:
+        deadlines.append(now + timedelta(seconds=job.ttl))
+    deadline = min(deadlines, default=None)
+    if deadline is not None and deadline <= now:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Deadline {deadline.isoformat()}Z has already passed"
+        )
+    return deadline
+
+async def _admit(admitting) -> None:
+    """Await an ``admission`` check, turning a rejection into its HTTP error."""
+    try:
+        await admitting
+    except admission.AdmissionError as e:
+        headers = {"Retry-After": str(e.retry_after)} if e.status_code == status.HTTP_429_TOO_MANY_REQUESTS else None
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers=headers)
+
+async def _read_append_upload(request: Request) -> Union[List[float], np.ndarray]:
+    """Parse the body of ``POST /{job_id}/append`` according to its content type."""
+    content_type = uploads.media_type(request.headers.get("content-type"))
+    if content_type not in uploads.CONTENT_TYPES:
+        return _validate_json(JobAppend, await request.body()).data
+    _, values = await _parse_upload(request, content_type)
+    return values
+
+def _aggregate_result(operation: str, partial: Any, count: int) -> Dict[str, Any]:
+    """Result column for an appendable job: the finalized value plus the
+    running partial and element count that later appends build on."""
+    return {
+        "result": {"value": operations.finalize(operation, partial)},
+        "error": None,
+        "state": partial,
+        "count": count
+    }
+
+_JOB_UPLOAD_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/json": {
+                "schema": {"$ref": "#/components/schemas/JobCreate"},
+                "example": {"data": [1, 2, 3, 4, 5], "operation": "square_sum"}
+            },
+            uploads.OCTET_STREAM: {
+                "schema": {"type": "string", "format": "binary",
+                           "description": "Little-endian float64 values; pass ?operation="}
+            },
+            uploads.MSGPACK_TYPES[0]: {
+                "schema": {"type": "string", "format": "binary",
+                           "description": "Map with 'data' (bin of float64 or array) and 'operation'"}
+            },
+            uploads.NDJSON_TYPES[0]: {
+                "schema": {"type": "string",
+                           "description": "One number or JSON array of numbers per line; pass ?operation="}
+            }
+        }
+    }
+}
+
 @router.post(
     "/",
     response_model=JobResponse,
@@ -22,43 +176,132 @@ router = APIRouter()
     Supported operations:
     - `square_sum`: Calculate the sum of squares of the input numbers
     - `cube_sum`: Calculate the sum of cubes of the input numbers
+    - `count`, `sum`, `mean`, `min`, `max`: Basic aggregates of the input
+
+    `operation` may also be a list of operations (repeat `?operation=` for
+    binary uploads). They are computed together in one pass over the data,
+    and the job's result is a map from operation to value.
+
+    Besides JSON, the data can be uploaded as `application/octet-stream`
+    (raw little-endian float64), `application/msgpack` or
+    `application/x-ndjson`. These formats are parsed straight into a float64
+    array; pass the operation as `?operation=` unless it is in the msgpack map.
+
+    If an identical job (same operation and data) has already completed, the
+    job is created with its cached result in SUCCESS status and no task is
+    dispatched.
+
+    Pass `ttl` (seconds) or `deadline` (a timestamp) to have the job
+    dropped as EXPIRED if it has not finished by then; a job that expires
+    while queued is never run. `DELETE /{job_id}` cancels a job.
+
+    Set `appendable` to create a job whose data can later be extended with
+    `POST /{job_id}/append`. Its result is available immediately and is
+    updated incrementally by each append.
+
+    `priority` (`high`, `normal` or `low`) selects the dispatch lane, and
+    jobs within a lane are dispatched fairly across `tenant`s, so one
+    client's backlog does not hold up the others' jobs.
+
+    When the job backlog is too large, or the client or the job's tenant
+    exceeds its rate limit, the job is rejected with 429 and a `Retry-After` header giving
+    the seconds to wait. Low priority jobs are rejected first.
     """,
     responses={
         201: {"description": "Job successfully submitted"},
+        413: {"description": "Upload exceeds the maximum number of values"},
+        415: {"description": "Unsupported content type"},
         422: {"description": "Validation error"},
+        429: {"description": "Backlog too large or rate limit exceeded; retry after `Retry-After` seconds"},
         500: {"description": "Internal server error"}
     },
-    response_description="The created job with PENDING status"
+    response_description="The created job with PENDING status, or SUCCESS on a cache hit",
+    openapi_extra=_JOB_UPLOAD_BODY
 )
 async def create_job(
-    job: JobCreate = Body(
-        ...,
-        example={
-            "data": [1, 2, 3, 4, 5],
-            "operation": "square_sum"
-        },
-        description="Job creation payload"
+    request: Request,
+    operation: Optional[List[OperationType]] = Query(
+        None,
+        description="Operation for binary and NDJSON uploads; repeat to compute several in one pass"
+    ),
+    appendable: bool = Query(
+        False,
+        description="Create an appendable job (binary and NDJSON uploads)"
+    ),
+    priority: JobPriority = Query(
+        JobPriority.NORMAL,
+        description="Dispatch lane of the job (binary and NDJSON uploads)"
+    ),
+    tenant: Optional[str] = Query(
+        None,
+        min_length=1,
+        max_length=64,
+        description="Client the job is scheduled fairly for (binary and NDJSON uploads)"
+    ),
+    deadline: Optional[datetime] = Query(
+        None,
+        description="Time by which the job must finish or expire (binary and NDJSON uploads)"
+    ),
+    ttl: Optional[float] = Query(
+        None,
+        gt=0,
+        description="Seconds after which the job expires (binary and NDJSON uploads)"
     ),
     db: AsyncSession = Depends(get_db)
 ):
+    started = time.time()
+    job = await _read_job_upload(request, operation, appendable, priority, tenant, deadline, ttl)
+    deadline = _job_deadline(job, datetime.utcnow())
+    client = admission.client_key(request.client and request.client.host)
+    await _admit(admission.admit(client, job.priority, job.tenant))
+    operation, data = operations.fused_name(job.operation), job.data
+    tenant = job.tenant or DEFAULT_TENANT
+
     try:
-        # Create a new job in the database
-        db_job = Job(
-            status=JobStatus.PENDING,
-            operation=job.operation,
-            input_data={"data": job.data}
-        )
+        input_data = await _job_input(data)
+
+        if job.appendable:
+            # Appendable jobs keep a running aggregate that appends extend,
+            # so the initial data is reduced here rather than by a worker
+            partial = await asyncio.to_thread(operations.reduce_partial, operation, data)
+            cached = None
+            db_job = Job(
+                status=JobStatus.SUCCESS,
+                operation=operation,
+                input_data=input_data,
+                appendable=True,
+                priority=job.priority.value,
+                tenant=tenant,
+                result=_aggregate_result(operation, partial, len(data))
+            )
+        else:
+            # Identical jobs that already ran are completed from the result
+            # cache; hashing a large input takes a while, so not on the loop
+            key = await asyncio.to_thread(result_cache.cache_key, operation, data)
+            cached = await result_cache.get(key)
+
+            # Create a new job in the database
+            db_job = Job(
+                status=JobStatus.PENDING if cached is None else JobStatus.SUCCESS,
+                operation=operation,
+                input_data=input_data,
+                priority=job.priority.value,
+                tenant=tenant,
+                deadline=deadline,
+                result=None if cached is None else {"result": cached, "error": None}
+            )
         
         db.add(db_job)
+        if cached is None and not job.appendable:
+            # Dispatch through the outbox, committed together with the job
+            await db.flush()
+            await outbox.add(db, [(db_job.id, db_job.priority, db_job.tenant)])
         await db.commit()
         await db.refresh(db_job)
-        
-        # Start the background task
-        tasks.process_job.delay(
-            job_id=db_job.id,
-            operation=job.operation,
-            data=job.data
-        )
+        await status_cache.put(status_cache.snapshot(db_job))
+        outbox.dispatcher.wake()
+        # First phase of the job's timeline: the request up to the commit
+        tracing.record_span("api", started, time.time(), phase_of=db_job.id)
         
         return db_job
     except Exception as e:
@@ -68,6 +311,406 @@ async def create_job(
             detail=f"Failed to create job: {str(e)}"
         )
 
+@router.post(
+    "/batch",
+    response_model=List[JobResponse],
+    status_code=status.HTTP_201_CREATED,
+    summary="Submit many jobs at once",
+    description="""
+    Submit a list of jobs in a single request. All jobs are inserted in one
+    multi-row statement and their tasks are published to the broker together,
+    so the per-job round trip of `POST /` is paid only once per batch.
+
+    The returned jobs are in the same order as the submitted items. Items
+    that hit the result cache are created in SUCCESS status and not dispatched.
+
+    Batches draw from their own per-client budget of jobs per second,
+    separate from `POST /`. A batch over the budget, or submitted while the
+    backlog is too large for its most urgent job's priority, is rejected as
+    a whole with 429 and a `Retry-After` header.
+    """,
+    responses={
+        201: {"description": "Jobs successfully submitted"},
+        413: {"description": "Batch exceeds the maximum allowed size or the batch budget"},
+        422: {"description": "Validation error"},
+        429: {"description": "Backlog too large or batch budget exceeded; retry after `Retry-After` seconds"},
+        500: {"description": "Internal server error"}
+    },
+    response_description="The created jobs with PENDING status"
+)
+async def create_jobs_batch(
+    request: Request,
+    jobs: List[JobCreate] = Body(
+        ...,
+        example=[
+            {"data": [1, 2, 3], "operation": "square_sum"},
+            {"data": [4, 5, 6], "operation": "cube_sum"},
+            {"data": [7, 8, 9], "operation": ["count", "mean", "max"]}
+        ],
+        description="List of job creation payloads"
+    ),
+    db: AsyncSession = Depends(get_db)
+):
+    started = time.time()
+    if not jobs:
+        return []
+
+    if len(jobs) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Batch contains {len(jobs)} jobs; the maximum is {MAX_BATCH_SIZE}"
+        )
+
+    if any(job.appendable for job in jobs):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Appendable jobs must be created individually with POST /"
+        )
+
+    client = admission.client_key(request.client and request.client.host)
+    tenants = Counter(job.tenant for job in jobs if job.tenant is not None)
+    await _admit(admission.admit_batch(client, [job.priority for job in jobs], len(jobs), tenants))
+
+    now = datetime.utcnow()
+    deadlines = [_job_deadline(job, now) for job in jobs]
+
+    try:
+        names = [operations.fused_name(job.operation) for job in jobs]
+        keys = await asyncio.to_thread(result_cache.cache_keys, [(name, job.data) for name, job in zip(names, jobs)])
+        cached = await result_cache.get_many(keys)
+        inputs = [await _job_input(job.data) for job in jobs]
+
+        # Insert every job in one multi-row statement, returning the new rows
+        stmt = insert(Job).returning(*status_cache.COLUMNS, sort_by_parameter_order=True)
+        result = await db.execute(
+            stmt,
+            [
+                {
+                    "status": JobStatus.PENDING if hit is None else JobStatus.SUCCESS,
+                    "operation": name,
+                    "input_data": input_data,
+                    "priority": job.priority.value,
+                    "tenant": job.tenant or DEFAULT_TENANT,
+                    "deadline": deadline,
+                    "result": None if hit is None else {"result": hit, "error": None}
+                }
+                for job, name, hit, input_data, deadline in zip(jobs, names, cached, inputs, deadlines)
+            ]
+        )
+        db_jobs = [row._asdict() for row in result]
+        # Queue the jobs that still need computing in the same transaction
+        await outbox.add(db, [
+            (db_job["id"], job.priority.value, job.tenant or DEFAULT_TENANT)
+            for db_job, job, hit in zip(db_jobs, jobs, cached)
+            if hit is None
+        ])
+        await db.commit()
+        await status_cache.put_many(db_jobs)
+        outbox.dispatcher.wake()
+        tracing.record_span("api", started, time.time(), phase_of=[db_job["id"] for db_job in db_jobs])
+
+        return db_jobs
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to create jobs: {str(e)}"
+        )
+
+async def _select_job(db: AsyncSession, job_id: int):
+    result = await db.execute(select(*status_cache.COLUMNS).filter(Job.id == job_id))
+    row = result.first()
+    # End the read transaction so waiting clients do not hold a connection
+    await db.commit()
+    return row
+
+async def _load_job(db: AsyncSession, job_id: int) -> Optional[Dict[str, Any]]:
+    """Return the job's state (every column except input_data), or None."""
+    job = await status_cache.get(job_id)
+    if job is not None:
+        return job
+
+    row = await _select_job(db, job_id)
+    if row is None and is_replica(db):
+        # A job created moments ago may not have reached the replica yet
+        async with async_session_maker() as primary:
+            row = await _select_job(primary, job_id)
+    if row is None:
+        return None
+
+    job = row._asdict()
+    await status_cache.put(job, overwrite=False)
+    return await status_cache.with_pending(job)
+
+async def _job_updates(
+    db: AsyncSession, job_id: int, timeout: Optional[float] = None
+) -> AsyncIterator[Optional[Dict[str, Any]]]:
+    """Yield the job now and again whenever it may have changed.
+
+    Wakes on notifications from workers, and every JOB_RECHECK_INTERVAL
+    seconds as a fallback. Stops once the job is terminal, is gone, or
+    ``timeout`` seconds have passed.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = None if timeout is None else loop.time() + timeout
+    with notifications.hub.listen(job_id) as events:
+        job = await _load_job(db, job_id)
+        yield job
+        while job is not None and job["status"] not in TERMINAL_STATUSES:
+            delay = JOB_RECHECK_INTERVAL
+            if deadline is not None:
+                delay = min(delay, deadline - loop.time())
+                if delay <= 0:
+                    return
+            try:
+                await asyncio.wait_for(events.get(), delay)
+            except asyncio.TimeoutError:
+                pass
+            job = await _load_job(db, job_id)
+            yield job
+
+async def _wait_for_job(db: AsyncSession, job_id: int, wait: float) -> Optional[Dict[str, Any]]:
+    """Return the job once it is terminal or ``wait`` seconds have passed."""
+    job = None
+    async for job in _job_updates(db, job_id, timeout=wait):
+        pass
+    return job
+
+def _job_result_data(job: Dict[str, Any]) -> Dict[str, Any]:
+    response_data = {
+        "id": job["id"],
+        "status": job["status"],
+        "operation": job["operation"],
+        "deadline": job.get("deadline"),
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"]
+    }
+    
+    if job["result"]:
+        if "error" in job["result"] and job["result"]["error"]:
+            response_data["error"] = job["result"]["error"]
+        if "result" in job["result"]:
+            response_data["result"] = job["result"]["result"]
+    
+    return response_data
+
+def _job_status_data(job: Dict[str, Any]) -> Dict[str, Any]:
+    # Sharded jobs report shard completion while IN_PROGRESS
+    return {**job, "progress": (job["result"] or {}).get("progress")}
+
+def _job_event_data(job: Dict[str, Any]) -> Dict[str, Any]:
+    if job["status"] in TERMINAL_STATUSES:
+        return jsonable_encoder(_job_result_data(job))
+    return jsonable_encoder(JobStatusResponse.model_validate(_job_status_data(job)))
+
+# Columns returned by the job listing; input_data and result are never read
+_LIST_COLUMNS = (Job.id, Job.status, Job.operation, Job.deadline, Job.created_at, Job.updated_at)
+
+def _utc_naive(value: datetime) -> datetime:
+    # created_at is stored as UTC; compare and encode without a zone
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def _encode_cursor(created_at: datetime, job_id: int) -> str:
+    raw = json.dumps([_utc_naive(created_at).isoformat(), job_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def _filter_jobs(
+    stmt,
+    status_filter: Optional[List[JobStatus]],
+    operation: Optional[OperationType],
+    created_after: Optional[datetime],
+    created_before: Optional[datetime]
+):
+    if status_filter:
+        # Inline the statuses so the planner can match the partial index
+        # on active jobs even for prepared statements
+        stmt = stmt.where(Job.status.in_(
+            bindparam("statuses", sorted(set(status_filter)), expanding=True, literal_execute=True)
+        ))
+    if operation is not None:
+        stmt = stmt.where(Job.operation == operation.value)
+    if created_after is not None:
+        stmt = stmt.where(Job.created_at >= _utc_naive(created_after))
+    if created_before is not None:
+        stmt = stmt.where(Job.created_at < _utc_naive(created_before))
+    return stmt
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, job_id = json.loads(raw)
+        return _utc_naive(datetime.fromisoformat(created_at)), int(job_id)
+    except (binascii.Error, ValueError, TypeError):
+        # A bad query parameter, like any other that fails validation
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Invalid cursor"
+        )
+
+@router.get(
+    "/",
+    response_model=JobListResponse,
+    summary="List jobs",
+    description="""
+    List jobs, newest first by default, optionally filtered by status,
+    operation and creation time.
+
+    Results are paginated with a cursor: pass the `next_cursor` of a page as
+    `cursor` to fetch the next one, keeping the same filters and `order`.
+    `next_cursor` is null on the last page. Pages are read by seeking on
+    `(created_at, id)`, so deep pages cost the same as the first one.
+
+    Input data and results are not included; use `GET /{job_id}/result`.
+    """,
+    responses={
+        200: {"description": "A page of jobs"},
+        422: {"description": "Invalid cursor or query parameter"},
+        500: {"description": "Internal server error"}
+    },
+    response_description="A page of jobs and the cursor of the next page"
+)
+async def list_jobs(
+    status_filter: Optional[List[JobStatus]] = Query(
+        None,
+        alias="status",
+        description="Only jobs in these statuses; repeat to pass several"
+    ),
+    operation: Optional[OperationType] = Query(
+        None,
+        description="Only jobs of this operation"
+    ),
+    created_after: Optional[datetime] = Query(
+        None,
+        description="Only jobs created at or after this time"
+    ),
+    created_before: Optional[datetime] = Query(
+        None,
+        description="Only jobs created before this time"
+    ),
+    cursor: Optional[str] = Query(
+        None,
+        description="`next_cursor` of the previous page"
+    ),
+    limit: int = Query(
+        LIST_PAGE_SIZE,
+        ge=1,
+        le=LIST_MAX_PAGE_SIZE,
+        description="Maximum number of jobs to return"
+    ),
+    order: str = Query(
+        "desc",
+        pattern="^(asc|desc)$",
+        description="`desc` for newest first, `asc` for oldest first"
+    ),
+    db: AsyncSession = Depends(get_read_db)
+):
+    position = _decode_cursor(cursor) if cursor else None
+    try:
+        stmt = _filter_jobs(
+            select(*_LIST_COLUMNS), status_filter, operation, created_after, created_before
+        )
+
+        key = tuple_(Job.created_at, Job.id)
+        if order == "desc":
+            if position is not None:
+                stmt = stmt.where(key < tuple_(*position))
+            stmt = stmt.order_by(Job.created_at.desc(), Job.id.desc())
+        else:
+            if position is not None:
+                stmt = stmt.where(key > tuple_(*position))
+            stmt = stmt.order_by(Job.created_at.asc(), Job.id.asc())
+
+        # One extra row tells whether there is a next page
+        rows = (await db.execute(stmt.limit(limit + 1))).all()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = _encode_cursor(rows[-1].created_at, rows[-1].id)
+
+        return {"items": [row._asdict() for row in rows], "next_cursor": next_cursor}
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to list jobs: {str(e)}"
+        )
+
+@router.get(
+    "/export",
+    summary="Export jobs and results",
+    description="""
+    Stream every job matching the filters, with its result or error, as
+    NDJSON (one JSON object per line) or CSV, oldest first. Rows are read
+    through a server-side cursor and streamed as they are fetched, so
+    exports of any size run in constant memory. Pass `compress=true` for a
+    gzip-encoded body.
+
+    Every record has a `cursor`. To resume an interrupted export, repeat
+    the request with the same filters and `cursor` set to the cursor of
+    the last complete record received. Fused jobs' results are maps, which
+    CSV exports encode as JSON.
+    """,
+    responses={
+        200: {
+            "description": "The exported jobs",
+            "content": {media_type: {} for media_type in export.FORMATS.values()}
+        },
+        422: {"description": "Invalid cursor or query parameter"},
+        500: {"description": "Internal server error"}
+    },
+    response_description="A stream of job records",
+    response_class=StreamingResponse
+)
+async def export_jobs(
+    status_filter: Optional[List[JobStatus]] = Query(
+        None,
+        alias="status",
+        description="Only jobs in these statuses; repeat to pass several"
+    ),
+    operation: Optional[OperationType] = Query(
+        None,
+        description="Only jobs of this operation"
+    ),
+    created_after: Optional[datetime] = Query(
+        None,
+        description="Only jobs created at or after this time"
+    ),
+    created_before: Optional[datetime] = Query(
+        None,
+        description="Only jobs created before this time"
+    ),
+    cursor: Optional[str] = Query(
+        None,
+        description="`cursor` of the last record received, to resume an export"
+    ),
+    format: str = Query(
+        "ndjson",
+        pattern="^(ndjson|csv)$",
+        description="`ndjson` or `csv`"
+    ),
+    compress: bool = Query(
+        False,
+        description="gzip the response body"
+    )
+):
+    position = _decode_cursor(cursor) if cursor else None
+    stmt = _filter_jobs(
+        select(*export.COLUMNS), status_filter, operation, created_after, created_before
+    )
+    if position is not None:
+        stmt = stmt.where(tuple_(Job.created_at, Job.id) > tuple_(*position))
+    stmt = stmt.order_by(Job.created_at.asc(), Job.id.asc())
+
+    headers = {"Content-Disposition": f'attachment; filename="jobs.{format}"'}
+    if compress:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(
+        export.stream(stmt, format, compress, lambda row: _encode_cursor(row.created_at, row.id)),
+        media_type=export.FORMATS[format],
+        headers=headers
+    )
+
 @router.get(
     "/{job_id}/status",
     response_model=JobStatusResponse,
@@ -80,6 +723,14 @@ async def create_job(
     - `IN_PROGRESS`: Job is currently being processed
     - `SUCCESS`: Job completed successfully
     - `FAILED`: Job failed during processing
+    - `CANCELLED`: Job was cancelled with `DELETE /{job_id}`
+    - `EXPIRED`: Job's deadline passed before it finished
+
+    Large jobs that are split into shards report `progress` (completed and
+    total shards) while IN_PROGRESS.
+
+    Pass `wait` to long-poll: the request returns as soon as the job reaches
+    a terminal state, or after `wait` seconds with its current status.
     """,
     responses={
         200: {"description": "Job status retrieved successfully"},
@@ -95,11 +746,16 @@ async def get_job_status(
         example=1,
         gt=0
     ),
-    db: AsyncSession = Depends(get_db)
+    wait: float = Query(
+        0,
+        ge=0,
+        le=LONG_POLL_MAX_WAIT,
+        description="Seconds to wait for the job to finish before responding"
+    ),
+    db: AsyncSession = Depends(get_read_db)
 ):
     try:
-        result = await db.execute(select(Job).filter(Job.id == job_id))
-        job = result.scalars().first()
+        job = await _wait_for_job(db, job_id, wait)
         
         if job is None:
             raise HTTPException(
@@ -107,7 +763,9 @@ async def get_job_status(
                 detail=f"Job with ID {job_id} not found"
             )
         
-        return job
+        return _job_status_data(job)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -122,8 +780,9 @@ async def get_job_status(
     Retrieve the result of a completed job by its ID.
     
     Note: This endpoint will only return results for jobs that have completed
-    (status SUCCESS or FAILED). For jobs that are still processing, check the
-    status endpoint first.
+    (status SUCCESS or FAILED). For jobs that are still processing, pass
+    `wait` to long-poll until the result is ready, or subscribe to
+    `/{job_id}/events`.
     """,
     responses={
         200: {"description": "Job result retrieved successfully"},
@@ -140,11 +799,16 @@ async def get_job_result(
         example=1,
         gt=0
     ),
-    db: AsyncSession = Depends(get_db)
+    wait: float = Query(
+        0,
+        ge=0,
+        le=LONG_POLL_MAX_WAIT,
+        description="Seconds to wait for the job to finish before responding"
+    ),
+    db: AsyncSession = Depends(get_read_db)
 ):
     try:
-        result = await db.execute(select(Job).filter(Job.id == job_id))
-        job = result.scalars().first()
+        job = await _wait_for_job(db, job_id, wait)
         
         if job is None:
             raise HTTPException(
@@ -152,32 +816,297 @@ async def get_job_result(
                 detail=f"Job with ID {job_id} not found"
             )
         
-        if job.status not in [JobStatus.SUCCESS, JobStatus.FAILED]:
+        if job["status"] not in TERMINAL_STATUSES:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Job with ID {job_id} is still {job.status}. Please check back later.",
+                detail=f"Job with ID {job_id} is still {job['status']}. Please check back later.",
                 headers={"Retry-After": "5"}
             )
         
-        response_data = {
-            "id": job.id,
-            "status": job.status,
-            "operation": job.operation,
-            "created_at": job.created_at,
-            "updated_at": job.updated_at
-        }
-        
-        if job.result:
-            if "error" in job.result and job.result["error"]:
-                response_data["error"] = job.result["error"]
-            if "result" in job.result:
-                response_data["result"] = job.result["result"]
-        
-        return response_data
+        return _job_result_data(job)
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to retrieve job result: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+@router.post(
+    "/{job_id}/append",
+    response_model=JobResultResponse,
+    summary="Append data to a job",
+    description="""
+    Add values to an appendable job and return its updated result.
+
+    The job's running aggregate is updated from the new values only, without
+    reprocessing earlier data. Appends to the same job are serialized by a
+    row lock, so concurrent appends are never lost. The body may be JSON
+    (`{"data": [...]}`) or any of the binary formats accepted by `POST /`.
+    """,
+    responses={
+        200: {"description": "Data appended"},
+        404: {"description": "Job not found"},
+        409: {"description": "Job is not appendable"},
+        413: {"description": "Upload exceeds the maximum number of values"},
+        422: {"description": "Validation error"},
+        500: {"description": "Internal server error"}
+    },
+    response_description="The job with its updated result",
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {
+                    "schema": {"$ref": "#/components/schemas/JobAppend"},
+                    "example": {"data": [6, 7, 8]}
+                },
+                **{
+                    content_type: body
+                    for content_type, body in _JOB_UPLOAD_BODY["requestBody"]["content"].items()
+                    if content_type != "application/json"
+                }
+            }
+        }
+    }
+)
+async def append_job_data(
+    request: Request,
+    job_id: int = Path(
+        ...,
+        description="The ID of the appendable job",
+        example=1,
+        gt=0
+    ),
+    db: AsyncSession = Depends(get_db)
+):
+    data = await _read_append_upload(request)
+
+    try:
+        # Lock the row so concurrent appends apply one after another
+        result = await db.execute(
+            select(Job.operation, Job.appendable, Job.result)
+            .filter(Job.id == job_id)
+            .with_for_update()
+        )
+        job = result.first()
+
+        if job is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Job with ID {job_id} not found"
+            )
+
+        if not job.appendable:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Job with ID {job_id} is not appendable"
+            )
+
+        partial = await asyncio.to_thread(operations.reduce_partial, job.operation, data)
+        aggregate = _aggregate_result(
+            job.operation,
+            operations.combine(job.operation, job.result["state"], partial),
+            job.result["count"] + len(data)
+        )
+        result = await db.execute(
+            update(Job)
+            .where(Job.id == job_id)
+            .values(result=aggregate)
+            .returning(*status_cache.COLUMNS)
+        )
+        updated = result.first()._asdict()
+        await db.commit()
+        await status_cache.put(updated)
+
+        return _job_result_data(updated)
+    except HTTPException:
+        await db.rollback()
+        raise
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to append to job: {str(e)}"
+        )
+
+@router.delete(
+    "/{job_id}",
+    response_model=JobResultResponse,
+    summary="Cancel a job",
+    description="""
+    Cancel a queued or running job. The job moves to CANCELLED at once and
+    no worker starts it any more; a worker already running it stops at its
+    next check, at the latest one chunk of the computation later.
+    """,
+    responses={
+        200: {"description": "Job cancelled"},
+        404: {"description": "Job not found"},
+        409: {"description": "Job has already finished"},
+        500: {"description": "Internal server error"}
+    },
+    response_description="The cancelled job"
+)
+async def cancel_job(
+    job_id: int = Path(
+        ...,
+        description="The ID of the job to cancel",
+        example=1,
+        gt=0
+    ),
+    db: AsyncSession = Depends(get_db)
+):
+    try:
+        result = await db.execute(
+            update(Job)
+            .where(Job.id == job_id, Job.status.in_(sorted(ACTIVE_STATUSES)))
+            .values(status=JobStatus.CANCELLED, result={"result": None, "error": "Cancelled by client"})
+            .returning(*status_cache.COLUMNS)
+        )
+        cancelled = result.first()
+
+        if cancelled is None:
+            job = await _select_job(db, job_id)
+            if job is None:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail=f"Job with ID {job_id} not found"
+                )
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Job with ID {job_id} has already finished with status {job.status.value}"
+            )
+
+        # A queued job is never published; the dispatcher would drop it anyway
+        await db.execute(delete(JobOutbox).where(JobOutbox.job_id == job_id))
+        await db.commit()
+        cancelled = cancelled._asdict()
+        await cancellation.request(job_id)
+        await status_cache.put(cancelled)
+        await notifications.publish_job_event(job_id, JobStatus.CANCELLED)
+
+        return _job_result_data(cancelled)
+    except HTTPException:
+        await db.rollback()
+        raise
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to cancel job: {str(e)}"
+        )
+
+@router.get(
+    "/{job_id}/timeline",
+    response_model=JobTimelineResponse,
+    summary="Get a job's phase timeline",
+    description="""
+    Where a job spent its time: the API request that created it, its wait
+    in the outbox and in the broker, and each step of the worker (result
+    cache lookup, status writes, processing delay, computation or shard
+    dispatch), ordered by start time. Shards of large jobs add their own
+    phases.
+
+    `trace_id` is the trace the job was created in; pass a `traceparent`
+    header when creating jobs to make it part of your own trace. Timelines
+    are kept for `JOB_TIMELINE_TTL` seconds.
+    """,
+    responses={
+        200: {"description": "Timeline retrieved successfully"},
+        404: {"description": "No timeline recorded for the job"},
+        500: {"description": "Internal server error"}
+    },
+    response_description="The job's phases"
+)
+async def get_job_timeline(
+    job_id: int = Path(
+        ...,
+        description="The ID of the job",
+        example=1,
+        gt=0
+    )
+):
+    try:
+        trace_id, phases = await tracing.get_timeline(job_id)
+
+        if not phases:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"No timeline recorded for job with ID {job_id}"
+            )
+
+        return {"id": job_id, "trace_id": trace_id, "phases": phases}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to retrieve job timeline: {str(e)}"
+        )
+
+@router.get(
+    "/{job_id}/events",
+    summary="Stream job status events",
+    description="""
+    Server-Sent Events stream of a job's status. An event named `status` is
+    sent with the current state immediately and again on every transition.
+    The final event carries the result or error, after which the stream
+    closes.
+    """,
+    responses={
+        200: {"description": "Event stream", "content": {"text/event-stream": {}}},
+        404: {"description": "Job not found"}
+    },
+    response_class=StreamingResponse
+)
+async def stream_job_events(
+    job_id: int = Path(
+        ...,
+        description="The ID of the job to follow",
+        example=1,
+        gt=0
+    ),
+    db: AsyncSession = Depends(get_read_db)
+):
+    if await _load_job(db, job_id) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Job with ID {job_id} not found"
+        )
+
+    async def event_stream():
+        last_status = None
+        async for job in _job_updates(db, job_id):
+            if job is None:
+                return
+            if job["status"] == last_status:
+                # Comment line keeps proxies from closing an idle stream
+                yield ": keepalive\n\n"
+                continue
+            last_status = job["status"]
+            yield f"event: status\ndata: {json.dumps(_job_event_data(job))}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.websocket("/{job_id}/ws")
+async def job_events_websocket(
+    websocket: WebSocket,
+    job_id: int,
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Send the job's state as JSON on connect and on every transition,
+    then close once the job is terminal."""
+    await websocket.accept()
+    last_status = None
+    async for job in _job_updates(db, job_id):
+        if job is None:
+            await websocket.close(code=4404, reason=f"Job with ID {job_id} not found")
+            return
+        if job["status"] != last_status:
+            last_status = job["status"]
+            await websocket.send_json(_job_event_data(job))
+    await websocket.close()
@@ -0,0 +1,334 @@
+"""Queue-driven autoscaling of worker concurrency.
+
+``QueueAutoscaler`` replaces Celery's default autoscaler, which only
+compares reserved tasks with the pool size. Once a second it samples the
+worker's queues and asks ``ScalingPolicy`` how many jobs should run at
+once:
+
+- the backlog (messages waiting in the broker plus tasks prefetched but
+  not started) should drain within ``AUTOSCALE_TARGET_WAIT`` seconds at the
+  observed per-task execution time, so the demand is the running tasks plus
+  ``backlog * exec_time / target_wait``;
+- when the oldest waiting message is already older than the target wait,
+  the worker is falling behind and grows by at least half again;
+- growing takes effect at once, but shrinking waits until the demand has
+  stayed more than ``AUTOSCALE_TOLERANCE`` below the current concurrency
+  for ``AUTOSCALE_KEEPALIVE`` seconds, so a bursty queue does not flap.
+
+Enable it with ``--autoscale=MAX,MIN`` (``worker_autoscaler`` in
+``app.celery_config`` selects this class). A prefork pool is grown and
+shrunk in place. Celery's threads pool cannot be resized, so it is created
+with MAX threads and concurrency is applied to the job loop's in-flight
+limit instead (``app.worker_loop.set_max_in_flight``).
+
+Recent decisions are kept with the signals they were based on and are
+returned by ``celery inspect stats`` under ``autoscaler``; the current and
+desired concurrency are also exported as Prometheus gauges.
+"""
+import json
+import logging
+import math
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from time import monotonic, sleep, time
+from typing import Any, Dict, List, Optional, Tuple
+
+from celery.signals import task_postrun, task_prerun
+from celery.worker import state
+from celery.worker.autoscale import AUTOSCALE_KEEPALIVE, Autoscaler
+
+from . import metrics, worker_loop
+
+logger = logging.getLogger(__name__)
+
+# Longest a queued job should wait before starting, in seconds
+TARGET_WAIT = float(os.getenv("AUTOSCALE_TARGET_WAIT", "5"))
+
+# Shrink only when demand is this fraction below the current concurrency
+TOLERANCE = float(os.getenv("AUTOSCALE_TOLERANCE", "0.2"))
+
+# Seconds between samples of the queues
+INTERVAL = float(os.getenv("AUTOSCALE_INTERVAL", "1"))
+
+# Decisions kept for inspection
+HISTORY = int(os.getenv("AUTOSCALE_HISTORY", "50"))
+
+# Weight of the newest task in the execution time average
+_EXEC_TIME_ALPHA = 0.2
+
+
+@dataclass(frozen=True)
+class QueueSignals:
+    """What the autoscaler knows about the queues at one instant."""
+
+    # Messages waiting: in the broker plus prefetched by this worker
+    backlog: int
+    # Tasks executing in this worker
+    running: int
+    # Seconds the oldest waiting message has been queued; None if unknown
+    oldest_age: Optional[float] = None
+    # Average task execution time in seconds; None until tasks have run
+    exec_time: Optional[float] = None
+
+
+@dataclass(frozen=True)
+class Decision:
+    at: float
+    action: str
+    reason: str
+    current: int
+    desired: int
+    demand: int
+    signals: QueueSignals
+
+    def as_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class ScalingPolicy:
+    """Computes the concurrency a worker should run at from queue signals.
+
+    Holds only the hysteresis state, so it can be driven by a simulated
+    queue in tests as well as by ``QueueAutoscaler``.
+    """
+
+    def __init__(
+        self,
+        min_concurrency: int,
+        max_concurrency: int,
+        target_wait: float = TARGET_WAIT,
+        tolerance: float = TOLERANCE,
+        scale_down_delay: float = AUTOSCALE_KEEPALIVE,
+    ):
+        self.min_concurrency = max(min_concurrency, 1)
+        self.max_concurrency = max(max_concurrency, self.min_concurrency)
+        self.target_wait = target_wait
+        self.tolerance = tolerance
+        self.scale_down_delay = scale_down_delay
+        # When demand first dropped below the shrink threshold
+        self._low_since: Optional[float] = None
+
+    def demand(self, current: int, signals: QueueSignals) -> Tuple[int, str]:
+        """Concurrency needed for the backlog, and why."""
+        demand, reason = signals.running, "running tasks"
+        if signals.backlog and signals.exec_time is not None:
+            drain = math.ceil(signals.backlog * signals.exec_time / self.target_wait)
+            demand, reason = signals.running + drain, "backlog drains within target wait"
+        elif signals.backlog:
+            # No execution time yet: give every waiting message a slot
+            demand, reason = signals.running + signals.backlog, "backlog, execution time unknown"
+        if signals.backlog and signals.oldest_age is not None and signals.oldest_age > self.target_wait:
+            behind = current + max(1, current // 2)
+            if behind > demand:
+                demand, reason = behind, "oldest message older than target wait"
+        return demand, reason
+
+    def decide(self, current: int, signals: QueueSignals, now: float) -> Decision:
+        demand, reason = self.demand(current, signals)
+        desired = min(max(demand, self.min_concurrency), self.max_concurrency)
+        if desired != demand:
+            reason = f"{reason}; clamped to bounds"
+        action = "hold"
+
+        # An empty queue may shrink all the way to the minimum; otherwise
+        # small dips in demand within the tolerance are ignored
+        idle = signals.backlog == 0
+        if desired > current:
+            action = "grow"
+            self._low_since = None
+        elif desired < current and (idle or desired < current * (1 - self.tolerance)):
+            if self._low_since is None:
+                self._low_since = now
+            if now - self._low_since >= self.scale_down_delay:
+                action = "shrink"
+                self._low_since = None
+            else:
+                reason = f"{reason}; shrink pending"
+                desired = current
+        else:
+            # Within tolerance of the current concurrency
+            self._low_since = None
+            desired = current
+        return Decision(
+            at=time(), action=action, reason=reason, current=current,
+            desired=desired, demand=demand, signals=signals,
+        )
+
+
+# Execution time average of tasks run in this process
+_exec_time: Optional[float] = None
+_exec_lock = threading.Lock()
+
+
+@task_prerun.connect
+def _task_started(task=None, **kwargs):
+    task.request.autoscale_started_at = monotonic()
+
+
+@task_postrun.connect
+def _task_finished(task=None, **kwargs):
+    global _exec_time
+    started = getattr(task.request, "autoscale_started_at", None)
+    if started is None:
+        return
+    elapsed = monotonic() - started
+    with _exec_lock:
+        _exec_time = elapsed if _exec_time is None else (
+            _EXEC_TIME_ALPHA * elapsed + (1 - _EXEC_TIME_ALPHA) * _exec_time
+        )
+
+
+def _published_at(message: Any) -> Optional[float]:
+    # Stamped by app.metrics when the task is published
+    headers = message.get("headers") if isinstance(message, dict) else None
+    return (headers or {}).get("published_at")
+
+
+class QueueAutoscaler(Autoscaler):
+    """Celery autoscaler driven by ``ScalingPolicy``."""
+
+    def __init__(self, pool, max_concurrency, min_concurrency=0, worker=None,
+                 keepalive=AUTOSCALE_KEEPALIVE, mutex=None):
+        super().__init__(pool, max_concurrency, min_concurrency, worker=worker,
+                         keepalive=keepalive, mutex=mutex)
+        self.policy = ScalingPolicy(min_concurrency, max_concurrency, scale_down_delay=keepalive)
+        # The worker's event loop calls maybe_scale every ``keepalive`` seconds;
+        # sample on our interval and keep the keepalive as the shrink delay
+        self.keepalive = INTERVAL
+        self.decisions: deque = deque(maxlen=HISTORY)
+        self._next_sample = 0.0
+        # Prefork pools resize; the threads pool only has its executor
+        self._resizable = hasattr(pool, "grow")
+        if self._resizable:
+            self.concurrency = pool.num_processes
+        else:
+            # Not started yet, so no threads exist; run MAX threads and
+            # let the job loop's in-flight limit set the concurrency
+            pool.executor.shutdown(wait=False)
+            pool.executor = ThreadPoolExecutor(max_workers=max_concurrency)
+            pool.limit = max_concurrency
+            self.concurrency = self.policy.min_concurrency
+            worker_loop.set_max_in_flight(self.concurrency)
+        metrics.WORKER_CONCURRENCY.set(self.concurrency)
+
+    def body(self):
+        with self.mutex:
+            self.maybe_scale()
+        sleep(INTERVAL)
+
+    @property
+    def processes(self):
+        return self.concurrency
+
+    def _queues(self) -> List[str]:
+        return [queue.name for queue in self.worker.app.amqp.queues.consume_from.values()]
+
+    def _broker_backlog(self) -> (int, Optional[float]):
+        depth, oldest = 0, None
+        with self.worker.app.pool.acquire(block=True) as conn:
+            channel = conn.default_channel
+            for queue in self._queues():
+                depth += channel.queue_declare(queue=queue, passive=True).message_count
+                client = getattr(channel, "client", None)
+                if client is not None:
+                    # Redis lists are consumed from the right, so the oldest message is last
+                    raw = client.lindex(queue, -1)
+                    published = _published_at(json.loads(raw)) if raw else None
+                    if published is not None:
+                        oldest = published if oldest is None else min(oldest, published)
+        return depth, oldest
+
+    def sample(self) -> QueueSignals:
+        """Read the queues, this worker's requests and the execution time average."""
+        depth, oldest = self._broker_backlog()
+        active = list(state.active_requests)
+        waiting = [req for req in state.reserved_requests if req not in active]
+        for req in waiting:
+            published = _published_at({"headers": req.request_dict})
+            if published is not None:
+                oldest = published if oldest is None else min(oldest, published)
+
+        exec_time = _exec_time
+        if exec_time is None:
+            # With prefork the tasks run in children; use how long running ones have taken
+            started = [req.time_start for req in active if req.time_start]
+            if started:
+                exec_time = sum(time() - t for t in started) / len(started)
+        # With the threads pool, accepted tasks beyond the in-flight limit are still waiting
+        running = min(len(active), self.concurrency)
+        return QueueSignals(
+            backlog=depth + len(waiting) + len(active) - running,
+            running=running,
+            oldest_age=None if oldest is None else max(time() - oldest, 0.0),
+            exec_time=exec_time,
+        )
+
+    def _maybe_scale(self, req=None):
+        # Also called for every received message; sample at most once per interval
+        if monotonic() < self._next_sample:
+            return False
+        self._next_sample = monotonic() + INTERVAL
+        try:
+            signals = self.sample()
+        except Exception as e:
+            logger.warning("Autoscaler could not sample queues: %s", e)
+            return False
+
+        decision = self.policy.decide(self.concurrency, signals, monotonic())
+        metrics.WORKER_DESIRED_CONCURRENCY.set(decision.desired)
+        metrics.AUTOSCALE_DECISIONS.labels(action=decision.action).inc()
+        if decision.action == "hold":
+            if not self.decisions or self.decisions[-1].action != "hold":
+                self.decisions.append(decision)
+            return False
+
+        self.decisions.append(decision)
+        logger.info(
+            "Autoscaler: %s %d -> %d (%s; backlog=%d running=%d oldest_age=%s exec_time=%s)",
+            decision.action, decision.current, decision.desired, decision.reason,
+            signals.backlog, signals.running, signals.oldest_age, signals.exec_time,
+        )
+        self._resize(decision.desired)
+        return True
+
+    def maybe_scale(self, req=None):
+        # Resizing is done in _resize; nothing for maintain_pool to do with threads
+        if self._maybe_scale(req) and self._resizable:
+            self.pool.maintain_pool()
+
+    def _resize(self, n: int) -> None:
+        diff = n - self.concurrency
+        if self._resizable:
+            if diff > 0:
+                self._grow(diff)
+            elif diff < 0:
+                self._shrink(-diff)
+        else:
+            worker_loop.set_max_in_flight(n)
+        self.concurrency = n
+        metrics.WORKER_CONCURRENCY.set(n)
+
+    def update(self, max=None, min=None):
+        # Remote control (``celery control autoscale``) moves the policy's bounds
+        with self.mutex:
+            if max is not None:
+                self.max_concurrency = self.policy.max_concurrency = max
+            if min is not None:
+                self.min_concurrency = self.policy.min_concurrency = min
+            bounded = sorted((self.policy.min_concurrency, self.concurrency, self.policy.max_concurrency))[1]
+            if bounded != self.concurrency:
+                self._resize(bounded)
+            return self.max_concurrency, self.min_concurrency
+
+    def info(self):
+        info = super().info()
+        info.update({
+            "target_wait": self.policy.target_wait,
+            "tolerance": self.policy.tolerance,
+            "scale_down_delay": self.policy.scale_down_delay,
+            "decisions": [decision.as_dict() for decision in self.decisions],
+        })
+        return info
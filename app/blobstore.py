@@ -0,0 +1,133 @@
+"""Out-of-band storage for large job inputs.
+
+Inputs above ``BLOB_INLINE_MAX_ELEMENTS`` are written once as packed
+little-endian float64 and referred to by a handle string. ``Job.input_data``
+and the Celery message carry only the handle; workers map the array
+straight from storage without copying or JSON decoding it.
+
+The backend is chosen by the scheme of ``BLOB_STORE_URL``. Backends
+implement ``BlobStore`` and are registered with ``register_backend``. The
+built-in ``file`` backend stores one file per blob under a local or shared
+directory and reads it back with ``np.memmap``.
+"""
+import os
+import tempfile
+import uuid
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Optional
+from urllib.parse import urlparse
+
+import numpy as np
+
+BLOB_STORE_URL = os.getenv(
+    "BLOB_STORE_URL", "file://" + os.path.join(tempfile.gettempdir(), "job-blobs")
+)
+
+# Inputs with more elements than this are stored out of band
+BLOB_INLINE_MAX_ELEMENTS = int(os.getenv("BLOB_INLINE_MAX_ELEMENTS", "10000"))
+
+DTYPE = np.dtype("<f8")
+
+
+class BlobStore(ABC):
+    """Stores float64 arrays and returns handles of the form ``<scheme>:<key>``."""
+
+    scheme: str
+
+    @abstractmethod
+    def put(self, values: np.ndarray) -> str:
+        """Store ``values`` and return a handle for them."""
+
+    @abstractmethod
+    def open(self, handle: str) -> np.ndarray:
+        """Return a read-only float64 array for ``handle``."""
+
+    @abstractmethod
+    def delete(self, handle: str) -> None:
+        """Remove the blob; missing blobs are ignored."""
+
+    def _key(self, handle: str) -> str:
+        scheme, _, key = handle.partition(":")
+        if scheme != self.scheme or not key:
+            raise ValueError(f"Invalid blob handle for {self.scheme} store: {handle}")
+        return key
+
+
+class LocalBlobStore(BlobStore):
+    """One raw float64 file per blob under ``root``."""
+
+    scheme = "file"
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        if os.path.basename(key) != key:
+            raise ValueError(f"Invalid blob key: {key}")
+        # Two-character fan-out keeps directories small
+        return os.path.join(self.root, key[:2], key)
+
+    def put(self, values: np.ndarray) -> str:
+        key = uuid.uuid4().hex + ".f64"
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary name first so readers never see a partial file
+        tmp_path = f"{path}.tmp"
+        np.ascontiguousarray(values, dtype=DTYPE).tofile(tmp_path)
+        os.replace(tmp_path, path)
+        return f"{self.scheme}:{key}"
+
+    def open(self, handle: str) -> np.ndarray:
+        path = self._path(self._key(handle))
+        if os.path.getsize(path) == 0:
+            # mmap cannot map an empty file
+            return np.empty(0, dtype=DTYPE)
+        return np.memmap(path, dtype=DTYPE, mode="r")
+
+    def delete(self, handle: str) -> None:
+        try:
+            os.remove(self._path(self._key(handle)))
+        except FileNotFoundError:
+            pass
+
+
+_BACKENDS: Dict[str, Callable[[str], BlobStore]] = {}
+
+
+def register_backend(scheme: str, factory: Callable[[str], BlobStore]) -> None:
+    """Register ``factory(url)`` as the backend for ``scheme://`` URLs."""
+    _BACKENDS[scheme] = factory
+
+
+register_backend("file", lambda url: LocalBlobStore(urlparse(url).path))
+
+_store: Optional[BlobStore] = None
+
+
+def get_blob_store() -> BlobStore:
+    global _store
+    if _store is None:
+        scheme = urlparse(BLOB_STORE_URL).scheme
+        try:
+            factory = _BACKENDS[scheme]
+        except KeyError:
+            raise ValueError(f"Unsupported blob store URL: {BLOB_STORE_URL}") from None
+        _store = factory(BLOB_STORE_URL)
+    return _store
+
+
+def should_offload(size: int) -> bool:
+    return size > BLOB_INLINE_MAX_ELEMENTS
+
+
+def put(values: np.ndarray) -> str:
+    return get_blob_store().put(values)
+
+
+def open_blob(handle: str) -> np.ndarray:
+    return get_blob_store().open(handle)
+
+
+def delete(handle: str) -> None:
+    get_blob_store().delete(handle)
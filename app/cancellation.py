@@ -0,0 +1,162 @@
+"""Cooperative cancellation and deadlines of running jobs.
+
+``DELETE /{job_id}`` marks a job CANCELLED in the database and sets the
+flag ``job-cancel:{id}`` in Redis. Jobs past their deadline are marked
+EXPIRED. Neither state is reached by interrupting a worker; instead:
+
+- The dispatcher expires outbox rows past their deadline instead of
+  publishing them, and drops cancelled ones (see ``app.outbox``).
+- ``process_job`` and shard tasks check the deadline and the flag when
+  they are dequeued and drop the job without running it.
+- A running job holds a ``CancelToken``. Kernels check it between chunks
+  (see ``operations.reduce_partial``) and the simulated processing delay
+  wakes up when it is set. The ``watcher`` of each worker process polls
+  the flags of its running jobs every ``CANCEL_POLL_INTERVAL`` seconds
+  with one MGET; deadlines are checked against the clock.
+
+Worker status writes never replace CANCELLED or EXPIRED (see
+``tasks.update_job_status``), so a job that finishes regardless keeps the
+state it was stopped with.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional
+
+from . import operations
+from .db import JobStatus
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# How often a worker reads the cancel flags of the jobs it runs, in seconds
+CANCEL_POLL_INTERVAL = float(os.getenv("JOB_CANCEL_POLL_INTERVAL", "0.5"))
+
+# Seconds a cancel flag is kept; longer than any job waits in a queue
+CANCEL_FLAG_TTL = int(os.getenv("JOB_CANCEL_FLAG_TTL", str(24 * 60 * 60)))
+
+CANCEL_KEY_PREFIX = "job-cancel:"
+
+# Error recorded on jobs that expire
+EXPIRED_ERROR = "Deadline passed before the job finished"
+
+
+def deadline_timestamp(deadline: Optional[datetime]) -> Optional[float]:
+    """Epoch seconds of a ``jobs.deadline`` value, which is stored as naive UTC."""
+    if deadline is None:
+        return None
+    if deadline.tzinfo is None:
+        deadline = deadline.replace(tzinfo=timezone.utc)
+    return deadline.timestamp()
+
+
+async def request(job_id: int) -> None:
+    """Ask the worker running ``job_id``, or about to, to stop it. Never raises."""
+    try:
+        await get_redis().set(f"{CANCEL_KEY_PREFIX}{job_id}", 1, ex=CANCEL_FLAG_TTL)
+    except Exception as e:
+        # The job is CANCELLED regardless; a running worker just finishes its work
+        logger.warning("Failed to set the cancel flag of job %s: %s", job_id, e)
+
+
+async def is_requested(job_id: int) -> bool:
+    try:
+        return bool(await get_redis().exists(f"{CANCEL_KEY_PREFIX}{job_id}"))
+    except Exception as e:
+        # The state guard in update_job_status still keeps the job CANCELLED
+        logger.debug("Failed to read the cancel flag of job %s: %s", job_id, e)
+        return False
+
+
+class CancelToken:
+    """Set when a running job is cancelled or passes its deadline."""
+
+    def __init__(self, job_id: int, deadline: Optional[float] = None):
+        self.job_id = job_id
+        self.deadline = deadline
+        # Why the job stopped: CANCELLED or EXPIRED
+        self.status: Optional[JobStatus] = None
+        # Read from kernel threads between chunks
+        self._set = threading.Event()
+        self._woken = asyncio.Event()
+
+    def cancel(self) -> None:
+        """Mark the job cancelled; call on the job loop."""
+        self.status = self.status or JobStatus.CANCELLED
+        self._set.set()
+        self._woken.set()
+
+    def __call__(self) -> bool:
+        if self._set.is_set():
+            return True
+        if self.deadline is not None and time.time() >= self.deadline:
+            self.status = self.status or JobStatus.EXPIRED
+            self._set.set()
+            return True
+        return False
+
+    def check(self) -> None:
+        if self():
+            raise operations.Cancelled(f"Job {self.status.value.lower()}")
+
+    async def sleep(self, seconds: float) -> None:
+        """Sleep up to ``seconds``; raises ``Cancelled`` as soon as the job stops."""
+        if self.deadline is not None:
+            seconds = min(seconds, max(self.deadline - time.time(), 0.0))
+        try:
+            await asyncio.wait_for(self._woken.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+        self.check()
+
+
+class CancelWatcher:
+    """Polls the cancel flags of the jobs running in this process."""
+
+    def __init__(self, poll_interval: float = CANCEL_POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self._tokens: Dict[int, List[CancelToken]] = defaultdict(list)
+        self._task: Optional[asyncio.Task] = None
+
+    @contextmanager
+    def watch(self, job_id: int, deadline: Optional[float] = None) -> Iterator[CancelToken]:
+        """Token of ``job_id`` for as long as the block runs; use on the job loop."""
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.get_loop() is not loop:
+            # First use, or the job loop was replaced (e.g. after fork)
+            self._task = loop.create_task(self._run())
+        token = CancelToken(job_id, deadline)
+        self._tokens[job_id].append(token)
+        try:
+            yield token
+        finally:
+            tokens = self._tokens[job_id]
+            tokens.remove(token)
+            if not tokens:
+                del self._tokens[job_id]
+
+    async def poll(self) -> None:
+        job_ids = list(self._tokens)
+        if not job_ids:
+            return
+        flags = await get_redis().mget([f"{CANCEL_KEY_PREFIX}{job_id}" for job_id in job_ids])
+        for job_id, flag in zip(job_ids, flags):
+            if flag is not None:
+                for token in self._tokens.get(job_id, ()):
+                    token.cancel()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.poll()
+            except Exception as e:
+                logger.debug("Failed to poll cancel flags: %s", e)
+
+
+watcher = CancelWatcher()
@@ -23,22 +23,33 @@ worker_max_tasks_per_child = 100
 worker_hijack_root_logger = False
 worker_send_task_events = True
 worker_enable_remote_control = True
+# Used with --autoscale=MAX,MIN: scales on queue depth, age and execution time
+worker_autoscaler = 'app.autoscale:QueueAutoscaler'
 
 # Beat settings (for scheduled tasks)
 beat_schedule = {
-    # Example scheduled task (can be removed if not needed)
+    # Delete jobs past their retention window; frequent runs keep each one short
     'cleanup-old-jobs': {
         'task': 'app.tasks.cleanup_old_jobs',
-        'schedule': crontab(hour=0, minute=0),  # Run daily at midnight
+        'schedule': crontab(minute=0),  # Run hourly
+    },
+    # Publish PENDING jobs again if their task message was lost
+    'requeue-stale-jobs': {
+        'task': 'app.tasks.requeue_stale_jobs',
+        'schedule': 60.0,
     },
 }
 
 # Result backend settings
 result_expires = 60 * 60 * 24 * 7  # 1 week
 
-# Task routing
+# Task routing. Jobs are published to their priority lane (jobs.high,
+# jobs.normal, jobs.low) by the outbox dispatcher; 'jobs' is the fallback.
 task_routes = {
     'app.tasks.process_job': {'queue': 'jobs'},
+    'app.tasks.process_shard': {'queue': 'jobs'},
+    'app.tasks.combine_shards': {'queue': 'jobs'},
+    'app.tasks.shards_failed': {'queue': 'jobs'},
 }
 
 # Enable events for monitoring
@@ -51,6 +62,7 @@ worker_cancel_long_running_tasks_on_connection_loss = True
 # Task time limits
 task_annotations = {
     'app.tasks.process_job': {'time_limit': 300, 'soft_time_limit': 240},
+    'app.tasks.process_shard': {'time_limit': 300, 'soft_time_limit': 240},
 }
 
 # Security settings
@@ -1,7 +1,7 @@
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import declarative_base, sessionmaker
 from enum import Enum
-from sqlalchemy import Column, Integer, String, DateTime, JSON
+from sqlalchemy import BigInteger, Boolean, Column, ForeignKey, Index, Integer, String, DateTime, JSON
 from sqlalchemy.dialects.postgresql import ENUM as PgEnum
 from datetime import datetime
 from typing import AsyncGenerator
@@ -15,11 +15,59 @@ DATABASE_URL = os.getenv(
     "postgresql+asyncpg://postgres:postgres@db:5432/jobdb"
 )
 
-engine = create_async_engine(DATABASE_URL, echo=True)
+# Replica for read-only endpoints; reads use the primary when unset
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL")
+
+ENVIRONMENT = os.getenv("ENVIRONMENT", "development")
+
+# SQL statement logging; off by default outside development
+DB_ECHO = os.getenv("DB_ECHO", str(ENVIRONMENT == "development")).lower() == "true"
+
+# Connections kept open per engine, and extra ones opened under load
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+
+# Seconds to wait for a free connection before failing
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+# Connections older than this many seconds are replaced
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+# Server-side statement timeout in milliseconds; 0 disables it
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))
+
+
+def _engine_options(url: str) -> dict:
+    options = {"echo": DB_ECHO}
+    if url.startswith("sqlite"):
+        # SQLite has no server to pool connections to or time out statements on
+        return options
+    options.update(
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+    )
+    if DB_STATEMENT_TIMEOUT_MS and "+asyncpg" in url:
+        options["connect_args"] = {"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}}
+    return options
+
+
+# Writer engine: every insert, update and delete, and reads that must be current
+engine = create_async_engine(DATABASE_URL, **_engine_options(DATABASE_URL))
 async_session_maker = sessionmaker(
     engine, class_=AsyncSession, expire_on_commit=False
 )
 
+# Reader engine for GET endpoints; the writer itself without a replica
+read_engine = (
+    create_async_engine(DATABASE_READ_URL, **_engine_options(DATABASE_READ_URL))
+    if DATABASE_READ_URL else engine
+)
+read_session_maker = sessionmaker(
+    read_engine, class_=AsyncSession, expire_on_commit=False
+)
+
 Base = declarative_base()
 
 class JobStatus(str, Enum):
@@ -27,6 +75,27 @@ class JobStatus(str, Enum):
     IN_PROGRESS = "IN_PROGRESS"
     SUCCESS = "SUCCESS"
     FAILED = "FAILED"
+    CANCELLED = "CANCELLED"
+    EXPIRED = "EXPIRED"
+
+class JobPriority(str, Enum):
+    HIGH = "high"
+    NORMAL = "normal"
+    LOW = "low"
+
+# Tenant of jobs submitted without one
+DEFAULT_TENANT = "default"
+
+# States a job never leaves
+TERMINAL_STATUSES = frozenset({
+    JobStatus.SUCCESS, JobStatus.FAILED, JobStatus.CANCELLED, JobStatus.EXPIRED
+})
+
+# Terminal states set from outside the worker; its later writes must not replace them
+STOPPED_STATUSES = frozenset({JobStatus.CANCELLED, JobStatus.EXPIRED})
+
+# States of jobs that are queued or running
+ACTIVE_STATUSES = frozenset(JobStatus) - TERMINAL_STATUSES
 
 class Job(Base):
     __tablename__ = "jobs"
@@ -36,13 +105,83 @@ class Job(Base):
     operation = Column(String, nullable=False)
     input_data = Column(JSON, nullable=False)
     result = Column(JSON, nullable=True)
+    appendable = Column(Boolean, default=False, nullable=False)
+    priority = Column(String(16), default=JobPriority.NORMAL.value, nullable=False)
+    tenant = Column(String(64), default=DEFAULT_TENANT, nullable=False)
+    # Jobs not finished by then are dropped as EXPIRED
+    deadline = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+# Keyset pagination indexes for the job listing, ordered by (created_at, id).
+# Keep in sync with init.sql.
+Index("ix_jobs_created_at_id", Job.created_at, Job.id)
+Index("ix_jobs_status_created_at_id", Job.status, Job.created_at, Job.id)
+Index("ix_jobs_operation_created_at_id", Job.operation, Job.created_at, Job.id)
+# Queued and running jobs are a small slice of the table; this stays small and hot
+_active_jobs = Job.status.in_(sorted(ACTIVE_STATUSES))
+Index(
+    "ix_jobs_active_created_at_id",
+    Job.created_at,
+    Job.id,
+    postgresql_where=_active_jobs,
+    sqlite_where=_active_jobs,
+)
+
+class JobOutbox(Base):
+    """Jobs waiting to be published to the broker; see app.outbox."""
+    __tablename__ = "job_outbox"
+
+    # SQLite only autoincrements INTEGER primary keys
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    job_id = Column(Integer, ForeignKey("jobs.id", ondelete="CASCADE"), nullable=False, index=True)
+    priority = Column(String(16), default=JobPriority.NORMAL.value, nullable=False)
+    tenant = Column(String(64), default=DEFAULT_TENANT, nullable=False)
+    # Fair-queuing order within a priority lane; see app.outbox
+    vtime = Column(BigInteger, nullable=False, default=0)
+    # W3C trace context of the request that queued the job; see app.tracing
+    traceparent = Column(String(55))
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+# Dispatch order within a lane, and each tenant's last position in it
+Index("ix_job_outbox_lane", JobOutbox.priority, JobOutbox.vtime, JobOutbox.id)
+Index("ix_job_outbox_tenant", JobOutbox.priority, JobOutbox.tenant, JobOutbox.vtime)
+
 async def get_db() -> AsyncGenerator[AsyncSession, None]:
     async with async_session_maker() as session:
         yield session
 
+async def get_read_db() -> AsyncGenerator[AsyncSession, None]:
+    """Session on the read replica. It may lag the primary, so callers
+    fall back to ``get_db`` for rows they cannot find."""
+    async with read_session_maker() as session:
+        yield session
+
+def is_replica(session: AsyncSession) -> bool:
+    return read_engine is not engine and session.bind is read_engine
+
+def pool_stats() -> dict:
+    """Connection usage of the writer and reader pools."""
+    stats = {}
+    engines = {"writer": engine}
+    if read_engine is not engine:
+        engines["reader"] = read_engine
+    for role, role_engine in engines.items():
+        pool = role_engine.sync_engine.pool
+        if not hasattr(pool, "size"):
+            stats[role] = {"status": pool.status()}
+            continue
+        capacity = pool.size() + max(DB_MAX_OVERFLOW, 0)
+        stats[role] = {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "overflow": max(pool.overflow(), 0),
+            "capacity": capacity,
+            # Share of the connections the pool may open that are in use
+            "saturation": round(pool.checkedout() / capacity, 3) if capacity else None,
+        }
+    return stats
+
 async def create_tables() -> None:
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
\ No newline at end of file
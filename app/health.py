@@ -0,0 +1,220 @@
+"""Liveness and readiness of the API process.
+
+``GET /health/live`` only shows that the process serves requests; it never
+touches a dependency, so an orchestrator restarts the process only when it
+is wedged. ``GET /health/ready`` is what a load balancer should poll. It
+answers 503 while the instance should get no traffic:
+
+- PostgreSQL (each engine) or Redis does not answer a probe within
+  ``HEALTH_PROBE_TIMEOUT`` seconds. A database probe waits for a pooled
+  connection like any request, so an exhausted pool fails it too.
+- A connection pool of this process is at least
+  ``HEALTH_MAX_POOL_SATURATION`` in use. Pool usage is read on every call,
+  so the instance is taken out of rotation as soon as its pool fills up,
+  before requests queue for connections.
+- No worker answers a ping, when ``HEALTH_REQUIRE_WORKERS`` is set.
+- The oldest job waiting in the outbox or a broker lane has waited longer
+  than ``HEALTH_MAX_QUEUE_LAG`` seconds, when that is set.
+
+Workers and queue lag are shared by every instance, so by default they are
+only reported: failing readiness on them would take all instances out of
+rotation together, leaving clients with no API to fall back to.
+
+Probes run concurrently and their results are reused for
+``HEALTH_CACHE_TTL`` seconds; callers arriving while a probe runs wait for
+it rather than starting their own, so frequent polling costs at most one
+probe of each dependency per interval.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Dict, List, Optional
+
+from sqlalchemy import func, select, text
+
+from . import outbox
+from .db import JobOutbox, engine, pool_stats, read_engine
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Seconds probe results are reused
+CACHE_TTL = float(os.getenv("HEALTH_CACHE_TTL", "2"))
+
+# Seconds a dependency has to answer a probe
+PROBE_TIMEOUT = float(os.getenv("HEALTH_PROBE_TIMEOUT", "1"))
+
+# Share of a connection pool in use at which the instance is not ready
+MAX_POOL_SATURATION = float(os.getenv("HEALTH_MAX_POOL_SATURATION", "0.9"))
+
+# Seconds the oldest queued job may wait before the instance is not ready; 0 only reports it
+MAX_QUEUE_LAG = float(os.getenv("HEALTH_MAX_QUEUE_LAG", "0"))
+
+# Whether the instance is not ready while no worker answers a ping
+REQUIRE_WORKERS = os.getenv("HEALTH_REQUIRE_WORKERS", "false").lower() == "true"
+
+
+@dataclass
+class Probes:
+    """Results of one round of probes."""
+
+    checks: Dict[str, Dict[str, Any]]
+    # Seconds the oldest job has waited in the outbox and in each broker lane
+    queue_lag: Dict[str, Any]
+    checked_at: float = field(default_factory=time.time)
+
+
+async def _timed(probe: Awaitable[Any]) -> Dict[str, Any]:
+    started = time.perf_counter()
+    try:
+        detail = await asyncio.wait_for(probe, PROBE_TIMEOUT)
+    except asyncio.TimeoutError:
+        return {"ok": False, "error": f"No answer within {PROBE_TIMEOUT:g}s"}
+    except Exception as e:
+        return {"ok": False, "error": str(e) or type(e).__name__}
+    check = {"ok": True, "latency_ms": round((time.perf_counter() - started) * 1000, 1)}
+    if detail is not None:
+        check.update(detail)
+    return check
+
+
+async def _probe_database(probe_engine) -> None:
+    async with probe_engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+
+
+async def _probe_redis() -> None:
+    await get_redis().ping()
+
+
+def _ping_workers() -> Dict[str, Any]:
+    # Imported here because app.tasks imports the API's modules
+    from .tasks import celery_app
+
+    # Stop at the first reply instead of collecting replies for the whole timeout
+    replies = celery_app.control.ping(timeout=PROBE_TIMEOUT, limit=1)
+    if not replies:
+        raise RuntimeError("No worker answered")
+    return {"answered_by": next(iter(replies[0]))}
+
+
+async def _probe_workers() -> Dict[str, Any]:
+    # The broadcast is a blocking call
+    return await asyncio.to_thread(_ping_workers)
+
+
+async def _outbox_lag(now: datetime) -> Optional[float]:
+    async with engine.connect() as conn:
+        oldest = (await conn.execute(select(func.min(JobOutbox.created_at)))).scalar()
+    if oldest is None:
+        return 0.0
+    # created_at is naive UTC on the model, aware on PostgreSQL
+    if oldest.tzinfo is not None:
+        oldest = oldest.astimezone(timezone.utc).replace(tzinfo=None)
+    return round(max((now - oldest).total_seconds(), 0.0), 3)
+
+
+async def _broker_lag(now: float) -> Dict[str, Optional[float]]:
+    """Wait of the oldest message of each lane, from its ``published_at`` header.
+
+    Only Redis brokers are inspected, where the oldest message of a queue
+    is the last element of its list.
+    """
+    async with get_redis().pipeline(transaction=False) as pipe:
+        for priority in outbox.LANE_WEIGHTS:
+            pipe.lindex(outbox.lane_queue(priority), -1)
+        messages = await pipe.execute()
+    lag = {}
+    for priority, message in zip(outbox.LANE_WEIGHTS, messages):
+        if message is None:
+            lag[priority.value] = 0.0
+            continue
+        published_at = json.loads(message).get("headers", {}).get("published_at")
+        lag[priority.value] = None if published_at is None else round(max(now - published_at, 0.0), 3)
+    return lag
+
+
+async def _lag(probe: Awaitable[Any]) -> Any:
+    try:
+        return await asyncio.wait_for(probe, PROBE_TIMEOUT)
+    except Exception as e:
+        logger.debug("Failed to read the queue lag: %s", e)
+        return None
+
+
+async def _queue_lag() -> Dict[str, Any]:
+    outbox_lag, broker_lag = await asyncio.gather(
+        _lag(_outbox_lag(datetime.utcnow())), _lag(_broker_lag(time.time()))
+    )
+    return {"outbox_seconds": outbox_lag, "broker_seconds": broker_lag}
+
+
+class HealthMonitor:
+    """Probes the API's dependencies, reusing results for ``ttl`` seconds."""
+
+    def __init__(self, ttl: float = CACHE_TTL):
+        self.ttl = ttl
+        self._probes: Optional[Probes] = None
+        self._probing: Optional[asyncio.Task] = None
+
+    async def probe(self) -> Probes:
+        names = ["database", "redis", "workers"]
+        probes = [_timed(_probe_database(engine)), _timed(_probe_redis()), _timed(_probe_workers())]
+        if read_engine is not engine:
+            names.append("database_replica")
+            probes.append(_timed(_probe_database(read_engine)))
+        *results, queue_lag = await asyncio.gather(*probes, _queue_lag())
+        return Probes(checks=dict(zip(names, results)), queue_lag=queue_lag)
+
+    async def current(self) -> Probes:
+        """The latest probe results, probing again once they are ``ttl`` old."""
+        probes = self._probes
+        if probes is not None and time.time() - probes.checked_at < self.ttl:
+            return probes
+        loop = asyncio.get_running_loop()
+        if self._probing is None or self._probing.done() or self._probing.get_loop() is not loop:
+            self._probing = loop.create_task(self.probe())
+        # Shielded so a caller that disconnects does not cancel the probe for the others
+        self._probes = await asyncio.shield(self._probing)
+        return self._probes
+
+    async def readiness(self) -> Dict[str, Any]:
+        """Whether the instance should get traffic, and why not."""
+        probes = await self.current()
+        pools = pool_stats()
+        failing: List[str] = []
+
+        for name, check in probes.checks.items():
+            required = name != "workers" or REQUIRE_WORKERS
+            if required and not check["ok"]:
+                failing.append(name)
+        for role, pool in pools.items():
+            saturation = pool.get("saturation")
+            if saturation is not None and saturation >= MAX_POOL_SATURATION:
+                failing.append(f"{role}_pool_saturation")
+        if MAX_QUEUE_LAG > 0:
+            lags = [probes.queue_lag["outbox_seconds"], *(probes.queue_lag["broker_seconds"] or {}).values()]
+            if max((lag for lag in lags if lag is not None), default=0.0) > MAX_QUEUE_LAG:
+                failing.append("queue_lag")
+
+        return {
+            "status": "not_ready" if failing else "ready",
+            "failing": failing,
+            "checked_at": datetime.fromtimestamp(probes.checked_at, timezone.utc).isoformat(),
+            "checks": probes.checks,
+            # Connections in use per engine; saturation near 1 means requests queue for one
+            "database_pools": pools,
+            "queue_lag": probes.queue_lag,
+            "thresholds": {
+                "max_pool_saturation": MAX_POOL_SATURATION,
+                "max_queue_lag_seconds": MAX_QUEUE_LAG or None,
+                "require_workers": REQUIRE_WORKERS,
+            },
+        }
+
+
+monitor = HealthMonitor()
@@ -1,5 +1,5 @@
 import os
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Response, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.docs import get_swagger_ui_html, get_redoc_html
 from fastapi.openapi.utils import get_openapi
@@ -9,6 +9,7 @@ from contextlib import asynccontextmanager
 from typing import List, Dict, Any, Optional
 
 from .db import create_tables, get_db
+from . import admission, health, metrics, notifications, outbox, result_cache, tracing
 from .api.routes import router as job_router
 from .schemas import JobStatus, JobResponse, JobResultResponse
 
@@ -20,15 +21,25 @@ middleware = [
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
-    )
+    ),
+    # Per-route request latency for /metrics
+    Middleware(metrics.MetricsMiddleware),
+    # A span per request, continuing the caller's traceparent
+    Middleware(tracing.TracingMiddleware),
 ]
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Create database tables on startup
     await create_tables()
+    # Subscribe to job state notifications for long-poll and streaming clients
+    await notifications.hub.start()
+    # Publish committed jobs to the broker in the background
+    await outbox.dispatcher.start()
     yield
     # Clean up resources if needed
+    await outbox.dispatcher.stop()
+    await notifications.hub.stop()
 
 app = FastAPI(
     title="Async Job Processing API",
@@ -89,32 +100,115 @@ async def redoc_html():
     "/health",
     tags=["Health"],
     summary="Health Check",
-    description="Check if the API is running and healthy",
+    description="Probe the database, Redis and the workers, and report pool saturation and queue lag",
     response_description="API health status",
     responses={
         200: {"description": "API is healthy"},
-        500: {"description": "API is not healthy"}
+        503: {"description": "API is not healthy"}
     }
 )
-async def health_check():
+async def health_check(response: Response):
     """
     Health check endpoint that verifies the API is running and can connect to required services.
     
     Returns:
         dict: A dictionary containing the health status of the API and its dependencies.
     """
-    # Add additional health checks here (e.g., database, Redis)
+    readiness = await health.monitor.readiness()
+    if readiness["failing"]:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
     return {
-        "status": "healthy",
+        **readiness,
+        "status": "unhealthy" if readiness["failing"] else "healthy",
         "version": app.version,
         "environment": os.getenv("ENVIRONMENT", "development"),
         "services": {
-            "database": "connected",
-            "redis": "connected",
-            "celery": "connected"
-        }
+            name: "connected" if check["ok"] else "disconnected"
+            for name, check in readiness["checks"].items()
+        },
     }
 
+# Liveness probe
+@app.get(
+    "/health/live",
+    tags=["Health"],
+    summary="Liveness Probe",
+    description="Answers as long as the process serves requests; no dependency is checked",
+    response_description="Process is alive"
+)
+async def liveness():
+    return {"status": "alive"}
+
+# Readiness probe
+@app.get(
+    "/health/ready",
+    tags=["Health"],
+    summary="Readiness Probe",
+    description="""
+    Whether this instance should receive traffic. Answers 503 when PostgreSQL
+    or Redis fail their probe, when a connection pool of this process is
+    saturated (`HEALTH_MAX_POOL_SATURATION`), and optionally when no worker
+    answers or queued jobs wait too long. Probe results are reused for
+    `HEALTH_CACHE_TTL` seconds, so frequent polling stays cheap.
+    """,
+    responses={
+        200: {"description": "Instance is ready"},
+        503: {"description": "Instance should get no traffic; `failing` lists why"}
+    },
+    response_description="Readiness, probe results, pool saturation and queue lag"
+)
+async def readiness(response: Response):
+    result = await health.monitor.readiness()
+    if result["failing"]:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return result
+
+# Result cache statistics
+@app.get(
+    "/cache/stats",
+    tags=["Health"],
+    summary="Result Cache Statistics",
+    description="Hit/miss counters and occupancy of this process's result cache; `/metrics` has the lookups of every process",
+    response_description="Result cache counters"
+)
+async def cache_stats():
+    return result_cache.get_stats()
+
+# Dispatch lanes
+@app.get(
+    "/dispatch/lanes",
+    tags=["Health"],
+    summary="Dispatch Lane Statistics",
+    description="Jobs waiting in the outbox and the broker queue of each priority lane, and the oldest wait",
+    response_description="Depth and wait of each priority lane"
+)
+async def dispatch_lanes():
+    return await outbox.lane_stats()
+
+# Admission control
+@app.get(
+    "/admission",
+    tags=["Health"],
+    summary="Admission Control Status",
+    description="Latest backlog sample, the load it amounts to, and the priorities being shed",
+    response_description="Backlog, drain rate and shedding state"
+)
+async def admission_status():
+    return await admission.monitor.stats()
+
+# Prometheus metrics
+@app.get(
+    "/metrics",
+    tags=["Health"],
+    summary="Prometheus Metrics",
+    description="Request, task, job state and database metrics in the Prometheus text format",
+    response_description="Prometheus exposition",
+    response_class=Response,
+)
+async def prometheus_metrics():
+    body, content_type = metrics.render_latest()
+    return Response(content=body, headers={"Content-Type": content_type})
+
 # Include routers
 app.include_router(
     job_router,
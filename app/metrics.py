@@ -0,0 +1,302 @@
+"""Prometheus metrics for the API and the workers.
+
+The API serves ``/metrics`` (see ``app.main``). Workers start their own
+exporter on ``WORKER_METRICS_PORT`` when it is set. When
+``PROMETHEUS_MULTIPROC_DIR`` is set, metrics from every process (e.g.
+prefork children or several uvicorn workers) are aggregated through
+``prometheus_client.multiprocess``.
+"""
+import os
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+from celery.signals import (
+    before_task_publish,
+    task_postrun,
+    task_prerun,
+    worker_init,
+    worker_process_shutdown,
+)
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+    start_http_server,
+)
+from sqlalchemy import event
+
+from .db import JobStatus, TERMINAL_STATUSES, engine, read_engine
+
+MULTIPROCESS = "PROMETHEUS_MULTIPROC_DIR" in os.environ
+WORKER_METRICS_PORT = os.getenv("WORKER_METRICS_PORT")
+
+# Buckets spanning sub-millisecond cache hits to multi-minute jobs
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1, 2.5, 5, 10, 30, 60, 120, 300, 600,
+)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+TASK_QUEUE_WAIT_SECONDS = Histogram(
+    "celery_task_queue_wait_seconds",
+    "Time from publishing a task to a worker starting it",
+    ["task", "queue"],
+    buckets=LATENCY_BUCKETS,
+)
+TASK_EXECUTION_SECONDS = Histogram(
+    "celery_task_execution_seconds",
+    "Task execution time in the worker",
+    ["task", "state"],
+    buckets=LATENCY_BUCKETS,
+)
+JOB_STATUS_UPDATE_SECONDS = Histogram(
+    "job_status_update_seconds",
+    "Latency of the database update in update_job_status",
+    ["status"],
+    buckets=LATENCY_BUCKETS,
+)
+JOB_STATE_SECONDS = Histogram(
+    "job_state_duration_seconds",
+    "Time a job spent in a state before moving to the next one",
+    ["from_state", "to_state"],
+    buckets=LATENCY_BUCKETS,
+)
+JOB_TRANSITIONS = Counter(
+    "job_state_transitions_total",
+    "Job state transitions written by update_job_status",
+    ["to_state"],
+)
+JOB_DISPATCH_WAIT_SECONDS = Histogram(
+    "job_dispatch_wait_seconds",
+    "Time jobs waited in the outbox before being published, by priority lane",
+    ["priority"],
+    buckets=LATENCY_BUCKETS,
+)
+JOB_LANE_OUTBOX_DEPTH = Gauge(
+    "job_lane_outbox_depth",
+    "Jobs waiting in the outbox, by priority lane",
+    ["priority"],
+    multiprocess_mode="max",
+)
+JOB_LANE_BROKER_DEPTH = Gauge(
+    "job_lane_broker_depth",
+    "Messages waiting in the broker queue of each priority lane",
+    ["priority"],
+    multiprocess_mode="max",
+)
+JOB_LANE_OLDEST_WAIT_SECONDS = Gauge(
+    "job_lane_oldest_wait_seconds",
+    "Age of the oldest job waiting in the outbox, by priority lane",
+    ["priority"],
+    multiprocess_mode="max",
+)
+WORKER_CONCURRENCY = Gauge(
+    "worker_concurrency",
+    "Jobs the worker currently runs at once, as set by the autoscaler",
+    multiprocess_mode="livesum",
+)
+WORKER_DESIRED_CONCURRENCY = Gauge(
+    "worker_desired_concurrency",
+    "Concurrency the autoscaler computed from queue depth, age and execution time",
+    multiprocess_mode="livesum",
+)
+AUTOSCALE_DECISIONS = Counter(
+    "worker_autoscale_decisions_total",
+    "Autoscaler decisions by action",
+    ["action"],
+)
+ADMISSION_LOAD = Gauge(
+    "job_admission_load",
+    "Job backlog relative to the admission limits; submissions are shed near 1",
+    multiprocess_mode="max",
+)
+ADMISSION_REJECTIONS = Counter(
+    "job_admission_rejections_total",
+    "Job submissions rejected by admission control, by reason",
+    ["reason"],
+)
+RESULT_CACHE_LOOKUPS = Counter(
+    "result_cache_lookups_total",
+    "Result cache lookups by outcome (local_hit, redis_hit or miss)",
+    ["outcome"],
+)
+RESULT_CACHE_STORES = Counter(
+    "result_cache_stores_total",
+    "Results stored in the result cache",
+)
+DB_POOL_SIZE = Gauge(
+    "db_pool_size",
+    "Configured connection pool size, by engine role (writer or reader)",
+    ["role"],
+    multiprocess_mode="livesum",
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_connections_checked_out",
+    "Connections currently checked out of the pool, by engine role",
+    ["role"],
+    multiprocess_mode="livesum",
+)
+DB_POOL_CHECKOUTS = Counter(
+    "db_pool_checkouts_total",
+    "Connections checked out of the pool, by engine role",
+    ["role"],
+)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request latency per route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.labels(
+                method=scope["method"],
+                # Label by template, not raw path, to keep cardinality bounded
+                route=getattr(route, "path", "<unmatched>"),
+                status=status_code,
+            ).observe(time.perf_counter() - started)
+
+
+def render_latest() -> Tuple[bytes, str]:
+    """Return the exposition payload and content type for ``/metrics``."""
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def instrument_engine(engine, role: str = "writer") -> None:
+    """Track connection pool usage of an async engine."""
+    pool = engine.sync_engine.pool
+    if hasattr(pool, "size"):
+        DB_POOL_SIZE.labels(role=role).set(pool.size())
+    checked_out = DB_POOL_CHECKED_OUT.labels(role=role)
+    checkouts = DB_POOL_CHECKOUTS.labels(role=role)
+
+    @event.listens_for(engine.sync_engine, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        checked_out.inc()
+        checkouts.inc()
+
+    @event.listens_for(engine.sync_engine, "checkin")
+    def _on_checkin(dbapi_connection, connection_record):
+        checked_out.dec()
+
+
+instrument_engine(engine)
+if read_engine is not engine:
+    instrument_engine(read_engine, "reader")
+
+
+# Last state and entry time of jobs whose transitions this process wrote
+_MAX_TRACKED_JOBS = 10000
+_state_entered: Dict[int, Tuple[JobStatus, float]] = {}
+
+
+def _timestamp(value: Optional[datetime]) -> Optional[float]:
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        # Naive timestamps are written as UTC
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def observe_transition(job_id: int, status: JobStatus, created_at: Optional[datetime]) -> None:
+    """Record how long ``job_id`` spent in its previous state."""
+    now = time.time()
+    JOB_TRANSITIONS.labels(to_state=status.value).inc()
+
+    previous = _state_entered.get(job_id)
+    if previous is None and status != JobStatus.PENDING:
+        # First transition seen here; the job has been PENDING since creation
+        created = _timestamp(created_at)
+        previous = None if created is None else (JobStatus.PENDING, created)
+
+    if previous is not None and previous[0] != status:
+        JOB_STATE_SECONDS.labels(
+            from_state=previous[0].value, to_state=status.value
+        ).observe(max(now - previous[1], 0.0))
+    elif previous is not None:
+        # Repeated writes of the same state (e.g. progress) keep the entry time
+        now = previous[1]
+
+    if status in TERMINAL_STATUSES:
+        _state_entered.pop(job_id, None)
+        return
+    _state_entered[job_id] = (status, now)
+    if len(_state_entered) > _MAX_TRACKED_JOBS:
+        del _state_entered[next(iter(_state_entered))]
+
+
+@before_task_publish.connect
+def _stamp_publish_time(headers=None, **kwargs):
+    if headers is not None:
+        headers.setdefault("published_at", time.time())
+
+
+@task_prerun.connect
+def _task_started(task_id=None, task=None, **kwargs):
+    request = task.request
+    request.metrics_started_at = time.perf_counter()
+    published_at = getattr(request, "published_at", None)
+    if published_at is not None:
+        queue = (request.delivery_info or {}).get("routing_key") or "unknown"
+        TASK_QUEUE_WAIT_SECONDS.labels(task=task.name, queue=queue).observe(
+            max(time.time() - published_at, 0.0)
+        )
+
+
+@task_postrun.connect
+def _task_finished(task_id=None, task=None, state=None, **kwargs):
+    started = getattr(task.request, "metrics_started_at", None)
+    if started is not None:
+        TASK_EXECUTION_SECONDS.labels(task=task.name, state=state or "UNKNOWN").observe(
+            time.perf_counter() - started
+        )
+
+
+@worker_init.connect
+def _start_worker_exporter(**kwargs):
+    if WORKER_METRICS_PORT:
+        registry = CollectorRegistry() if MULTIPROCESS else REGISTRY
+        if MULTIPROCESS:
+            multiprocess.MultiProcessCollector(registry)
+        start_http_server(int(WORKER_METRICS_PORT), registry=registry)
+
+
+@worker_process_shutdown.connect
+def _mark_process_dead(pid=None, **kwargs):
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(pid or os.getpid())
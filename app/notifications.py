@@ -0,0 +1,101 @@
+"""Job state change notifications over Redis pub/sub.
+
+Workers publish every state transition on one channel. Each API process
+keeps a single subscription (``hub``) and fans events out to in-process
+waiters, so long-poll, SSE and WebSocket clients wait on an
+``asyncio.Queue`` instead of holding a database connection or a Redis
+connection of their own.
+"""
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, Set
+
+from .redis_client import create_redis, get_redis
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "job-events"
+
+
+async def publish_job_event(job_id: int, status: str) -> None:
+    """Announce that job ``job_id`` moved to ``status``. Never raises."""
+    event = {"id": job_id, "status": getattr(status, "value", status)}
+    try:
+        await get_redis().publish(CHANNEL, json.dumps(event))
+    except Exception as e:
+        logger.debug("Failed to publish event for job %s: %s", job_id, e)
+
+
+class JobEventHub:
+    """Single pub/sub subscription shared by all waiters in a process."""
+
+    def __init__(self, reconnect_delay: float = 1.0):
+        self.reconnect_delay = reconnect_delay
+        self.connected = False
+        self._waiters: Dict[int, Set[asyncio.Queue]] = defaultdict(set)
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    @contextmanager
+    def listen(self, job_id: int) -> Iterator[asyncio.Queue]:
+        """Register a queue that receives events for ``job_id``.
+
+        Register before reading the job's current state so that a transition
+        between the read and the wait is not missed.
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        self._waiters[job_id].add(queue)
+        try:
+            yield queue
+        finally:
+            waiters = self._waiters.get(job_id)
+            if waiters is not None:
+                waiters.discard(queue)
+                if not waiters:
+                    del self._waiters[job_id]
+
+    @property
+    def waiter_count(self) -> int:
+        return sum(len(waiters) for waiters in self._waiters.values())
+
+    def dispatch(self, event: Dict[str, Any]) -> None:
+        for queue in self._waiters.get(event.get("id"), ()):
+            queue.put_nowait(event)
+
+    async def _run(self) -> None:
+        while True:
+            # Pub/sub reads block until a message arrives, so no socket timeout
+            client = create_redis(socket_timeout=None)
+            try:
+                async with client.pubsub() as pubsub:
+                    await pubsub.subscribe(CHANNEL)
+                    self.connected = True
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            self.dispatch(json.loads(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.debug("Job event subscription failed: %s", e)
+            finally:
+                self.connected = False
+                await client.aclose()
+            await asyncio.sleep(self.reconnect_delay)
+
+
+hub = JobEventHub()
@@ -0,0 +1,217 @@
+"""Registry of job operations backed by NumPy kernels.
+
+Each operation is a kernel that reduces one float64 chunk to a partial
+result, plus a ``combine`` step that merges partials and a ``finalize``
+step that turns the merged partial into the job's value. Inputs are
+reduced chunk by chunk so very large arrays never need full-size
+temporaries.
+
+Adding an operation means registering one kernel::
+
+    @register_operation("abs_sum")
+    def abs_sum(chunk):
+        return float(np.abs(chunk).sum())
+
+The API's ``OperationType`` enum is built from this registry, so a newly
+registered operation is accepted by request validation automatically.
+
+Several operations can be fused into one: ``fused_name(["count", "mean",
+"max"])`` gives ``"count+mean+max"``, which every function here accepts
+like a registered name. Its kernel runs each part's kernel on a chunk
+before moving to the next chunk, so the input is read once however many
+aggregates are requested, and it finalizes to a map of part name to value.
+
+Reductions take an optional ``cancelled`` callable, checked between
+chunks; once it returns true the reduction stops with ``Cancelled``.
+"""
+import functools
+import operator
+import os
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Union
+
+import numpy as np
+
+# Number of elements reduced per chunk
+CHUNK_SIZE = int(os.getenv("COMPUTE_CHUNK_SIZE", str(1 << 20)))
+
+# Joins the parts of a fused operation name
+FUSED_SEPARATOR = "+"
+
+
+class Cancelled(Exception):
+    """A reduction was stopped because its ``cancelled`` check returned true."""
+
+
+@dataclass(frozen=True)
+class Operation:
+    name: str
+    kernel: Callable[[np.ndarray], Any]
+    combine: Callable[[Any, Any], Any] = operator.add
+    finalize: Callable[[Any], Any] = float
+
+
+OPERATIONS: Dict[str, Operation] = {}
+
+
+def register_operation(
+    name: str,
+    combine: Callable[[Any, Any], Any] = operator.add,
+    finalize: Callable[[Any], Any] = float,
+):
+    """Register ``kernel`` as the chunk kernel for operation ``name``."""
+    def decorator(kernel: Callable[[np.ndarray], Any]):
+        if name in OPERATIONS:
+            raise ValueError(f"Operation already registered: {name}")
+        OPERATIONS[name] = Operation(name, kernel, combine, finalize)
+        return kernel
+    return decorator
+
+
+def get_operation(name: str) -> Operation:
+    # Accept OperationType members as well as plain strings
+    name = getattr(name, "value", name)
+    if FUSED_SEPARATOR in name:
+        return _fused_operation(name)
+    try:
+        return OPERATIONS[name]
+    except KeyError:
+        raise ValueError(f"Unsupported operation: {name}") from None
+
+
+def fused_name(operations: Union[str, Iterable[str]]) -> str:
+    """Name of the operation computing all of ``operations`` in one pass.
+
+    Duplicates are dropped; a single operation keeps its own name.
+    """
+    if isinstance(operations, str):
+        return getattr(operations, "value", operations)
+    names = list(dict.fromkeys(getattr(op, "value", op) for op in operations))
+    if not names:
+        raise ValueError("At least one operation is required")
+    for name in names:
+        get_operation(name)
+    return FUSED_SEPARATOR.join(names)
+
+
+@functools.lru_cache(maxsize=256)
+def _fused_operation(name: str) -> Operation:
+    parts = [get_operation(part) for part in name.split(FUSED_SEPARATOR)]
+    if len({op.name for op in parts}) != len(parts) or any(FUSED_SEPARATOR in op.name for op in parts):
+        raise ValueError(f"Unsupported operation: {name}")
+
+    def kernel(chunk: np.ndarray) -> List[Any]:
+        return [op.kernel(chunk) for op in parts]
+
+    def combine(left: Sequence[Any], right: Sequence[Any]) -> List[Any]:
+        return [op.combine(a, b) for op, a, b in zip(parts, left, right)]
+
+    def finalize(partial: Sequence[Any]) -> Dict[str, Any]:
+        return {op.name: op.finalize(p) for op, p in zip(parts, partial)}
+
+    return Operation(name, kernel, combine, finalize)
+
+
+def as_array(data: Union[Sequence[float], np.ndarray]) -> np.ndarray:
+    return np.asarray(data, dtype=np.float64)
+
+
+def reduce_partial(
+    name: str,
+    data: Union[Sequence[float], np.ndarray],
+    chunk_size: int = CHUNK_SIZE,
+    cancelled: Optional[Callable[[], bool]] = None,
+) -> Any:
+    """Reduce ``data`` to an unfinalized partial result for operation ``name``.
+
+    Partials from disjoint slices of the input can be merged with ``merge``.
+    """
+    op = get_operation(name)
+    values = as_array(data)
+
+    partial = None
+    # An empty input still runs the kernel once so it yields the identity
+    for start in range(0, max(len(values), 1), chunk_size):
+        if cancelled is not None and cancelled():
+            raise Cancelled(f"Stopped after {start} of {len(values)} values")
+        chunk_partial = op.kernel(values[start:start + chunk_size])
+        partial = chunk_partial if partial is None else op.combine(partial, chunk_partial)
+    return partial
+
+
+def merge(name: str, partials: Sequence[Any]) -> Any:
+    """Combine partials from ``reduce_partial`` and finalize the result."""
+    op = get_operation(name)
+    return op.finalize(functools.reduce(op.combine, partials))
+
+
+def combine(name: str, left: Any, right: Any) -> Any:
+    """Combine two partials of operation ``name``."""
+    return get_operation(name).combine(left, right)
+
+
+def finalize(name: str, partial: Any) -> Any:
+    return get_operation(name).finalize(partial)
+
+
+def compute(
+    name: str,
+    data: Union[Sequence[float], np.ndarray],
+    chunk_size: int = CHUNK_SIZE,
+    cancelled: Optional[Callable[[], bool]] = None,
+) -> Any:
+    """Run operation ``name`` over ``data`` with a chunked reduction."""
+    return get_operation(name).finalize(reduce_partial(name, data, chunk_size, cancelled))
+
+
+@register_operation("square_sum")
+def square_sum(chunk: np.ndarray) -> float:
+    return float(np.dot(chunk, chunk))
+
+
+@register_operation("cube_sum")
+def cube_sum(chunk: np.ndarray) -> float:
+    return float(np.dot(chunk * chunk, chunk))
+
+
+def _add_pairs(left: Sequence[float], right: Sequence[float]) -> List[float]:
+    # Partials travel as JSON, so pairs may come back as lists
+    return [left[0] + right[0], left[1] + right[1]]
+
+
+def _optional(combine: Callable[[float, float], float]) -> Callable[[Any, Any], Any]:
+    # Empty chunks reduce to None, which every value replaces
+    def combine_optional(left, right):
+        if left is None or right is None:
+            return right if left is None else left
+        return combine(left, right)
+    return combine_optional
+
+
+def _optional_float(value: Any) -> Any:
+    return None if value is None else float(value)
+
+
+@register_operation("count", finalize=int)
+def count(chunk: np.ndarray) -> int:
+    return int(chunk.size)
+
+
+@register_operation("sum")
+def sum_(chunk: np.ndarray) -> float:
+    return float(chunk.sum())
+
+
+@register_operation("mean", combine=_add_pairs, finalize=lambda p: p[0] / p[1] if p[1] else None)
+def mean(chunk: np.ndarray) -> List[float]:
+    return [float(chunk.sum()), int(chunk.size)]
+
+
+@register_operation("min", combine=_optional(min), finalize=_optional_float)
+def min_(chunk: np.ndarray) -> Any:
+    return float(chunk.min()) if chunk.size else None
+
+
+@register_operation("max", combine=_optional(max), finalize=_optional_float)
+def max_(chunk: np.ndarray) -> Any:
+    return float(chunk.max()) if chunk.size else None
@@ -0,0 +1,420 @@
+"""Transactional outbox for job dispatch.
+
+Job creation inserts a ``job_outbox`` row in the same transaction as the
+job, so a committed job is always eventually published and the request
+never waits on the broker. Each API process runs a ``dispatcher`` that
+drains the outbox in batches: it locks rows with SKIP LOCKED (so several
+processes can drain concurrently), publishes their tasks over one
+producer, and deletes the rows in the same transaction. Publishing is
+at-least-once; a crash between publish and commit re-publishes the batch.
+
+Jobs are dispatched through priority lanes, one broker queue per
+``JobPriority`` (``jobs.high``, ``jobs.normal``, ``jobs.low``):
+
+- Each batch is split between lanes by ``DISPATCH_LANE_WEIGHTS``, and a
+  lane is only fed while its broker queue holds fewer than
+  ``DISPATCH_MAX_QUEUED_PER_LANE`` messages. The share of a lane with
+  less work goes to the lanes that have more, by the same weights. Backlogs therefore wait in
+  the outbox, where the dispatcher chooses what runs next, instead of in a
+  FIFO broker queue.
+- Within a lane, tenants are served by start-time fair queuing. Each row
+  gets a virtual time one past the later of its tenant's last row and the
+  lane's head, and rows are dispatched in virtual time order. A tenant
+  that queues a large backlog only gets its turn in round-robin with the
+  others, and a tenant that was idle starts at the head of the lane.
+
+Each row keeps the ``traceparent`` of the request that queued it. The
+dispatcher records the row's wait as an ``outbox.wait`` span of that trace
+and publishes the task with the span's ``traceparent`` header (see
+``app.tracing``).
+
+Jobs whose deadline has passed by the time their row is drained are
+marked EXPIRED instead of being published, and cancelled jobs are dropped.
+
+``requeue_stale_jobs`` (run periodically by beat) puts jobs that have been
+PENDING for longer than ``OUTBOX_STALE_PENDING_SECONDS`` back into the
+outbox, covering messages lost by the broker.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from celery import group
+from sqlalchemy import delete, exists, func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import cancellation, metrics, notifications, status_cache, tracing
+from .db import Job, JobOutbox, JobPriority, JobStatus, async_session_maker
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Outbox rows published per batch
+BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "500"))
+
+# How often the dispatcher polls for rows written by other processes, in seconds
+POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "1"))
+
+# How soon the dispatcher retries while a lane's broker queue is full, in seconds
+THROTTLE_INTERVAL = float(os.getenv("DISPATCH_THROTTLE_INTERVAL", "0.05"))
+
+# PENDING jobs untouched for this long are published again
+STALE_PENDING_SECONDS = float(os.getenv("OUTBOX_STALE_PENDING_SECONDS", str(15 * 60)))
+
+# Messages allowed in each lane's broker queue before dispatch to it pauses
+MAX_QUEUED_PER_LANE = int(os.getenv("DISPATCH_MAX_QUEUED_PER_LANE", "200"))
+
+# How often lane depth metrics are refreshed, in seconds
+LANE_STATS_INTERVAL = float(os.getenv("DISPATCH_LANE_STATS_INTERVAL", "5"))
+
+
+def _parse_weights(value: str) -> Dict[JobPriority, int]:
+    weights = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        weights[JobPriority(name.strip())] = int(weight)
+    return weights
+
+
+# Share of each batch given to each lane, e.g. "high=6,normal=3,low=1"
+LANE_WEIGHTS = _parse_weights(os.getenv("DISPATCH_LANE_WEIGHTS", "high=6,normal=3,low=1"))
+
+
+def _waited(queued_at: Optional[datetime], now: float) -> Optional[float]:
+    """Seconds from ``queued_at`` to ``now``; naive UTC on the model, aware on PostgreSQL."""
+    if queued_at is None:
+        return None
+    return max(now - cancellation.deadline_timestamp(queued_at), 0.0)
+
+
+def lane_queue(priority: str) -> str:
+    """Broker queue of the lane for ``priority``."""
+    return f"jobs.{getattr(priority, 'value', priority)}"
+
+
+async def _virtual_start(session: AsyncSession, priority: str, tenant: str) -> int:
+    tenant_last = (
+        select(func.max(JobOutbox.vtime))
+        .where(JobOutbox.priority == priority, JobOutbox.tenant == tenant)
+        .scalar_subquery()
+    )
+    lane_head = (
+        select(func.min(JobOutbox.vtime))
+        .where(JobOutbox.priority == priority)
+        .scalar_subquery()
+    )
+    last, head = (await session.execute(select(tenant_last, lane_head))).one()
+    return max(last or 0, head or 0)
+
+
+async def add(session: AsyncSession, jobs: Iterable[Tuple[int, str, str]]) -> None:
+    """Queue ``(job_id, priority, tenant)`` entries in the caller's transaction.
+
+    The rows carry the current trace, which the job's task continues.
+    """
+    by_tenant: Dict[Tuple[str, str], List[int]] = defaultdict(list)
+    for job_id, priority, tenant in jobs:
+        by_tenant[(priority, tenant)].append(job_id)
+
+    traceparent = tracing.current_traceparent()
+    rows = []
+    for (priority, tenant), job_ids in by_tenant.items():
+        start = await _virtual_start(session, priority, tenant)
+        rows.extend(
+            {
+                "job_id": job_id, "priority": priority, "tenant": tenant,
+                "vtime": start + offset, "traceparent": traceparent,
+            }
+            for offset, job_id in enumerate(job_ids, 1)
+        )
+    if rows:
+        await session.execute(insert(JobOutbox), rows)
+
+
+def task_kwargs(input_data: Dict[str, Any]) -> Dict[str, Any]:
+    """``process_job`` arguments for a job's ``input_data`` column."""
+    if "blob" in input_data:
+        return {"blob": input_data["blob"]}
+    return {"data": input_data["data"]}
+
+
+def _publish(jobs, traceparents: Dict[int, str]) -> None:
+    # Imported here because app.tasks imports this module
+    from .tasks import process_job
+
+    # Publish all task messages over a single producer connection
+    group([
+        process_job.s(
+            job_id=job.id,
+            operation=job.operation,
+            deadline=cancellation.deadline_timestamp(job.deadline),
+            **task_kwargs(job.input_data),
+        ).set(queue=lane_queue(job.priority), headers={"traceparent": traceparents[job.id]})
+        for job in jobs
+    ]).apply_async()
+
+
+def _record_waits(jobs) -> Tuple[Dict[int, str], List]:
+    """Record each job's time in the outbox as a span.
+
+    Returns the spans' traceparents by job and the jobs' timeline entries.
+    """
+    now = time.time()
+    traceparents = {}
+    with tracing.timeline() as entries:
+        for job in jobs:
+            waited = _waited(job.queued_at, now) or 0.0
+            wait = tracing.record_span(
+                "outbox.wait", now - waited, now, parent=job.traceparent,
+                phase_of=job.id, priority=job.priority,
+            )
+            traceparents[job.id] = wait.traceparent
+    return traceparents, entries
+
+
+async def broker_depths() -> Dict[JobPriority, Optional[int]]:
+    """Messages in each lane's broker queue; None when it cannot be read.
+
+    Only Redis brokers are inspected, where a queue is a list named after it.
+    """
+    try:
+        async with get_redis().pipeline(transaction=False) as pipe:
+            for priority in LANE_WEIGHTS:
+                pipe.llen(lane_queue(priority))
+            depths = await pipe.execute()
+    except Exception as e:
+        logger.debug("Failed to read broker queue depths: %s", e)
+        return {priority: None for priority in LANE_WEIGHTS}
+    return dict(zip(LANE_WEIGHTS, depths))
+
+
+async def lane_stats() -> Dict[str, Dict[str, Any]]:
+    """Outbox and broker depth and oldest wait of every lane."""
+    now = time.time()
+    async with async_session_maker() as session:
+        rows = (await session.execute(
+            select(JobOutbox.priority, func.count(), func.min(JobOutbox.created_at))
+            .group_by(JobOutbox.priority)
+        )).all()
+    outbox = {priority: (count, oldest) for priority, count, oldest in rows}
+    depths = await broker_depths()
+
+    stats = {}
+    for priority in LANE_WEIGHTS:
+        count, oldest = outbox.get(priority.value, (0, None))
+        stats[priority.value] = {
+            "queue": lane_queue(priority),
+            "weight": LANE_WEIGHTS[priority],
+            "outbox_depth": count,
+            "broker_depth": depths[priority],
+            "oldest_wait_seconds": _waited(oldest, now),
+        }
+        metrics.JOB_LANE_OUTBOX_DEPTH.labels(priority=priority.value).set(count)
+        metrics.JOB_LANE_BROKER_DEPTH.labels(priority=priority.value).set(depths[priority] or 0)
+        metrics.JOB_LANE_OLDEST_WAIT_SECONDS.labels(priority=priority.value).set(
+            stats[priority.value]["oldest_wait_seconds"] or 0
+        )
+    return stats
+
+
+async def _select_lane(
+    session: AsyncSession, priority: JobPriority, limit: int, exclude: Iterable[int] = ()
+) -> list:
+    """Lock the next ``limit`` rows of a lane, in virtual time order."""
+    stmt = (
+        select(
+            JobOutbox.id.label("outbox_id"), JobOutbox.created_at.label("queued_at"),
+            JobOutbox.traceparent,
+            Job.id, Job.status, Job.operation, Job.input_data, Job.priority, Job.deadline
+        )
+        .join(Job, Job.id == JobOutbox.job_id)
+        .where(JobOutbox.priority == priority.value)
+        .order_by(JobOutbox.vtime, JobOutbox.id)
+        .limit(limit)
+        .with_for_update(of=JobOutbox, skip_locked=True)
+    )
+    exclude = list(exclude)
+    if exclude:
+        # Rows this transaction locked already are not skipped by SKIP LOCKED
+        stmt = stmt.where(JobOutbox.id.notin_(exclude))
+    return list((await session.execute(stmt)).all())
+
+
+class OutboxDispatcher:
+    """Publishes outbox rows in weighted, tenant-fair batches from a background task."""
+
+    def __init__(self, batch_size: int = BATCH_SIZE, poll_interval: float = POLL_INTERVAL):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        # Set when a lane had work but its broker queue was full
+        self.throttled = False
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def wake(self) -> None:
+        """Drain now rather than at the next poll; call after committing rows."""
+        self._wake.set()
+
+    @staticmethod
+    def _split(rows: int, rooms: Dict[JobPriority, Optional[int]]) -> Dict[JobPriority, int]:
+        """Split ``rows`` between lanes by weight, capped by each lane's broker queue room."""
+        total = sum(LANE_WEIGHTS[priority] for priority in rooms)
+        limits = {}
+        for priority, room in rooms.items():
+            share = max(1, rows * LANE_WEIGHTS[priority] // total)
+            limits[priority] = share if room is None else min(share, room)
+        return limits
+
+    def _lane_limits(self, depths: Dict[JobPriority, Optional[int]]) -> Dict[JobPriority, int]:
+        return self._split(self.batch_size, {
+            priority: None if depths[priority] is None else MAX_QUEUED_PER_LANE - depths[priority]
+            for priority in LANE_WEIGHTS
+        })
+
+    async def drain_once(self) -> int:
+        """Publish one batch; returns the number of outbox rows consumed."""
+        depths = await broker_depths()
+        limits = self._lane_limits(depths)
+        self.throttled = False
+        now = time.time()
+
+        async with async_session_maker() as session:
+            lanes: Dict[JobPriority, list] = {}
+            for priority, limit in limits.items():
+                if limit <= 0:
+                    # Leave the lane's backlog in the outbox until its queue drains
+                    self.throttled = True
+                    continue
+                lanes[priority] = await _select_lane(session, priority, limit)
+
+            # Lanes with less work than their share leave the rest of the batch
+            # to the lanes that filled theirs and still have queue room
+            spare = self.batch_size - sum(len(lane) for lane in lanes.values())
+            rooms = {
+                priority: None if depths[priority] is None else MAX_QUEUED_PER_LANE - depths[priority] - len(lane)
+                for priority, lane in lanes.items()
+                if len(lane) == limits[priority]
+            }
+            rooms = {priority: room for priority, room in rooms.items() if room is None or room > 0}
+            if spare > 0 and rooms:
+                for priority, limit in self._split(spare, rooms).items():
+                    lanes[priority].extend(await _select_lane(
+                        session, priority, limit, exclude=[row.outbox_id for row in lanes[priority]]
+                    ))
+
+            rows = [row for lane in lanes.values() for row in lane]
+            if not rows:
+                return 0
+
+            # Jobs that finished, were completed from the cache or were cancelled
+            # meanwhile are dropped, and those past their deadline expire here
+            pending = [row for row in rows if row.status == JobStatus.PENDING]
+            expired_ids = {
+                row.id for row in pending
+                if row.deadline is not None and cancellation.deadline_timestamp(row.deadline) <= now
+            }
+            expired = []
+            if expired_ids:
+                pending = [row for row in pending if row.id not in expired_ids]
+                expired = (await session.execute(
+                    update(Job)
+                    .where(Job.id.in_(expired_ids), Job.status == JobStatus.PENDING)
+                    .values(
+                        status=JobStatus.EXPIRED,
+                        result={"result": None, "error": cancellation.EXPIRED_ERROR},
+                    )
+                    .returning(*status_cache.COLUMNS)
+                )).all()
+            timeline = []
+            if pending:
+                traceparents, timeline = _record_waits(pending)
+                await asyncio.to_thread(_publish, pending, traceparents)
+            await session.execute(
+                delete(JobOutbox).where(JobOutbox.id.in_([row.outbox_id for row in rows]))
+            )
+            await session.commit()
+
+        if expired:
+            await status_cache.put_many(row._asdict() for row in expired)
+            for row in expired:
+                await notifications.publish_job_event(row.id, JobStatus.EXPIRED)
+
+        await tracing.save_timeline(timeline)
+        for row in pending:
+            if row.queued_at is not None:
+                metrics.JOB_DISPATCH_WAIT_SECONDS.labels(priority=row.priority).observe(
+                    _waited(row.queued_at, now)
+                )
+        return len(rows)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        next_stats = loop.time()
+        while True:
+            self._wake.clear()
+            try:
+                count = await self.drain_once()
+                if loop.time() >= next_stats:
+                    next_stats = loop.time() + LANE_STATS_INTERVAL
+                    await lane_stats()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Outbox dispatch failed: %s", e)
+                count = 0
+            if count:
+                continue
+            # Caught up or throttled; wait for a new job, the next poll, or queue room
+            timeout = THROTTLE_INTERVAL if self.throttled else self.poll_interval
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+
+dispatcher = OutboxDispatcher()
+
+
+async def requeue_stale_jobs(now: Optional[datetime] = None) -> int:
+    """Queue PENDING jobs not touched for ``STALE_PENDING_SECONDS`` again."""
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(seconds=STALE_PENDING_SECONDS)
+    async with async_session_maker() as session:
+        stale = (await session.execute(
+            select(Job.id, Job.priority, Job.tenant)
+            .where(
+                Job.status == JobStatus.PENDING,
+                Job.updated_at < cutoff,
+                ~exists().where(JobOutbox.job_id == Job.id),
+            )
+            .order_by(Job.id)
+            .limit(BATCH_SIZE)
+            .with_for_update(skip_locked=True)
+        )).all()
+        if stale:
+            job_ids = [job.id for job in stale]
+            # Touch the jobs so each one is re-published at most once per window
+            await session.execute(update(Job).where(Job.id.in_(job_ids)).values(updated_at=now))
+            await add(session, stale)
+        await session.commit()
+    if stale:
+        logger.warning("Re-queued %d stale PENDING jobs", len(stale))
+    return len(stale)
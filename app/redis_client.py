@@ -0,0 +1,45 @@
+"""Shared asyncio Redis clients.
+
+Connections created by ``redis.asyncio`` are bound to the event loop that
+opened them. The API and the worker job loop (see ``app.worker_loop``) run
+on different loops, so one client is kept per loop.
+"""
+import asyncio
+import os
+import weakref
+
+import redis.asyncio as redis
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
+
+# Keep Redis lookups on the request path from stalling when Redis is unreachable
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "0.5"))
+
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, redis.Redis]" = weakref.WeakKeyDictionary()
+
+
+def create_redis(**kwargs) -> redis.Redis:
+    """Create a new client; ``kwargs`` override the default timeouts."""
+    options = {
+        "socket_timeout": REDIS_SOCKET_TIMEOUT,
+        "socket_connect_timeout": REDIS_SOCKET_TIMEOUT,
+        **kwargs,
+    }
+    return redis.Redis.from_url(REDIS_URL, **options)
+
+
+def get_redis() -> redis.Redis:
+    """Return the Redis client for the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = create_redis()
+        _clients[loop] = client
+    return client
+
+
+async def close_redis() -> None:
+    """Close the client for the running event loop, if one was created."""
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
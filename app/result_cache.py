@@ -0,0 +1,152 @@
+"""Content-addressed cache of job results.
+
+Jobs are keyed by a SHA-256 of their operation and float64 input bytes, so
+resubmitting an identical payload can be answered without running the
+operation again. There are two tiers:
+
+- an in-process LRU with a TTL, consulted first;
+- a shared tier in Redis, filled by workers and read by every API process.
+
+Redis failures are treated as misses; the cache never fails a request.
+
+``get_stats`` reports the counters of this process only; the same lookups
+are exported as Prometheus counters, which add up across the API and the
+workers.
+"""
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from . import metrics
+from .operations import as_array
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "true").lower() == "true"
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "10000"))
+RESULT_CACHE_TTL = int(os.getenv("RESULT_CACHE_TTL", str(60 * 60)))  # 1 hour
+REDIS_KEY_PREFIX = "result-cache:"
+
+
+class LRUCache:
+    """Size-bounded mapping that evicts the least recently used entry and
+    drops entries older than ``ttl`` seconds on access."""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+local_cache = LRUCache(RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_TTL)
+
+stats: Dict[str, int] = {
+    "local_hits": 0,
+    "redis_hits": 0,
+    "misses": 0,
+    "stores": 0,
+    "redis_errors": 0,
+}
+
+
+def cache_key(operation: str, data: Union[Sequence[float], np.ndarray]) -> str:
+    operation = getattr(operation, "value", operation)
+    digest = hashlib.sha256(operation.encode())
+    digest.update(b"\0")
+    digest.update(as_array(data).astype("<f8", copy=False).tobytes())
+    return digest.hexdigest()
+
+
+def cache_keys(jobs: Iterable[Tuple[str, Union[Sequence[float], np.ndarray]]]) -> List[str]:
+    """``cache_key`` of each ``(operation, data)`` pair."""
+    return [cache_key(operation, data) for operation, data in jobs]
+
+
+async def get_many(keys: List[str]) -> List[Optional[Dict[str, Any]]]:
+    """Look up several keys, returning the cached result or None for each."""
+    if not RESULT_CACHE_ENABLED:
+        return [None] * len(keys)
+
+    results = [local_cache.get(key) for key in keys]
+    missing = [i for i, value in enumerate(results) if value is None]
+    stats["local_hits"] += len(keys) - len(missing)
+    metrics.RESULT_CACHE_LOOKUPS.labels(outcome="local_hit").inc(len(keys) - len(missing))
+
+    if missing:
+        try:
+            raw = await get_redis().mget([REDIS_KEY_PREFIX + keys[i] for i in missing])
+        except Exception as e:
+            stats["redis_errors"] += 1
+            logger.debug("Result cache lookup in Redis failed: %s", e)
+            raw = [None] * len(missing)
+        for i, value in zip(missing, raw):
+            if value is None:
+                stats["misses"] += 1
+                metrics.RESULT_CACHE_LOOKUPS.labels(outcome="miss").inc()
+                continue
+            results[i] = json.loads(value)
+            local_cache.set(keys[i], results[i])
+            stats["redis_hits"] += 1
+            metrics.RESULT_CACHE_LOOKUPS.labels(outcome="redis_hit").inc()
+
+    return results
+
+
+async def get(key: str) -> Optional[Dict[str, Any]]:
+    return (await get_many([key]))[0]
+
+
+async def store(key: str, result: Dict[str, Any]) -> None:
+    """Store a successful result in both tiers."""
+    if not RESULT_CACHE_ENABLED:
+        return
+    local_cache.set(key, result)
+    stats["stores"] += 1
+    metrics.RESULT_CACHE_STORES.inc()
+    try:
+        await get_redis().set(REDIS_KEY_PREFIX + key, json.dumps(result), ex=RESULT_CACHE_TTL)
+    except Exception as e:
+        stats["redis_errors"] += 1
+        logger.debug("Result cache store in Redis failed: %s", e)
+
+
+def get_stats() -> Dict[str, Any]:
+    lookups = stats["local_hits"] + stats["redis_hits"] + stats["misses"]
+    hits = stats["local_hits"] + stats["redis_hits"]
+    return {
+        **stats,
+        "hit_ratio": hits / lookups if lookups else 0.0,
+        "local_entries": len(local_cache),
+        "local_max_entries": local_cache.max_entries,
+        "ttl_seconds": RESULT_CACHE_TTL,
+    }
@@ -0,0 +1,153 @@
+"""Retention of old jobs.
+
+``cleanup_old_jobs`` deletes jobs older than the retention window of their
+status in small batches instead of one large DELETE, so locks stay short
+and autovacuum keeps up. Each batch is one ``DELETE ... RETURNING`` over
+the oldest expired rows, found through ``ix_jobs_status_created_at_id``.
+After every batch the task sleeps at least as long as the batch took, so
+it never holds the database more than half of the time.
+
+Windows are set per status with ``JOB_RETENTION_<STATUS>_DAYS``; a status
+with no window is kept forever. Appendable jobs are counted from their last
+append rather than their creation. When ``JOB_ARCHIVE_DIR`` is set, deleted
+rows are first appended as JSON lines to gzip files in that directory.
+Blobs of deleted jobs are removed from the blob store.
+"""
+import asyncio
+import gzip
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import delete, or_, select
+
+from . import blobstore, status_cache
+from .db import Job, JobStatus, async_session_maker
+
+logger = logging.getLogger(__name__)
+
+# Finished jobs are kept for a while; queued and running jobs are kept until they finish
+_DEFAULT_RETENTION_DAYS = {
+    JobStatus.SUCCESS: "30", JobStatus.FAILED: "90", JobStatus.CANCELLED: "7", JobStatus.EXPIRED: "7",
+}
+
+RETENTION_DAYS: Dict[JobStatus, float] = {
+    status: float(days)
+    for status in JobStatus
+    if (days := os.getenv(f"JOB_RETENTION_{status.value}_DAYS", _DEFAULT_RETENTION_DAYS.get(status, "")))
+}
+
+# Rows deleted per statement
+BATCH_SIZE = int(os.getenv("JOB_RETENTION_BATCH_SIZE", "1000"))
+
+# Minimum pause between batches, in seconds
+BATCH_PAUSE = float(os.getenv("JOB_RETENTION_BATCH_PAUSE", "0.1"))
+
+# A single run stops after this many seconds; the next run picks up the rest
+MAX_RUNTIME = float(os.getenv("JOB_RETENTION_MAX_RUNTIME", str(20 * 60)))
+
+# Directory for gzip archives of deleted rows; no archive when unset
+ARCHIVE_DIR = os.getenv("JOB_ARCHIVE_DIR")
+
+_ARCHIVE_COLUMNS = (
+    Job.id, Job.status, Job.operation, Job.input_data, Job.result,
+    Job.appendable, Job.created_at, Job.updated_at,
+)
+
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, JobStatus):
+        return value.value
+    raise TypeError(f"Cannot encode {type(value).__name__}")
+
+
+def _archive(path: str, rows: List[Dict[str, Any]]) -> None:
+    # Appending starts a new gzip member; gzip readers concatenate them
+    with gzip.open(path, "at", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row, default=_encode))
+            f.write("\n")
+
+
+def _blob_handle(input_data: Optional[Dict[str, Any]]) -> Optional[str]:
+    return input_data.get("blob") if isinstance(input_data, dict) else None
+
+
+async def _delete_batch(status: JobStatus, cutoff: datetime, archive_path: Optional[str]) -> int:
+    expired = (
+        select(Job.id)
+        .where(
+            Job.status == status,
+            Job.created_at < cutoff,
+            # Appendable jobs are SUCCESS from creation; keep those still being appended to
+            or_(Job.appendable.is_(False), Job.updated_at < cutoff),
+        )
+        .order_by(Job.created_at, Job.id)
+        .limit(BATCH_SIZE)
+        .with_for_update(skip_locked=True)
+    )
+    # Without an archive only the blob handle is needed, not the whole input
+    columns = _ARCHIVE_COLUMNS if archive_path else (Job.id, Job.input_data["blob"].as_string().label("blob"))
+    stmt = delete(Job).where(Job.id.in_(expired.scalar_subquery())).returning(*columns)
+
+    async with async_session_maker() as session:
+        rows = [row._asdict() for row in (await session.execute(stmt)).all()]
+        if rows and archive_path:
+            # Archive before committing so a failed write leaves the rows in place
+            await asyncio.to_thread(_archive, archive_path, rows)
+        await session.commit()
+
+    if not rows:
+        return 0
+
+    handles = [
+        _blob_handle(row["input_data"]) if archive_path else row["blob"]
+        for row in rows
+    ]
+    for handle in filter(None, handles):
+        try:
+            await asyncio.to_thread(blobstore.delete, handle)
+        except Exception as e:
+            logger.warning("Failed to delete blob %s: %s", handle, e)
+    await status_cache.evict_many(row["id"] for row in rows)
+    return len(rows)
+
+
+async def cleanup_old_jobs(now: Optional[datetime] = None) -> Dict[str, Any]:
+    """Delete expired jobs of every status with a retention window."""
+    now = now or datetime.utcnow()
+    deadline = time.monotonic() + MAX_RUNTIME
+    deleted: Dict[str, int] = {}
+    complete = True
+
+    for status, days in RETENTION_DAYS.items():
+        cutoff = now - timedelta(days=days)
+        archive_path = None
+        if ARCHIVE_DIR:
+            os.makedirs(ARCHIVE_DIR, exist_ok=True)
+            archive_path = os.path.join(
+                ARCHIVE_DIR, f"jobs-{status.value.lower()}-{now:%Y%m%dT%H%M%S}.jsonl.gz"
+            )
+
+        deleted[status.value] = 0
+        while True:
+            if time.monotonic() >= deadline:
+                complete = False
+                break
+            started = time.monotonic()
+            count = await _delete_batch(status, cutoff, archive_path)
+            deleted[status.value] += count
+            if count < BATCH_SIZE:
+                break
+            # Throttle: leave the database idle at least as long as the batch took
+            await asyncio.sleep(max(BATCH_PAUSE, time.monotonic() - started))
+        if not complete:
+            break
+
+    logger.info("Job retention deleted %s (complete=%s)", deleted, complete)
+    return {"deleted": deleted, "complete": complete}
@@ -1,35 +1,80 @@
-from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from pydantic import BaseModel, Field, FiniteFloat, PositiveFloat
+from typing import Annotated, List, Optional, Dict, Any, Union
 from datetime import datetime
 from enum import Enum
+import os
 
-class OperationType(str, Enum):
-    SQUARE_SUM = "square_sum"
-    CUBE_SUM = "cube_sum"
+from .operations import OPERATIONS
+
+# Mirrors the operation registry so validation accepts every registered kernel
+OperationType = Enum(
+    "OperationType",
+    {name.upper(): name for name in OPERATIONS},
+    type=str,
+)
+
+# Upper bound on the number of values in one job, for every upload format
+JOB_MAX_ELEMENTS = int(os.getenv("JOB_MAX_ELEMENTS", "100000000"))
 
 class JobStatus(str, Enum):
     PENDING = "PENDING"
     IN_PROGRESS = "IN_PROGRESS"
     SUCCESS = "SUCCESS"
     FAILED = "FAILED"
+    CANCELLED = "CANCELLED"
+    EXPIRED = "EXPIRED"
+
+class JobPriority(str, Enum):
+    HIGH = "high"
+    NORMAL = "normal"
+    LOW = "low"
 
 class JobCreate(BaseModel):
-    data: List[float] = Field(..., description="List of numbers to process")
-    operation: OperationType = Field(..., description="Type of operation to perform")
+    data: List[FiniteFloat] = Field(..., max_length=JOB_MAX_ELEMENTS, description="List of numbers to process")
+    operation: Union[OperationType, Annotated[List[OperationType], Field(min_length=1)]] = Field(
+        ..., description="Operation to perform, or a list of aggregates computed together in one pass"
+    )
+    appendable: bool = Field(False, description="Allow more data to be appended to the job later")
+    priority: JobPriority = Field(JobPriority.NORMAL, description="Dispatch lane of the job")
+    tenant: Optional[str] = Field(None, min_length=1, max_length=64, description="Client the job is scheduled fairly for")
+    deadline: Optional[datetime] = Field(None, description="Drop the job as EXPIRED if it has not finished by then")
+    ttl: Optional[PositiveFloat] = Field(None, description="Seconds after submission at which the job expires")
+
+class JobAppend(BaseModel):
+    data: List[FiniteFloat] = Field(..., max_length=JOB_MAX_ELEMENTS, description="Numbers to add to the job")
 
 class JobResponse(BaseModel):
     id: int
     status: JobStatus
     operation: str
+    deadline: Optional[datetime] = None
     created_at: datetime
     updated_at: datetime
 
     class Config:
         from_attributes = True
 
+class JobListResponse(BaseModel):
+    items: List[JobResponse]
+    next_cursor: Optional[str] = Field(None, description="Pass as `cursor` to fetch the next page; null on the last page")
+
+class JobProgress(BaseModel):
+    done: int
+    total: int
+
 class JobStatusResponse(JobResponse):
-    pass
+    progress: Optional[JobProgress] = None
 
 class JobResultResponse(JobResponse):
     result: Optional[Dict[str, Any]] = None
-    error: Optional[str] = None
\ No newline at end of file
+    error: Optional[str] = None
+
+class JobPhase(BaseModel):
+    phase: str
+    start: float = Field(..., description="Epoch seconds at which the phase started")
+    seconds: float
+
+class JobTimelineResponse(BaseModel):
+    id: int
+    trace_id: Optional[str] = Field(None, description="Trace the job was created in")
+    phases: List[JobPhase]
@@ -0,0 +1,189 @@
+"""Read-through Redis cache of job state, keyed by job id.
+
+Status and result lookups read ``job-state:{id}`` first and fall back to a
+column-limited query on ``jobs`` (never ``input_data``), then fill the cache.
+Writers (job creation and ``update_job_status``) write through, so the
+cache follows every transition.
+
+Terminal states never change and are cached for a long time. Other states
+get a short TTL so a missed write-through can only serve stale data
+briefly. Read-through fills use SET NX so they never overwrite a newer
+state written by a worker in the meantime. Redis failures are treated as
+misses.
+
+In write-behind mode (``JOB_STATE_WRITE_BEHIND``, see ``app.write_behind``)
+workers also record each transition under ``job-state-pending:{id}`` before
+it reaches the database. Reads lay it over the cached or loaded row until
+the row has been written with a newer ``updated_at``, and the flush that
+writes it drops the entry.
+"""
+import json
+import logging
+import os
+from datetime import datetime, timezone
+from enum import Enum
+from typing import Any, Dict, Iterable, Optional
+
+from .db import Job, JobStatus, STOPPED_STATUSES, TERMINAL_STATUSES
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+JOB_STATE_CACHE_ENABLED = os.getenv("JOB_STATE_CACHE_ENABLED", "true").lower() == "true"
+JOB_STATE_CACHE_TERMINAL_TTL = int(os.getenv("JOB_STATE_CACHE_TERMINAL_TTL", str(24 * 60 * 60)))
+JOB_STATE_CACHE_ACTIVE_TTL = int(os.getenv("JOB_STATE_CACHE_ACTIVE_TTL", "2"))
+REDIS_KEY_PREFIX = "job-state:"
+
+# Workers buffer transitions and write them in batches; see app.write_behind
+JOB_STATE_WRITE_BEHIND = os.getenv("JOB_STATE_WRITE_BEHIND", "false").lower() == "true"
+# Seconds a buffered transition is served from the cache; far longer than a flush
+JOB_STATE_PENDING_TTL = int(os.getenv("JOB_STATE_PENDING_TTL", "60"))
+PENDING_KEY_PREFIX = "job-state-pending:"
+
+# Everything the status and result endpoints need; input_data is left out
+COLUMNS = (Job.id, Job.status, Job.operation, Job.result, Job.deadline, Job.created_at, Job.updated_at)
+
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return value.value
+    raise TypeError(f"Cannot encode {type(value).__name__}")
+
+
+def _decode(raw: bytes) -> Dict[str, Any]:
+    job = json.loads(raw)
+    job["status"] = JobStatus(job["status"])
+    for field in ("deadline", "created_at", "updated_at"):
+        if job.get(field):
+            job[field] = datetime.fromisoformat(job[field])
+    return job
+
+
+def _ttl(job: Dict[str, Any]) -> int:
+    if job["status"] in TERMINAL_STATUSES:
+        return JOB_STATE_CACHE_TERMINAL_TTL
+    return JOB_STATE_CACHE_ACTIVE_TTL
+
+
+def _timestamp(value: datetime) -> float:
+    # Rows read from PostgreSQL are aware; naive values are UTC
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def _with_pending(job: Dict[str, Any], pending: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    if pending is None or (
+        job.get("updated_at") and _timestamp(job["updated_at"]) >= _timestamp(pending["updated_at"])
+    ):
+        # Nothing buffered, or the row already holds this transition or a later one
+        return job
+    if job["status"] in STOPPED_STATUSES:
+        # Cancelled or expired meanwhile; the worker's buffered write will not apply
+        return job
+    return {**job, **pending}
+
+
+async def get(job_id: int) -> Optional[Dict[str, Any]]:
+    if not JOB_STATE_CACHE_ENABLED:
+        return None
+    try:
+        if JOB_STATE_WRITE_BEHIND:
+            raw, pending = await get_redis().mget(
+                f"{REDIS_KEY_PREFIX}{job_id}", f"{PENDING_KEY_PREFIX}{job_id}"
+            )
+        else:
+            raw, pending = await get_redis().get(f"{REDIS_KEY_PREFIX}{job_id}"), None
+    except Exception as e:
+        logger.debug("Job state cache lookup failed for job %s: %s", job_id, e)
+        return None
+    if raw is None:
+        return None
+    return _with_pending(_decode(raw), None if pending is None else _decode(pending))
+
+
+async def with_pending(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Apply the job's buffered transition, if any, to a row loaded from the database."""
+    if not (JOB_STATE_CACHE_ENABLED and JOB_STATE_WRITE_BEHIND):
+        return job
+    try:
+        pending = await get_redis().get(f"{PENDING_KEY_PREFIX}{job['id']}")
+    except Exception as e:
+        logger.debug("Job state cache lookup failed for job %s: %s", job["id"], e)
+        return job
+    return _with_pending(job, None if pending is None else _decode(pending))
+
+
+async def put_pending(job: Dict[str, Any]) -> None:
+    """Record a buffered transition (``id``, ``status``, ``result``, ``updated_at``)."""
+    if not JOB_STATE_CACHE_ENABLED:
+        return
+    try:
+        await get_redis().set(
+            f"{PENDING_KEY_PREFIX}{job['id']}",
+            json.dumps(dict(job), default=_encode),
+            ex=JOB_STATE_PENDING_TTL,
+        )
+    except Exception as e:
+        logger.debug("Job state cache write failed for job %s: %s", job["id"], e)
+
+
+async def clear_pending(job_ids: Iterable[int]) -> None:
+    """Drop buffered transitions that have been written to the database."""
+    if not JOB_STATE_CACHE_ENABLED:
+        return
+    keys = [f"{PENDING_KEY_PREFIX}{job_id}" for job_id in job_ids]
+    if not keys:
+        return
+    try:
+        await get_redis().delete(*keys)
+    except Exception as e:
+        # Entries older than the written rows are ignored by readers anyway
+        logger.debug("Job state cache write failed: %s", e)
+
+
+async def put_many(jobs: Iterable[Dict[str, Any]], overwrite: bool = True) -> None:
+    """Cache job snapshots (mappings with the fields in ``COLUMNS``).
+
+    Pass ``overwrite=False`` for read-through fills.
+    """
+    if not JOB_STATE_CACHE_ENABLED:
+        return
+    try:
+        async with get_redis().pipeline(transaction=False) as pipe:
+            for job in jobs:
+                pipe.set(
+                    f"{REDIS_KEY_PREFIX}{job['id']}",
+                    json.dumps(dict(job), default=_encode),
+                    ex=_ttl(job),
+                    nx=not overwrite,
+                )
+            await pipe.execute()
+    except Exception as e:
+        logger.debug("Job state cache write failed: %s", e)
+
+
+async def put(job: Dict[str, Any], overwrite: bool = True) -> None:
+    await put_many([job], overwrite=overwrite)
+
+
+async def evict_many(job_ids: Iterable[int]) -> None:
+    """Drop cached state of deleted jobs."""
+    if not JOB_STATE_CACHE_ENABLED:
+        return
+    keys = [
+        f"{prefix}{job_id}" for job_id in job_ids for prefix in (REDIS_KEY_PREFIX, PENDING_KEY_PREFIX)
+    ]
+    if not keys:
+        return
+    try:
+        await get_redis().delete(*keys)
+    except Exception as e:
+        logger.debug("Job state cache eviction failed: %s", e)
+
+
+def snapshot(job: Job) -> Dict[str, Any]:
+    """Build a cacheable snapshot from a loaded ``Job``."""
+    return {column.key: getattr(job, column.key) for column in COLUMNS}
@@ -1,8 +1,15 @@
-from celery import Celery
+from celery import Celery, chord
+from celery.signals import worker_process_init, worker_process_shutdown, worker_shutdown
 import asyncio
-from .db import JobStatus, async_session_maker, Job
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from .db import JobStatus, TERMINAL_STATUSES, async_session_maker, engine, Job
+from . import admission, blobstore, cancellation, metrics, notifications, operations, outbox, result_cache, retention, status_cache, tracing, worker_loop, write_behind
+from .redis_client import get_redis
 from sqlalchemy import update
 from sqlalchemy.future import select
+from celery.utils.log import get_task_logger
 import os
 
 # Import Celery configuration
@@ -14,48 +21,272 @@ celery_app = Celery("job_processor")
 # Apply configuration from celery_config
 celery_app.config_from_object('app.celery_config')
 
-async def update_job_status(job_id: int, status: JobStatus, result: dict = None, error: str = None):
-    async with async_session_maker() as session:
-        stmt = (
-            update(Job)
-            .where(Job.id == job_id)
-            .values(
-                status=status,
-                result={"result": result, "error": error} if result or error else None
-            )
+logger = get_task_logger(__name__)
+
+# Simulated processing time added to every job, in seconds
+JOB_PROCESSING_DELAY = float(os.getenv("JOB_PROCESSING_DELAY", "2"))
+
+# Inputs with at least this many elements are split into shards across workers
+SHARD_MIN_ELEMENTS = int(os.getenv("SHARD_MIN_ELEMENTS", "5000000"))
+
+# Number of elements reduced by each shard task
+SHARD_SIZE = int(os.getenv("SHARD_SIZE", "1000000"))
+
+@worker_process_init.connect
+def init_worker_process(**kwargs):
+    # Pooled connections inherited from the parent must not be shared with it
+    engine.sync_engine.dispose(close=False)
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def shutdown_worker_process(**kwargs):
+    if worker_loop.is_started():
+        # Write buffered transitions before the connections go away
+        worker_loop.run(write_behind.buffer.stop())
+        worker_loop.run(engine.dispose())
+    worker_loop.shutdown()
+
+async def update_job_status(
+    job_id: int, status: JobStatus, result: dict = None, error: str = None, progress: dict = None
+):
+    with tracing.span(f"update_status.{status.value.lower()}", phase_of=job_id):
+        await _update_job_status(job_id, status, result, error, progress)
+
+async def _update_job_status(
+    job_id: int, status: JobStatus, result: dict = None, error: str = None, progress: dict = None
+):
+    payload = None
+    if result or error or progress:
+        payload = {"result": result, "error": error}
+        if progress:
+            payload["progress"] = progress
+
+    if status_cache.JOB_STATE_WRITE_BEHIND:
+        # Visible to readers now; written to the database by the next flush
+        await status_cache.put_pending(
+            {"id": job_id, "status": status, "result": payload, "updated_at": datetime.now(timezone.utc)}
         )
-        await session.execute(stmt)
-        await session.commit()
+        flushed = write_behind.buffer.put(job_id, status, payload)
+        await notifications.publish_job_event(job_id, status)
+        if status in TERMINAL_STATUSES:
+            # The task only completes once its outcome is in the database
+            await flushed
+            await admission.record_drained()
+        return
+
+    with metrics.JOB_STATUS_UPDATE_SECONDS.labels(status=status.value).time():
+        async with async_session_maker() as session:
+            stmt = (
+                update(Job)
+                # A finished, cancelled or expired job keeps its state whatever
+                # a late or duplicate delivery of its task does
+                .where(Job.id == job_id, Job.status.notin_(TERMINAL_STATUSES))
+                .values(status=status, result=payload)
+                .returning(*status_cache.COLUMNS)
+            )
+            row = (await session.execute(stmt)).first()
+            await session.commit()
+    if row is None:
+        return
+    metrics.observe_transition(job_id, status, row.created_at)
+    # Write through so status reads are served from the cache
+    await status_cache.put(row._asdict())
+    await notifications.publish_job_event(job_id, status)
+    if status in TERMINAL_STATUSES:
+        # Feeds the drain rate that admission control bases Retry-After on
+        await admission.record_drained()
+
+async def claim_job(job_id: int) -> bool:
+    """Move a PENDING job to IN_PROGRESS; False if it is not PENDING any more.
+
+    Publishing is at-least-once (see ``app.outbox``), so the same job can be
+    delivered twice; only the delivery that claims it runs it. The claim is
+    written at once, also in write-behind mode.
+    """
+    status = JobStatus.IN_PROGRESS
+    with tracing.span(f"update_status.{status.value.lower()}", phase_of=job_id):
+        with metrics.JOB_STATUS_UPDATE_SECONDS.labels(status=status.value).time():
+            async with async_session_maker() as session:
+                stmt = (
+                    update(Job)
+                    .where(Job.id == job_id, Job.status == JobStatus.PENDING)
+                    .values(status=status, result=None)
+                    .returning(*status_cache.COLUMNS)
+                )
+                row = (await session.execute(stmt)).first()
+                await session.commit()
+    if row is None:
+        return False
+    metrics.observe_transition(job_id, status, row.created_at)
+    await status_cache.put(row._asdict())
+    await notifications.publish_job_event(job_id, status)
+    return True
+
+@contextmanager
+def traced(request, name: str, job_id: int):
+    """Continue the publisher's trace for the task and save the phases it
+    records to the job's timeline afterwards."""
+    with tracing.timeline() as entries:
+        try:
+            with tracing.task_span(request, name, job_id=job_id):
+                yield
+        finally:
+            worker_loop.run(tracing.save_timeline(entries))
 
 @celery_app.task(bind=True)
-def process_job(self, job_id: int, operation: str, data: list):
-    # This is a synchronous function that will be called by Celery
-    # We'll run the async function in an event loop
-    loop = asyncio.get_event_loop()
-    return loop.run_until_complete(process_job_async(job_id, operation, data))
+def process_job(self, job_id: int, operation: str, data: list = None, blob: str = None, deadline: float = None):
+    # This is a synchronous function that will be called by Celery.
+    # The coroutine runs on the process-wide job loop, where it shares the
+    # engine and interleaves with jobs submitted by other pool threads.
+    # It inherits the task's trace context, so its spans join the trace.
+    with traced(self.request, "process_job", job_id):
+        return worker_loop.run(process_job_async(job_id, operation, data, blob, deadline))
+
+async def expire_job(job_id: int) -> dict:
+    await update_job_status(job_id, JobStatus.EXPIRED, error=cancellation.EXPIRED_ERROR)
+    return {"status": "expired"}
+
+async def process_job_async(
+    job_id: int, operation: str, data: list = None, blob: str = None, deadline: float = None
+):
+    # Drop jobs whose client has given up before spending anything on them
+    if deadline is not None and time.time() >= deadline:
+        return await expire_job(job_id)
+    if await cancellation.is_requested(job_id):
+        return {"status": "cancelled"}
+    if not await claim_job(job_id):
+        # Another delivery ran or is running it, or it was stopped meanwhile
+        return {"status": "skipped"}
+
+    with cancellation.watcher.watch(job_id, deadline) as cancelled:
+        try:
+            # Large inputs arrive as a blob handle and are memory-mapped, not copied
+            if blob is not None:
+                data = blobstore.open_blob(blob)
+
+            # Complete identical jobs from the result cache without computing
+            # Hashed off the loop shared by the worker's in-flight jobs
+            cache_key = await asyncio.to_thread(result_cache.cache_key, operation, data)
+            with tracing.span("result_cache", phase_of=job_id):
+                cached = await result_cache.get(cache_key)
+            if cached is not None:
+                await update_job_status(job_id, JobStatus.SUCCESS, cached)
+                return {"status": "success", "result": cached["value"]}
+
+            # Simulate processing delay; cut short if the job is stopped
+            with tracing.span("delay", phase_of=job_id):
+                await cancelled.sleep(JOB_PROCESSING_DELAY)
 
-async def process_job_async(job_id: int, operation: str, data: list):
+            # Large inputs are split across workers and combined by a chord
+            if len(data) >= SHARD_MIN_ELEMENTS:
+                with tracing.span("dispatch_shards", phase_of=job_id):
+                    shards = await asyncio.to_thread(
+                        dispatch_shards, job_id, operation, data, blob, cache_key, deadline
+                    )
+                return {"status": "sharded", "shards": shards}
+
+            # Process the job with the registered kernel for the operation,
+            # off the loop so other in-flight jobs keep making progress.
+            # The kernel checks for cancellation between chunks.
+            with tracing.span("compute", phase_of=job_id, elements=len(data)):
+                result = await asyncio.to_thread(operations.compute, operation, data, cancelled=cancelled)
+
+            # Update job status to SUCCESS with result
+            await update_job_status(job_id, JobStatus.SUCCESS, {"value": result})
+            await result_cache.store(cache_key, {"value": result})
+            return {"status": "success", "result": result}
+
+        except operations.Cancelled:
+            if cancelled.status == JobStatus.EXPIRED:
+                return await expire_job(job_id)
+            # Already CANCELLED in the database
+            return {"status": "cancelled"}
+
+        except Exception as e:
+            # Update job status to FAILED with error
+            error_msg = str(e)
+            await update_job_status(job_id, JobStatus.FAILED, error=error_msg)
+            return {"status": "error", "error": error_msg}
+
+def dispatch_shards(job_id: int, operation: str, data, blob: str, cache_key: str, deadline: float = None) -> int:
+    """Fan ``data`` out to shard tasks whose partials are merged by
+    ``combine_shards``. Returns the number of shards."""
+    if blob is None:
+        # Shards read their slice from the blob store, not from the message
+        blob = blobstore.put(operations.as_array(data))
+
+    bounds = [
+        (start, min(start + SHARD_SIZE, len(data)))
+        for start in range(0, len(data), SHARD_SIZE)
+    ]
+    header = [
+        process_shard.s(job_id, operation, blob, start, stop, len(bounds), deadline)
+        for start, stop in bounds
+    ]
+    body = combine_shards.s(job_id=job_id, operation=operation, cache_key=cache_key)
+    chord(header)(body.on_error(shards_failed.s(job_id=job_id, deadline=deadline)))
+    return len(bounds)
+
+@celery_app.task(bind=True)
+def process_shard(self, job_id: int, operation: str, blob: str, start: int, stop: int, total: int, deadline: float = None):
+    with traced(self.request, f"shard.{start}", job_id):
+        return _process_shard(job_id, operation, blob, start, stop, total, deadline)
+
+def _process_shard(job_id: int, operation: str, blob: str, start: int, stop: int, total: int, deadline: float):
+    cancelled = cancellation.CancelToken(job_id, deadline)
+    if worker_loop.run(cancellation.is_requested(job_id)):
+        cancelled.cancel()
+    # A stopped job's remaining shards fail fast, which fails the chord
+    cancelled.check()
+    partial = operations.reduce_partial(
+        operation, blobstore.open_blob(blob)[start:stop], cancelled=cancelled
+    )
+    worker_loop.run(record_shard_done(job_id, total))
+    return partial
+
+async def record_shard_done(job_id: int, total: int):
+    key = f"job-shards:{job_id}"
     try:
-        # Update job status to IN_PROGRESS
-        await update_job_status(job_id, JobStatus.IN_PROGRESS)
-        
-        # Simulate processing delay
-        await asyncio.sleep(2)
-        
-        # Process the job based on operation
-        if operation == "square_sum":
-            result = sum(x**2 for x in data)
-        elif operation == "cube_sum":
-            result = sum(x**3 for x in data)
-        else:
-            raise ValueError(f"Unsupported operation: {operation}")
-        
-        # Update job status to SUCCESS with result
+        async with get_redis().pipeline(transaction=True) as pipe:
+            pipe.incr(key)
+            pipe.expire(key, 24 * 60 * 60)
+            done, _ = await pipe.execute()
+    except Exception as e:
+        # Progress is informational; never fail a shard over it
+        logger.warning("Failed to record shard progress for job %s: %s", job_id, e)
+        return
+    await update_job_status(job_id, JobStatus.IN_PROGRESS, progress={"done": done, "total": total})
+
+@celery_app.task(bind=True)
+def combine_shards(self, partials: list, job_id: int, operation: str, cache_key: str):
+    with traced(self.request, "combine_shards", job_id):
+        return worker_loop.run(combine_shards_async(partials, job_id, operation, cache_key))
+
+async def combine_shards_async(partials: list, job_id: int, operation: str, cache_key: str):
+    try:
+        result = operations.merge(operation, partials)
         await update_job_status(job_id, JobStatus.SUCCESS, {"value": result})
+        await result_cache.store(cache_key, {"value": result})
         return {"status": "success", "result": result}
-        
     except Exception as e:
-        # Update job status to FAILED with error
         error_msg = str(e)
         await update_job_status(job_id, JobStatus.FAILED, error=error_msg)
-        return {"status": "error", "error": error_msg}
\ No newline at end of file
+        return {"status": "error", "error": error_msg}
+
+@celery_app.task
+def shards_failed(request, exc, traceback, job_id: int, deadline: float = None):
+    if deadline is not None and time.time() >= deadline:
+        worker_loop.run(expire_job(job_id))
+        return
+    # Leaves a cancelled job CANCELLED; see update_job_status
+    worker_loop.run(update_job_status(job_id, JobStatus.FAILED, error=f"Shard failed: {exc}"))
+
+@celery_app.task
+def cleanup_old_jobs():
+    # Deletes expired jobs in throttled batches; see app.retention
+    return worker_loop.run(retention.cleanup_old_jobs())
+
+@celery_app.task
+def requeue_stale_jobs():
+    # Re-publishes jobs whose task message was lost; see app.outbox
+    return worker_loop.run(outbox.requeue_stale_jobs())
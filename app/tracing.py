@@ -0,0 +1,430 @@
+"""Trace propagation and per-job phase timelines.
+
+A trace follows a job from the HTTP request that created it to the worker
+that finished it:
+
+- ``TracingMiddleware`` opens a span per request, continuing the caller's
+  W3C ``traceparent`` header when there is one, and returns the trace in
+  the response's ``traceparent`` header.
+- ``outbox.add`` stores the current ``traceparent`` with each outbox row.
+  The dispatcher records the time the row waited as an ``outbox.wait``
+  span of the job's trace and publishes the task with the row's
+  ``traceparent`` as a Celery message header. Tasks published from inside
+  a span (e.g. shards) get the current one.
+- ``task_span`` continues the trace in the worker. It records the broker
+  transit (from the ``published_at`` header to the task starting) and
+  opens the task's span, under which ``process_job_async`` records its
+  phases.
+- Every SQL statement run by either engine inside a span gets a ``db``
+  span of its own.
+
+Finished spans are handed to the exporter named by ``TRACE_EXPORTER``
+(``none``, ``log``, ``memory``, ``file``, or ``module:Class`` of a
+``SpanExporter``) once the outermost span of the process ends, so a
+request or task is exported in one call.
+
+Spans opened with ``phase_of`` set to a job id are also kept as
+that job's timeline: a Redis list of ``[phase, start, seconds]`` entries
+at ``job-timeline:{id}`` kept for ``JOB_TIMELINE_TTL``, served by
+``GET /api/v1/jobs/{job_id}/timeline``. Timelines are recorded even when
+no exporter is configured; SQL spans are not.
+"""
+import contextvars
+import importlib
+import json
+import logging
+import os
+import re
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from celery.signals import before_task_publish
+from sqlalchemy import event
+
+from .db import engine, read_engine
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Where finished spans go: none, log, memory, file, or module:Class
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "none")
+
+# File the ``file`` exporter appends spans to, one JSON object per line
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+
+# SQL text kept on db spans, in characters
+TRACE_SQL_MAX_LENGTH = int(os.getenv("TRACE_SQL_MAX_LENGTH", "500"))
+
+# Seconds a job's phase timeline is kept
+JOB_TIMELINE_TTL = int(os.getenv("JOB_TIMELINE_TTL", str(7 * 24 * 60 * 60)))
+
+TIMELINE_KEY_PREFIX = "job-timeline:"
+TRACE_KEY_PREFIX = "job-trace:"
+
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+
+@dataclass
+class Span:
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    name: str
+    start: float
+    end: Optional[float] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+    # Job the span is a timeline phase of
+    phase_of: Any = None
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    @property
+    def duration(self) -> Optional[float]:
+        return None if self.end is None else self.end - self.start
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def as_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data.pop("phase_of")
+        return data
+
+
+class SpanExporter:
+    """Receives finished spans; subclass and name it in ``TRACE_EXPORTER``."""
+
+    def export(self, spans: List[Span]) -> None:
+        raise NotImplementedError
+
+    def shutdown(self) -> None:
+        pass
+
+
+class NoopExporter(SpanExporter):
+    def export(self, spans: List[Span]) -> None:
+        pass
+
+
+class LoggingExporter(SpanExporter):
+    def export(self, spans: List[Span]) -> None:
+        for span in spans:
+            logger.info("span %s", json.dumps(span.as_dict(), default=str))
+
+
+class InMemoryExporter(SpanExporter):
+    """Keeps every exported span; for tests."""
+
+    def __init__(self):
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def export(self, spans: List[Span]) -> None:
+        with self._lock:
+            self.spans.extend(spans)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.spans.clear()
+
+
+class FileExporter(SpanExporter):
+    """Appends spans as JSON lines to ``path``."""
+
+    def __init__(self, path: str = TRACE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans: List[Span]) -> None:
+        lines = "".join(json.dumps(span.as_dict(), default=str) + "\n" for span in spans)
+        with self._lock, open(self.path, "a") as f:
+            f.write(lines)
+
+
+_EXPORTERS = {
+    "none": NoopExporter,
+    "log": LoggingExporter,
+    "memory": InMemoryExporter,
+    "file": FileExporter,
+}
+
+
+def _load_exporter(name: str) -> SpanExporter:
+    if name in _EXPORTERS:
+        return _EXPORTERS[name]()
+    module, _, attribute = name.partition(":")
+    return getattr(importlib.import_module(module), attribute)()
+
+
+exporter: SpanExporter = _load_exporter(TRACE_EXPORTER)
+
+
+def set_exporter(new_exporter: SpanExporter) -> SpanExporter:
+    """Replace the exporter; returns the previous one."""
+    global exporter
+    previous, exporter = exporter, new_exporter
+    return previous
+
+
+def recording() -> bool:
+    """Whether spans beyond the job phases are worth creating."""
+    return not isinstance(exporter, NoopExporter)
+
+
+_current: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("trace_span", default=None)
+# Finished spans of the current local trace, exported when its outermost span ends
+_finished: contextvars.ContextVar[Optional[List[Span]]] = contextvars.ContextVar("trace_finished", default=None)
+# Timeline entries of the current local trace, as (job_id, trace_id, entry)
+_timeline: contextvars.ContextVar[Optional[List[Tuple[int, str, list]]]] = contextvars.ContextVar(
+    "trace_timeline", default=None
+)
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[Tuple[str, str]]:
+    """``(trace_id, span_id)`` of a W3C ``traceparent`` header, or None."""
+    match = _TRACEPARENT.match(value or "")
+    if match is None or match.group(1) == "0" * 32:
+        return None
+    return match.group(1), match.group(2)
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+def current_traceparent() -> Optional[str]:
+    span = _current.get()
+    return None if span is None else span.traceparent
+
+
+def _new_span(name: str, parent: Optional[str], start: float, attributes: Dict[str, Any]) -> Span:
+    local = _current.get()
+    if parent is not None and (remote := parse_traceparent(parent)) is not None:
+        trace_id, parent_id = remote
+    elif local is not None:
+        trace_id, parent_id = local.trace_id, local.span_id
+    else:
+        trace_id, parent_id = secrets.token_hex(16), None
+    return Span(trace_id, secrets.token_hex(8), parent_id, name, start, attributes=attributes)
+
+
+def _finish(span: Span) -> None:
+    if span.phase_of is not None:
+        job_ids = span.phase_of if isinstance(span.phase_of, (list, tuple)) else [span.phase_of]
+        entries = _timeline.get()
+        if entries is not None:
+            entry = [span.name, round(span.start, 3), round(span.duration, 4)]
+            entries.extend((job_id, span.trace_id, entry) for job_id in job_ids)
+    finished = _finished.get()
+    if finished is not None:
+        finished.append(span)
+    else:
+        # Recorded outside any span, e.g. by the outbox dispatcher
+        _export([span])
+
+
+def record_span(
+    name: str,
+    start: float,
+    end: float,
+    parent: Optional[str] = None,
+    phase_of: Any = None,
+    **attributes: Any,
+) -> Span:
+    """Record a span that has already happened, e.g. time spent in a queue."""
+    span = _new_span(name, parent, start, attributes)
+    span.end = end
+    span.phase_of = phase_of
+    _finish(span)
+    return span
+
+
+@contextmanager
+def span(name: str, parent: Optional[str] = None, phase_of: Any = None, **attributes: Any) -> Iterator[Span]:
+    """Time the block as a span, child of ``parent`` or of the current span.
+
+    ``phase_of`` (a job id, or a list of them) also records the span in
+    those jobs' timelines; it may be set on the span inside the block.
+    """
+    new = _new_span(name, parent, time.time(), attributes)
+    new.phase_of = phase_of
+    outermost = _finished.get() is None
+    current_token = _current.set(new)
+    finished_token = _finished.set([]) if outermost else None
+    try:
+        yield new
+    except BaseException as e:
+        new.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        new.end = time.time()
+        _finish(new)
+        _current.reset(current_token)
+        if finished_token is not None:
+            _export(_finished.get())
+            _finished.reset(finished_token)
+
+
+def _export(spans: List[Span]) -> None:
+    if not spans or not recording():
+        return
+    try:
+        exporter.export(spans)
+    except Exception as e:
+        logger.warning("Failed to export %d spans: %s", len(spans), e)
+
+
+@contextmanager
+def timeline() -> Iterator[List[Tuple[int, str, list]]]:
+    """Collect the timeline entries recorded in the block, for ``save_timeline``."""
+    entries: List[Tuple[int, str, list]] = []
+    token = _timeline.set(entries)
+    try:
+        yield entries
+    finally:
+        _timeline.reset(token)
+
+
+async def save_timeline(entries: Iterable[Tuple[int, str, list]]) -> None:
+    """Append timeline entries to their jobs' timelines. Never raises."""
+    entries = list(entries)
+    if not entries:
+        return
+    try:
+        async with get_redis().pipeline(transaction=False) as pipe:
+            for job_id, trace_id, entry in entries:
+                pipe.rpush(f"{TIMELINE_KEY_PREFIX}{job_id}", json.dumps(entry, separators=(",", ":")))
+                # The first trace seen for a job is the one that created it
+                pipe.set(f"{TRACE_KEY_PREFIX}{job_id}", trace_id, ex=JOB_TIMELINE_TTL, nx=True)
+            for job_id in {job_id for job_id, _, _ in entries}:
+                pipe.expire(f"{TIMELINE_KEY_PREFIX}{job_id}", JOB_TIMELINE_TTL)
+            await pipe.execute()
+    except Exception as e:
+        logger.debug("Failed to save job timelines: %s", e)
+
+
+async def get_timeline(job_id: int) -> Tuple[Optional[str], List[Dict[str, Any]]]:
+    """Trace id and phases (sorted by start) recorded for ``job_id``."""
+    async with get_redis().pipeline(transaction=False) as pipe:
+        pipe.get(f"{TRACE_KEY_PREFIX}{job_id}")
+        pipe.lrange(f"{TIMELINE_KEY_PREFIX}{job_id}", 0, -1)
+        trace_id, raw = await pipe.execute()
+    phases = []
+    for item in raw:
+        phase, start, seconds = json.loads(item)
+        phases.append({"phase": phase, "start": start, "seconds": seconds})
+    # Enclosing phases first when they start together
+    phases.sort(key=lambda phase: (phase["start"], -phase["seconds"]))
+    return (trace_id.decode() if isinstance(trace_id, bytes) else trace_id), phases
+
+
+def _header(request, name: str) -> Any:
+    # Workers expose custom message headers as request attributes; eager
+    # execution only passes them in ``request.headers``
+    value = getattr(request, name, None)
+    if value is None:
+        value = (getattr(request, "headers", None) or {}).get(name)
+    return value
+
+
+@contextmanager
+def task_span(request, name: str, job_id: Optional[int] = None) -> Iterator[Span]:
+    """Continue the trace of the Celery task ``request`` for the block.
+
+    The time from publishing to starting the task is recorded first as a
+    ``broker.transit`` span.
+    """
+    parent = _header(request, "traceparent")
+    now = time.time()
+    published_at = _header(request, "published_at")
+    with span(name, parent=parent, phase_of=job_id, task_id=request.id) as task:
+        if published_at is not None:
+            record_span(
+                "broker.transit", min(published_at, now), now, parent=parent, phase_of=job_id,
+                queue=(request.delivery_info or {}).get("routing_key"),
+            )
+        yield task
+
+
+class TracingMiddleware:
+    """ASGI middleware opening a span per HTTP request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or ())
+        parent = headers.get(b"traceparent", b"").decode("latin-1") or None
+
+        with timeline() as entries:
+            with span(f"{scope['method']} {scope['path']}", parent=parent) as request_span:
+                async def send_wrapper(message):
+                    if message["type"] == "http.response.start":
+                        request_span.set(status=message["status"])
+                        message.setdefault("headers", [])
+                        message["headers"] = [
+                            *message["headers"], (b"traceparent", request_span.traceparent.encode())
+                        ]
+                    await send(message)
+
+                try:
+                    await self.app(scope, receive, send_wrapper)
+                finally:
+                    route = scope.get("route")
+                    if route is not None:
+                        # Name by template, not raw path, like the metrics
+                        request_span.name = f"{scope['method']} {route.path}"
+            await save_timeline(entries)
+
+
+def instrument_engine(engine) -> None:
+    """Record a span for every SQL statement run inside a span."""
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if not recording() or _current.get() is None:
+            return
+        context._trace_span = _new_span(
+            "db", None, time.time(),
+            {"db.statement": statement[:TRACE_SQL_MAX_LENGTH], "db.executemany": executemany},
+        )
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        db_span = getattr(context, "_trace_span", None)
+        if db_span is not None:
+            db_span.end = time.time()
+            db_span.set(**{"db.rows": cursor.rowcount})
+            _finish(db_span)
+            context._trace_span = None
+
+    @event.listens_for(engine.sync_engine, "handle_error")
+    def _error(exception_context):
+        db_span = getattr(exception_context.execution_context, "_trace_span", None)
+        if db_span is not None:
+            db_span.end = time.time()
+            db_span.error = str(exception_context.original_exception)
+            _finish(db_span)
+
+
+instrument_engine(engine)
+if read_engine is not engine:
+    instrument_engine(read_engine)
+
+
+@before_task_publish.connect
+def _inject_traceparent(headers=None, **kwargs):
+    traceparent = current_traceparent()
+    if headers is not None and traceparent is not None:
+        headers.setdefault("traceparent", traceparent)
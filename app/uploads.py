@@ -0,0 +1,172 @@
+"""Parsers for non-JSON job uploads.
+
+``POST /api/v1/jobs/`` accepts these bodies in addition to JSON:
+
+- ``application/octet-stream``: raw little-endian float64 values;
+- ``application/msgpack``: a map with ``data`` (a bin of little-endian
+  float64, or an array of numbers) and optionally ``operation``;
+- ``application/x-ndjson``: one number or JSON array of numbers per line,
+  typically sent with chunked transfer encoding.
+
+Bodies are consumed from the request stream chunk by chunk into a float64
+array, without building a Python float per element for the binary formats.
+They get the same checks as JSON uploads: at most ``JOB_MAX_ELEMENTS``
+values, all finite.
+"""
+import json
+from array import array
+from typing import AsyncIterator, Optional, Tuple
+
+import msgpack
+import numpy as np
+
+from .schemas import JOB_MAX_ELEMENTS
+
+OCTET_STREAM = "application/octet-stream"
+MSGPACK_TYPES = ("application/msgpack", "application/x-msgpack")
+NDJSON_TYPES = ("application/x-ndjson", "application/ndjson")
+CONTENT_TYPES = (OCTET_STREAM, *MSGPACK_TYPES, *NDJSON_TYPES)
+
+MAX_BYTES = JOB_MAX_ELEMENTS * 8
+
+# msgpack type bytes for bin and array values
+_MSGPACK_BIN = (0xC4, 0xC5, 0xC6)
+_MSGPACK_ARRAY = (*range(0x90, 0xA0), 0xDC, 0xDD)
+
+
+class UploadError(ValueError):
+    def __init__(self, message: str, status_code: int = 422):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _too_large() -> UploadError:
+    return UploadError(f"Upload exceeds {JOB_MAX_ELEMENTS} values", status_code=413)
+
+
+def _check_values(values: np.ndarray) -> np.ndarray:
+    if len(values) > JOB_MAX_ELEMENTS:
+        raise _too_large()
+    if not np.isfinite(values).all():
+        raise UploadError("Data must contain only finite numbers")
+    return values
+
+
+def _append_number(out: array, value) -> None:
+    # bool is an int subclass but not a valid data point
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise UploadError(f"Invalid data value: {value!r}")
+    try:
+        out.append(value)
+    except OverflowError:
+        # An integer literal beyond the float64 range
+        raise UploadError("Data must contain only finite numbers") from None
+
+
+async def _read_body(chunks: AsyncIterator[bytes]) -> bytearray:
+    body = bytearray()
+    async for chunk in chunks:
+        body += chunk
+        if len(body) > MAX_BYTES:
+            raise _too_large()
+    return body
+
+
+def _float64_view(buffer) -> np.ndarray:
+    if len(buffer) % 8:
+        raise UploadError("Binary data length must be a multiple of 8 bytes")
+    return np.frombuffer(buffer, dtype="<f8")
+
+
+async def read_octet_stream(chunks: AsyncIterator[bytes]) -> np.ndarray:
+    return _check_values(_float64_view(await _read_body(chunks)))
+
+
+async def read_ndjson(chunks: AsyncIterator[bytes]) -> np.ndarray:
+    out = array("d")
+    pending = bytearray()
+    async for chunk in chunks:
+        lines = chunk.split(b"\n")
+        # The last piece may be an incomplete line; keep it for the next chunk
+        pending += lines[0]
+        if len(lines) > 1:
+            _parse_ndjson_line(pending, out)
+            for line in lines[1:-1]:
+                _parse_ndjson_line(line, out)
+            pending = bytearray(lines[-1])
+        if len(out) > JOB_MAX_ELEMENTS or len(pending) > MAX_BYTES:
+            raise _too_large()
+    _parse_ndjson_line(pending, out)
+    return _check_values(np.frombuffer(out, dtype=np.float64))
+
+
+def _parse_ndjson_line(line: bytes, out: array) -> None:
+    line = bytes(line).strip()
+    if not line:
+        return
+    try:
+        value = json.loads(line)
+    except ValueError:
+        raise UploadError(f"Invalid NDJSON line: {line[:50]!r}") from None
+    if isinstance(value, list):
+        for item in value:
+            _append_number(out, item)
+    else:
+        _append_number(out, value)
+
+
+async def read_msgpack(chunks: AsyncIterator[bytes]) -> Tuple[Optional[str], np.ndarray]:
+    body = bytes(await _read_body(chunks))
+    unpacker = msgpack.Unpacker(
+        raw=False, max_buffer_size=max(len(body), 1), max_array_len=JOB_MAX_ELEMENTS
+    )
+    unpacker.feed(body)
+
+    operation, values = None, None
+    try:
+        for _ in range(unpacker.read_map_header()):
+            key = unpacker.unpack()
+            if key == "operation":
+                operation = unpacker.unpack()
+            elif key == "data":
+                values = _read_msgpack_data(unpacker, body)
+            else:
+                unpacker.skip()
+    except (msgpack.UnpackException, ValueError) as e:
+        if isinstance(e, UploadError):
+            raise
+        raise UploadError(f"Invalid msgpack body: {e}") from None
+
+    if values is None:
+        raise UploadError("msgpack body must contain 'data'")
+    return operation, _check_values(values)
+
+
+def _read_msgpack_data(unpacker: msgpack.Unpacker, body: bytes) -> np.ndarray:
+    if unpacker.tell() >= len(body):
+        raise UploadError("msgpack 'data' has no value")
+    type_byte = body[unpacker.tell()]
+    if type_byte in _MSGPACK_BIN:
+        # Packed float64: view the bytes as an array without converting each value
+        return _float64_view(unpacker.unpack())
+    if type_byte in _MSGPACK_ARRAY:
+        out = array("d")
+        for _ in range(unpacker.read_array_header()):
+            _append_number(out, unpacker.unpack())
+        return np.frombuffer(out, dtype=np.float64)
+    raise UploadError("msgpack 'data' must be a bin of float64 or an array of numbers")
+
+
+def media_type(content_type: Optional[str]) -> str:
+    return (content_type or "application/json").split(";")[0].strip().lower()
+
+
+async def parse(content_type: str, chunks: AsyncIterator[bytes]) -> Tuple[Optional[str], np.ndarray]:
+    """Parse a non-JSON upload, returning ``(operation or None, values)``."""
+    if content_type == OCTET_STREAM:
+        return None, await read_octet_stream(chunks)
+    if content_type in NDJSON_TYPES:
+        return None, await read_ndjson(chunks)
+    if content_type in MSGPACK_TYPES:
+        return await read_msgpack(chunks)
+    raise UploadError(f"Unsupported content type: {content_type}", status_code=415)
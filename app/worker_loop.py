@@ -0,0 +1,117 @@
+"""Long-lived event loop for running job coroutines from Celery tasks.
+
+Celery task bodies are synchronous. Rather than driving a fresh
+``run_until_complete`` per task, each worker process owns one event loop
+running in a background thread. Tasks submit their coroutine to that loop
+and block until it finishes, so the engine and connection pool in
+``app.db`` stay bound to a single loop for the life of the process.
+
+With the threads pool (``--pool=threads --concurrency=N``) up to N tasks
+wait on the loop at once and their coroutines interleave at every
+``await``. ``WORKER_MAX_IN_FLIGHT`` caps how many run concurrently; the worker
+autoscaler (``app.autoscale``) moves that cap with ``set_max_in_flight``.
+"""
+import asyncio
+import os
+import threading
+from typing import Any, Coroutine, Optional
+
+# Maximum number of job coroutines running on the loop at the same time
+MAX_IN_FLIGHT = int(os.getenv("WORKER_MAX_IN_FLIGHT", "64"))
+
+_lock = threading.Lock()
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_thread: Optional[threading.Thread] = None
+_limiter: Optional["_Limiter"] = None
+# Cap set by set_max_in_flight; MAX_IN_FLIGHT applies while it is None
+_max_in_flight: Optional[int] = None
+
+
+class _Limiter:
+    """Semaphore whose limit can change while jobs hold it."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self._changed = asyncio.Condition()
+
+    async def __aenter__(self) -> None:
+        async with self._changed:
+            await self._changed.wait_for(lambda: self.active < self.limit)
+            self.active += 1
+
+    async def __aexit__(self, *exc_info) -> None:
+        async with self._changed:
+            self.active -= 1
+            self._changed.notify()
+
+    async def set_limit(self, limit: int) -> None:
+        async with self._changed:
+            # Lowering the limit lets running jobs finish; raising it admits waiters now
+            self.limit = limit
+            self._changed.notify_all()
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """Return this process's job loop, starting it on first use."""
+    global _loop, _thread, _limiter
+    with _lock:
+        if _loop is None or _loop.is_closed():
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(
+                target=loop.run_forever, name="job-event-loop", daemon=True
+            )
+            thread.start()
+            _loop, _thread = loop, thread
+            _limiter = _Limiter(_max_in_flight or MAX_IN_FLIGHT)
+        return _loop
+
+
+async def _bounded(coro: Coroutine) -> Any:
+    async with _limiter:
+        return await coro
+
+
+def run(coro: Coroutine, timeout: Optional[float] = None) -> Any:
+    """Run ``coro`` on the job loop and block the calling thread for its result."""
+    loop = get_loop()
+    future = asyncio.run_coroutine_threadsafe(_bounded(coro), loop)
+    return future.result(timeout)
+
+
+def set_max_in_flight(limit: int) -> None:
+    """Change how many job coroutines may run at once; safe from any thread."""
+    global _max_in_flight
+    with _lock:
+        _max_in_flight = limit
+        loop, limiter = _loop, _limiter
+    if loop is not None and not loop.is_closed():
+        asyncio.run_coroutine_threadsafe(limiter.set_limit(limit), loop)
+
+
+def is_started() -> bool:
+    return _loop is not None and not _loop.is_closed()
+
+
+def shutdown(timeout: float = 5.0) -> None:
+    """Stop the job loop and wait for its thread to exit."""
+    global _loop, _thread, _limiter
+    with _lock:
+        loop, thread = _loop, _thread
+        _loop = _thread = _limiter = None
+    if loop is None:
+        return
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(timeout)
+    if not loop.is_running():
+        loop.close()
+
+
+def _reset_after_fork() -> None:
+    # The loop thread does not survive fork; the child starts its own on demand
+    global _lock, _loop, _thread, _limiter, _max_in_flight
+    _lock = threading.Lock()
+    _loop = _thread = _limiter = _max_in_flight = None
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,149 @@
+"""Write-behind buffering of job state transitions.
+
+With ``JOB_STATE_WRITE_BEHIND=true``, ``update_job_status`` does not open a
+transaction per transition. It records the new state in the job state
+cache (see ``status_cache.put_pending``) so readers see it at once, and
+hands it to the worker's ``buffer``, which writes every buffered
+transition in one bulk UPDATE by primary key every
+``JOB_STATE_FLUSH_INTERVAL`` seconds.
+
+- Transitions of the same job that are still buffered coalesce: only the
+  latest is written, so a fast job's IN_PROGRESS and SUCCESS cost one row
+  update, as do bursts of shard progress.
+- A single flusher writes batches one after another, so a job's states
+  reach the database in the order they were made.
+- Terminal transitions wait for their flush before the task returns, and
+  the buffer is flushed when the worker shuts down. Failed flushes are
+  retried; transitions made since take precedence over the retried ones.
+"""
+import asyncio
+import logging
+import os
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import select, update
+
+from . import metrics, status_cache
+from .db import Job, JobStatus, TERMINAL_STATUSES, async_session_maker
+
+logger = logging.getLogger(__name__)
+
+# How long transitions are gathered before a flush, in seconds
+FLUSH_INTERVAL = float(os.getenv("JOB_STATE_FLUSH_INTERVAL", "0.005"))
+
+# Most transitions written by one flush
+FLUSH_BATCH_SIZE = int(os.getenv("JOB_STATE_FLUSH_BATCH_SIZE", "500"))
+
+# Pause before retrying a failed flush, in seconds
+RETRY_DELAY = 1.0
+
+
+async def _write(batch: List[Tuple[int, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """Apply ``batch`` in one transaction; returns snapshots of the written rows."""
+    async with async_session_maker() as session:
+        # ORM bulk UPDATE by primary key: one executemany for the whole batch.
+        # Jobs finished, cancelled or expired meanwhile keep that state (no IN
+        # list, which cannot be expanded in an executemany).
+        await session.execute(
+            update(Job).where(*(Job.status != status for status in sorted(TERMINAL_STATUSES))),
+            [{"id": job_id, **values} for job_id, values in batch],
+            # The session holds no Job objects to keep in sync
+            execution_options={"synchronize_session": None},
+        )
+        rows = (await session.execute(
+            select(*status_cache.COLUMNS).where(Job.id.in_([job_id for job_id, _ in batch]))
+        )).all()
+        await session.commit()
+    return [row._asdict() for row in rows]
+
+
+class StateBuffer:
+    """Coalesces job state transitions and writes them in batches."""
+
+    def __init__(self, flush_interval: float = FLUSH_INTERVAL, batch_size: int = FLUSH_BATCH_SIZE):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        # Latest unwritten values per job, in the order jobs were first buffered
+        self._pending: Dict[int, Dict[str, Any]] = {}
+        self._flushed: Dict[int, List[asyncio.Future]] = defaultdict(list)
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def put(self, job_id: int, status: JobStatus, result: Optional[dict]) -> asyncio.Future:
+        """Buffer a transition; the returned future resolves once it is written."""
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.get_loop() is not loop:
+            # First use, or the job loop was replaced (e.g. after fork)
+            self._wake = asyncio.Event()
+            self._task = loop.create_task(self._run())
+        self._pending[job_id] = {"status": status, "result": result}
+        flushed = loop.create_future()
+        self._flushed[job_id].append(flushed)
+        self._wake.set()
+        return flushed
+
+    async def flush(self) -> bool:
+        """Write up to one batch; returns False if the write failed."""
+        job_ids = list(self._pending)[:self.batch_size]
+        batch = [(job_id, self._pending.pop(job_id)) for job_id in job_ids]
+        waiters = {job_id: self._flushed.pop(job_id, []) for job_id in job_ids}
+        if not batch:
+            return True
+        try:
+            rows = await _write(batch)
+        except BaseException as e:
+            # Put the batch back unless the job has moved on since
+            for job_id, values in batch:
+                self._pending.setdefault(job_id, values)
+                self._flushed[job_id][:0] = waiters[job_id]
+            if not isinstance(e, Exception):
+                raise
+            logger.warning("Failed to write %d buffered job states: %s", len(batch), e)
+            return False
+
+        for job_id in job_ids:
+            for flushed in waiters[job_id]:
+                if not flushed.done():
+                    flushed.set_result(None)
+        for row in rows:
+            metrics.observe_transition(row["id"], row["status"], row["created_at"])
+        # Jobs with newer buffered states keep serving those from the cache
+        written = [row for row in rows if row["id"] not in self._pending]
+        await status_cache.put_many(written)
+        await status_cache.clear_pending(row["id"] for row in written)
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            await self._wake.wait()
+            # Gather the transitions made meanwhile into the same flush
+            await asyncio.sleep(self.flush_interval)
+            self._wake.clear()
+            while self._pending:
+                if not await self.flush():
+                    await asyncio.sleep(RETRY_DELAY)
+
+    async def stop(self, attempts: int = 3) -> None:
+        """Stop the flusher and write everything still buffered."""
+        if self._task is not None:
+            self._task.cancel()
+            if self._task.get_loop() is asyncio.get_running_loop():
+                try:
+                    await self._task
+                except asyncio.CancelledError:
+                    pass
+            self._task = None
+        failures = 0
+        while self._pending and failures < attempts:
+            if not await self.flush():
+                failures += 1
+                await asyncio.sleep(RETRY_DELAY)
+        if self._pending:
+            logger.error("Lost %d buffered job states at shutdown", len(self._pending))
+
+
+buffer = StateBuffer()
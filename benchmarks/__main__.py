@@ -0,0 +1,88 @@
+"""Command-line entry point.
+
+Run the benchmarks and write a result file::
+
+    python -m benchmarks run --sizes 10,10000 --concurrency 1,16 -o results.json
+
+Compare two result files; exits with status 1 on a regression::
+
+    python -m benchmarks compare baseline.json results.json --threshold 0.15
+"""
+import argparse
+import asyncio
+import sys
+
+from . import report
+
+
+def _int_list(value: str):
+    return [int(item) for item in value.split(",") if item]
+
+
+def run(args) -> int:
+    from . import standins
+
+    # Must happen before the app is imported by the harness
+    workdir = standins.configure(args.workdir)
+    from . import harness
+
+    results = asyncio.run(harness.run(args.sizes, args.concurrency, args.requests))
+    report.write(args.output, results, {
+        "sizes": args.sizes,
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+        "workdir": workdir,
+    })
+    for result in results:
+        latency = result.get("latency_ms", {})
+        print(
+            f"{result['scenario']:<11} size={str(result['size']):<8} "
+            f"concurrency={result['concurrency']:<4} throughput={result['throughput']}/s "
+            f"p50={latency.get('p50', '-')}ms p99={latency.get('p99', '-')}ms"
+        )
+    print(f"Wrote {args.output}")
+    return 0
+
+
+def compare(args) -> int:
+    rows = report.compare(report.load(args.baseline), report.load(args.current), args.threshold)
+    regressions = [row for row in rows if row["regression"]]
+    for row in rows:
+        marker = "REGRESSION" if row["regression"] else "ok"
+        print(
+            f"{marker:<10} {row['scenario']:<11} size={str(row['size']):<8} "
+            f"concurrency={row['concurrency']:<4} {row['metric']:<15} "
+            f"{row['baseline']} -> {row['current']} ({row['change']:+.1%})"
+        )
+    print(f"{len(regressions)} regression(s) in {len(rows)} comparison(s)")
+    return 1 if regressions else 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run the benchmark suite")
+    run_parser.add_argument("--sizes", type=_int_list, default=[10, 10000],
+                            help="Comma-separated input sizes (values per job)")
+    run_parser.add_argument("--concurrency", type=_int_list, default=[1, 16],
+                            help="Comma-separated client and worker concurrency levels")
+    run_parser.add_argument("--requests", type=int, default=200,
+                            help="Requests or jobs per scenario")
+    run_parser.add_argument("--workdir", help="Directory for the SQLite database and blobs")
+    run_parser.add_argument("-o", "--output", default="benchmark-results.json")
+    run_parser.set_defaults(func=run)
+
+    compare_parser = commands.add_parser("compare", help="Compare two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.1,
+                                help="Allowed fraction by which a metric may get worse")
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+"""Benchmark scenarios.
+
+Each scenario drives the ASGI app in-process through ``httpx`` and returns
+one result dict. Latencies are in milliseconds, rates per second.
+"""
+import asyncio
+import time
+from typing import Any, Dict, List, Sequence
+
+import httpx
+import numpy as np
+
+from . import standins
+from .report import summarize
+
+JOBS_URL = "/api/v1/jobs/"
+
+
+# One seeded generator for the whole run: inputs are reproducible between
+# runs but never repeat within one, so no job is served from the result cache
+_rng = np.random.default_rng(0)
+
+
+def _payload(size: int) -> bytes:
+    return _rng.random(size).tobytes()
+
+
+async def _run_concurrently(concurrency: int, count: int, call) -> List[float]:
+    """Call ``call(i)`` ``count`` times from ``concurrency`` clients; return latencies."""
+    latencies: List[float] = []
+    next_index = iter(range(count))
+
+    async def client():
+        for i in next_index:
+            started = time.perf_counter()
+            await call(i)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return latencies
+
+
+async def _outbox_drained() -> None:
+    """Wait until the outbox dispatcher has published every submitted job."""
+    from sqlalchemy import func, select
+
+    from app.db import JobOutbox, async_session_maker
+
+    while True:
+        async with async_session_maker() as session:
+            if not await session.scalar(select(func.count()).select_from(JobOutbox)):
+                return
+        await asyncio.sleep(0.01)
+
+
+async def _submit(client: httpx.AsyncClient, body: bytes) -> int:
+    response = await client.post(
+        JOBS_URL,
+        params={"operation": "square_sum"},
+        content=body,
+        headers={"content-type": "application/octet-stream"},
+    )
+    response.raise_for_status()
+    return response.json()["id"]
+
+
+async def bench_submit(client, size: int, concurrency: int, requests: int) -> Dict[str, Any]:
+    """Job submissions per second, with no worker consuming the queue."""
+    bodies = [_payload(size) for _ in range(requests)]
+    job_ids: List[int] = []
+
+    async def call(i):
+        job_ids.append(await _submit(client, bodies[i]))
+
+    started = time.perf_counter()
+    latencies = await _run_concurrently(concurrency, requests, call)
+    elapsed = time.perf_counter() - started
+    await _outbox_drained()
+    standins.purge_queues()
+    result = summarize("submit", size, concurrency, latencies, elapsed)
+    result["job_ids"] = job_ids
+    return result
+
+
+async def bench_status(client, job_ids: Sequence[int], size: int, concurrency: int, requests: int) -> Dict[str, Any]:
+    """Status lookups per second over existing jobs of ``size`` values."""
+    async def call(i):
+        response = await client.get(f"{JOBS_URL}{job_ids[i % len(job_ids)]}/status")
+        response.raise_for_status()
+
+    started = time.perf_counter()
+    latencies = await _run_concurrently(concurrency, requests, call)
+    return summarize("status", size, concurrency, latencies, time.perf_counter() - started)
+
+
+async def bench_end_to_end(client, size: int, concurrency: int, requests: int) -> Dict[str, Any]:
+    """Latency from submission until the result is available, with a worker running."""
+    bodies = [_payload(size) for _ in range(requests)]
+
+    async def call(i):
+        job_id = await _submit(client, bodies[i])
+        while True:
+            response = await client.get(f"{JOBS_URL}{job_id}/result", params={"wait": 30})
+            # 400: the wait ran out before the job reached a terminal status
+            if response.status_code != 400:
+                response.raise_for_status()
+                return
+
+    with standins.worker(concurrency):
+        started = time.perf_counter()
+        latencies = await _run_concurrently(concurrency, requests, call)
+        elapsed = time.perf_counter() - started
+    return summarize("end_to_end", size, concurrency, latencies, elapsed)
+
+
+async def bench_worker(client, size: int, concurrency: int, jobs: int) -> Dict[str, Any]:
+    """Jobs completed per second by a worker draining a pre-filled queue."""
+    from sqlalchemy import func, select
+
+    from app.db import TERMINAL_STATUSES, Job, async_session_maker
+
+    job_ids = [await _submit(client, _payload(size)) for _ in range(jobs)]
+    await _outbox_drained()
+
+    async def finished() -> int:
+        async with async_session_maker() as session:
+            return await session.scalar(
+                select(func.count())
+                .select_from(Job)
+                .where(Job.id.in_(job_ids), Job.status.in_(TERMINAL_STATUSES))
+            )
+
+    with standins.worker(concurrency):
+        started = time.perf_counter()
+        while await finished() < jobs:
+            await asyncio.sleep(0.01)
+        elapsed = time.perf_counter() - started
+    return summarize("worker", size, concurrency, [], elapsed, count=jobs)
+
+
+async def run(sizes: Sequence[int], concurrency: Sequence[int], requests: int) -> List[Dict[str, Any]]:
+    from app.main import app
+
+    results = []
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for size in sizes:
+                for level in concurrency:
+                    submitted = await bench_submit(client, size, level, requests)
+                    job_ids = submitted.pop("job_ids")
+                    results.append(submitted)
+                    results.append(await bench_status(client, job_ids, size, level, requests))
+                    results.append(await bench_end_to_end(client, size, level, requests))
+                    results.append(await bench_worker(client, size, level, requests))
+    return results
@@ -0,0 +1,119 @@
+"""Benchmark result files and regression comparison."""
+import json
+import platform
+import subprocess
+import sys
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Metrics compared between runs; True when higher is better
+COMPARED_METRICS = {
+    "throughput": True,
+    "latency_ms.p50": False,
+    "latency_ms.p99": False,
+}
+
+
+def summarize(
+    scenario: str,
+    size: Optional[int],
+    concurrency: int,
+    latencies: Sequence[float],
+    elapsed: float,
+    count: Optional[int] = None,
+) -> Dict[str, Any]:
+    count = len(latencies) if count is None else count
+    result = {
+        "scenario": scenario,
+        "size": size,
+        "concurrency": concurrency,
+        "count": count,
+        "elapsed_s": round(elapsed, 4),
+        "throughput": round(count / elapsed, 2) if elapsed > 0 else None,
+    }
+    if len(latencies):
+        p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+        result["latency_ms"] = {
+            "p50": round(float(p50), 3),
+            "p90": round(float(p90), 3),
+            "p99": round(float(p99), 3),
+            "max": round(float(max(latencies)), 3),
+        }
+    return result
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write(path: str, results: List[Dict[str, Any]], params: Dict[str, Any]) -> None:
+    document = {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "commit": _git_commit(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "params": params,
+        },
+        "results": results,
+    }
+    with open(path, "w") as f:
+        json.dump(document, f, indent=2)
+
+
+def load(path: str) -> List[Dict[str, Any]]:
+    with open(path) as f:
+        return json.load(f)["results"]
+
+
+def _metric(result: Dict[str, Any], name: str) -> Optional[float]:
+    value: Any = result
+    for part in name.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def _key(result: Dict[str, Any]) -> Tuple:
+    return result["scenario"], result["size"], result["concurrency"]
+
+
+def compare(
+    baseline: List[Dict[str, Any]], current: List[Dict[str, Any]], threshold: float
+) -> List[Dict[str, Any]]:
+    """Compare matching results and flag changes worse than ``threshold``.
+
+    ``threshold`` is a fraction, e.g. 0.1 flags metrics that are more than
+    10% worse than the baseline.
+    """
+    previous = {_key(result): result for result in baseline}
+    rows = []
+    for result in current:
+        before = previous.get(_key(result))
+        if before is None:
+            continue
+        for name, higher_is_better in COMPARED_METRICS.items():
+            old, new = _metric(before, name), _metric(result, name)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            rows.append({
+                "scenario": result["scenario"],
+                "size": result["size"],
+                "concurrency": result["concurrency"],
+                "metric": name,
+                "baseline": old,
+                "current": new,
+                "change": round(change, 4),
+                "regression": worse > threshold,
+            })
+    return rows
@@ -0,0 +1,85 @@
+"""Local stand-ins for PostgreSQL, Redis and the Celery broker.
+
+``configure`` must run before anything under ``app`` is imported, since
+the app reads its settings from the environment at import time. It points
+the app at a SQLite file, an in-memory Celery broker and an in-process
+fakeredis server, so benchmarks need no network services.
+"""
+import os
+import tempfile
+from contextlib import contextmanager
+
+_server = None
+
+
+def configure(workdir: str = None) -> str:
+    """Point the app at local stand-ins under ``workdir`` and return it."""
+    global _server
+    workdir = workdir or tempfile.mkdtemp(prefix="job-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    db_path = os.path.join(workdir, "bench.db")
+    if os.path.exists(db_path):
+        os.remove(db_path)
+
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{db_path}"
+    os.environ["REDIS_URL"] = "redis://fakeredis/0"
+    os.environ["BLOB_STORE_URL"] = "file://" + os.path.join(workdir, "blobs")
+    # Measure the pipeline, not the simulated work
+    os.environ.setdefault("JOB_PROCESSING_DELAY", "0")
+    # SQL logging defaults to on in development; it would flood the output and the timings
+    os.environ["DB_ECHO"] = "false"
+
+    import fakeredis
+    import fakeredis.aioredis
+
+    from app import notifications, redis_client
+    from app.tasks import celery_app
+
+    _server = fakeredis.FakeServer()
+
+    def create_redis(**kwargs):
+        return fakeredis.aioredis.FakeRedis(server=_server)
+
+    redis_client.create_redis = create_redis
+    notifications.create_redis = create_redis
+
+    celery_app.conf.update(
+        broker_url="memory://",
+        result_backend="cache+memory://",
+        task_always_eager=False,
+        # The memory transport polls; the default 1s interval would dominate latency
+        broker_transport_options={"polling_interval": 0.005},
+        # The worker's blocking loop only applies acks between 2s polls on this
+        # transport, so a prefetch limit would stall it; the pool still caps concurrency
+        worker_prefetch_multiplier=0,
+        worker_send_task_events=False,
+        task_send_sent_event=False,
+    )
+    return workdir
+
+
+@contextmanager
+def worker(concurrency: int):
+    """Run a Celery worker with a thread pool inside this process."""
+    from celery.contrib.testing.worker import start_worker
+
+    from app.tasks import celery_app
+
+    with start_worker(
+        celery_app,
+        pool="threads",
+        concurrency=concurrency,
+        queues=["jobs.high", "jobs.normal", "jobs.low", "jobs", "celery"],
+        perform_ping_check=False,
+        shutdown_timeout=30,
+    ) as w:
+        yield w
+
+
+def purge_queues() -> None:
+    """Drop messages left in the broker by a scenario that ran without a worker."""
+    from app.tasks import celery_app
+
+    with celery_app.connection_for_write() as conn:
+        for queue in ("jobs.high", "jobs.normal", "jobs.low", "jobs", "celery"):
+            conn.default_channel.queue_purge(queue)
@@ -2,9 +2,12 @@
 DO $$
 BEGIN
     IF NOT EXISTS (SELECT 1 FROM pg_type WHERE typname = 'jobstatus') THEN
-        CREATE TYPE jobstatus AS ENUM ('PENDING', 'IN_PROGRESS', 'SUCCESS', 'FAILED');
+        CREATE TYPE jobstatus AS ENUM ('PENDING', 'IN_PROGRESS', 'SUCCESS', 'FAILED', 'CANCELLED', 'EXPIRED');
     END IF;
 END$$;
+-- States added after the type was first created
+ALTER TYPE jobstatus ADD VALUE IF NOT EXISTS 'CANCELLED';
+ALTER TYPE jobstatus ADD VALUE IF NOT EXISTS 'EXPIRED';
 
 -- Create the jobs table if it doesn't exist
 CREATE TABLE IF NOT EXISTS jobs (
@@ -13,10 +16,40 @@ CREATE TABLE IF NOT EXISTS jobs (
     operation VARCHAR(50) NOT NULL,
     input_data JSONB NOT NULL,
     result JSONB,
+    appendable BOOLEAN NOT NULL DEFAULT FALSE,
+    priority VARCHAR(16) NOT NULL DEFAULT 'normal',
+    tenant VARCHAR(64) NOT NULL DEFAULT 'default',
+    -- Jobs not finished by then are dropped as EXPIRED
+    deadline TIMESTAMP WITH TIME ZONE,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Indexes for keyset pagination of the job listing on (created_at, id).
+-- On an existing large table, create them with CREATE INDEX CONCURRENTLY instead.
+CREATE INDEX IF NOT EXISTS ix_jobs_created_at_id ON jobs (created_at, id);
+CREATE INDEX IF NOT EXISTS ix_jobs_status_created_at_id ON jobs (status, created_at, id);
+CREATE INDEX IF NOT EXISTS ix_jobs_operation_created_at_id ON jobs (operation, created_at, id);
+-- Queued and running jobs only; stays small however many jobs have finished
+CREATE INDEX IF NOT EXISTS ix_jobs_active_created_at_id ON jobs (created_at, id)
+    WHERE status IN ('IN_PROGRESS', 'PENDING');
+
+-- Transactional outbox: jobs committed but not yet published to the broker
+CREATE TABLE IF NOT EXISTS job_outbox (
+    id BIGSERIAL PRIMARY KEY,
+    job_id INTEGER NOT NULL REFERENCES jobs (id) ON DELETE CASCADE,
+    priority VARCHAR(16) NOT NULL DEFAULT 'normal',
+    tenant VARCHAR(64) NOT NULL DEFAULT 'default',
+    -- Fair-queuing order within a priority lane
+    vtime BIGINT NOT NULL DEFAULT 0,
+    -- W3C trace context of the request that queued the job
+    traceparent VARCHAR(55),
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS ix_job_outbox_job_id ON job_outbox (job_id);
+CREATE INDEX IF NOT EXISTS ix_job_outbox_lane ON job_outbox (priority, vtime, id);
+CREATE INDEX IF NOT EXISTS ix_job_outbox_tenant ON job_outbox (priority, tenant, vtime);
+
 -- Create a trigger to update the updated_at column
 CREATE OR REPLACE FUNCTION update_updated_at_column()
 RETURNS TRIGGER AS $$
@@ -1,11 +1,12 @@
 import pytest
+import pytest_asyncio
 from fastapi.testclient import TestClient
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 import asyncio
 
 from app.main import app
-from app.db import Base, get_db, engine as _engine
+from app.db import Base, get_db, get_read_db, engine as _engine
 from app.tasks import celery_app
 
 # Use an in-memory SQLite database for testing
@@ -38,6 +39,7 @@ celery_app.conf.update(
 async def client():
     # Override the database dependency
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db
     
     # Initialize the test database
     await init_test_db()
@@ -56,6 +58,16 @@ async def db_session():
         yield session
         await session.rollback()
 
+# Session factory on a fresh SQLite database, for tests that call handlers
+# and tasks directly; patch it in where the code under test opens sessions
+@pytest_asyncio.fixture
+async def sessions(tmp_path):
+    test_engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'jobs.db'}")
+    async with test_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield sessionmaker(bind=test_engine, class_=AsyncSession, expire_on_commit=False)
+    await test_engine.dispose()
+
 # Fixture for event loop
 @pytest.fixture(scope="session")
 def event_loop():
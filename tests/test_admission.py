@@ -0,0 +1,127 @@
+import time
+
+import pytest
+
+from app import admission
+from app.admission import AdmissionError, Load
+from app.db import JobPriority
+
+
+def _load(queued=0, pending=0, drain_rate=0.0):
+    return Load(queued=queued, pending=pending, drain_rate=drain_rate, sampled_at=time.time())
+
+
+def test_parse_levels():
+    assert admission._parse_levels("high=1, low=0.5") == {JobPriority.HIGH: 1.0, JobPriority.LOW: 0.5}
+
+
+def test_retry_after_is_time_to_drain_below_the_level(monkeypatch):
+    monkeypatch.setattr(admission, "MAX_QUEUED", 1000)
+    monkeypatch.setattr(admission, "MAX_PENDING", 1000)
+    monkeypatch.setattr(admission, "RETRY_JITTER", 0)
+
+    load = _load(queued=1100, pending=500, drain_rate=10)
+    assert load.level == pytest.approx(1.1)
+    # 350 jobs over the 0.75 level at 10 jobs per second
+    assert load.retry_after(0.75) == 35
+    assert load.retry_after(2) == admission.MIN_RETRY_AFTER
+    # Nothing is draining, so there is no estimate to give
+    assert _load(queued=1100).retry_after(0.75) == admission.MAX_RETRY_AFTER
+
+
+@pytest.mark.asyncio
+async def test_low_priority_is_shed_first(monkeypatch):
+    monkeypatch.setattr(admission, "MAX_QUEUED", 100)
+    monkeypatch.setattr(admission, "SHED_LEVELS", {
+        JobPriority.HIGH: 1.0, JobPriority.NORMAL: 0.9, JobPriority.LOW: 0.75,
+    })
+    load = _load(queued=80, drain_rate=1)
+
+    async def current():
+        return load
+
+    monkeypatch.setattr(admission.monitor, "current", current)
+
+    await admission.admit("addr:test", JobPriority.HIGH)
+    await admission.admit("addr:test", JobPriority.NORMAL)
+    with pytest.raises(AdmissionError) as excinfo:
+        await admission.admit("addr:test", JobPriority.LOW)
+    assert excinfo.value.status_code == 429
+    assert excinfo.value.retry_after >= 5
+
+    # A batch is shed at the level of its most urgent job
+    await admission.admit_batch("addr:test", [JobPriority.LOW, JobPriority.HIGH], 2)
+    with pytest.raises(AdmissionError):
+        await admission.admit_batch("addr:test", [JobPriority.LOW, JobPriority.LOW], 2)
+
+
+@pytest.mark.asyncio
+async def test_batch_over_budget_is_too_large(monkeypatch):
+    async def current():
+        return None
+
+    monkeypatch.setattr(admission.monitor, "current", current)
+    monkeypatch.setattr(admission, "BATCH_RATE", 10)
+    monkeypatch.setattr(admission, "BATCH_BURST", 100)
+
+    with pytest.raises(AdmissionError) as excinfo:
+        await admission.admit_batch("addr:test", [JobPriority.NORMAL], 101)
+    assert excinfo.value.status_code == 413
+
+
+def test_client_key():
+    assert admission.client_key("10.0.0.1") == "addr:10.0.0.1"
+    assert admission.client_key(None) == "addr:unknown"
+
+
+@pytest.fixture
+def buckets(monkeypatch):
+    """Records every bucket drawn from; ``empty`` ones refuse tokens."""
+    taken = []
+    empty = set()
+
+    async def current():
+        return None
+
+    async def take(key, rate, burst, cost=1):
+        taken.append((key, cost))
+        return 1.0 if key in empty else 0.0
+
+    monkeypatch.setattr(admission.monitor, "current", current)
+    monkeypatch.setattr(admission, "take", take)
+    return taken, empty
+
+
+@pytest.mark.asyncio
+async def test_tenant_does_not_replace_the_client_bucket(buckets):
+    taken, empty = buckets
+    empty.add("job:addr:10.0.0.1")
+
+    # Naming a fresh tenant per request does not escape the caller's limit
+    for tenant in ("a", "b"):
+        with pytest.raises(AdmissionError) as excinfo:
+            await admission.admit("addr:10.0.0.1", JobPriority.NORMAL, tenant)
+        assert excinfo.value.reason == "rate_limit"
+    assert taken == [("job:addr:10.0.0.1", 1), ("job:addr:10.0.0.1", 1)]
+
+
+@pytest.mark.asyncio
+async def test_tenant_bucket_applies_on_top(buckets, monkeypatch):
+    taken, empty = buckets
+    monkeypatch.setattr(admission, "TENANT_RATE", 10)
+    monkeypatch.setattr(admission, "TENANT_BURST", 5)
+
+    await admission.admit("addr:10.0.0.1", JobPriority.NORMAL, "acme")
+    await admission.admit_batch("addr:10.0.0.1", [JobPriority.NORMAL] * 4, 4, {"acme": 3, "globex": 1})
+    assert taken == [
+        ("job:addr:10.0.0.1", 1), ("tenant:acme", 1),
+        ("batch:addr:10.0.0.1", 4), ("tenant:acme", 3), ("tenant:globex", 1),
+    ]
+
+    empty.add("tenant:acme")
+    with pytest.raises(AdmissionError) as excinfo:
+        await admission.admit("addr:10.0.0.2", JobPriority.NORMAL, "acme")
+    assert excinfo.value.reason == "tenant_limit"
+    with pytest.raises(AdmissionError) as excinfo:
+        await admission.admit_batch("addr:10.0.0.2", [JobPriority.NORMAL] * 6, 6, {"globex": 6})
+    assert excinfo.value.status_code == 413
@@ -0,0 +1,111 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from app import autoscale, worker_loop
+from app.autoscale import QueueAutoscaler, QueueSignals, ScalingPolicy
+
+
+class SimulatedQueue:
+    """FIFO queue whose jobs each take ``exec_time`` seconds of one slot."""
+
+    def __init__(self, exec_time: float):
+        self.exec_time = exec_time
+        self.now = 0.0
+        self.waiting = deque()
+        self.busy = 0
+        self._capacity = 0.0
+
+    def step(self, arrivals: int, concurrency: int, dt: float = 1.0) -> None:
+        self.now += dt
+        self.waiting.extend([self.now] * arrivals)
+        # Unused capacity is not banked while the queue is empty
+        self._capacity = min(self._capacity + concurrency * dt / self.exec_time, concurrency * dt / self.exec_time)
+        done = min(int(self._capacity), len(self.waiting))
+        self._capacity -= done
+        for _ in range(done):
+            self.waiting.popleft()
+        self.busy = min(concurrency, round(done * self.exec_time / dt))
+
+    def signals(self) -> QueueSignals:
+        return QueueSignals(
+            backlog=len(self.waiting),
+            running=self.busy,
+            oldest_age=self.now - self.waiting[0] if self.waiting else None,
+            exec_time=self.exec_time,
+        )
+
+
+def _drive(policy, queue, arrivals, concurrency):
+    decisions = []
+    for count in arrivals:
+        queue.step(count, concurrency)
+        decision = policy.decide(concurrency, queue.signals(), queue.now)
+        concurrency = decision.desired
+        decisions.append(decision)
+    return concurrency, decisions
+
+
+def test_burst_grows_within_bounds_then_shrinks_after_delay():
+    policy = ScalingPolicy(2, 32, target_wait=5, tolerance=0.2, scale_down_delay=30)
+    queue = SimulatedQueue(exec_time=0.5)
+
+    concurrency, _ = _drive(policy, queue, [1] * 10, 2)
+    assert concurrency == 2
+
+    # 40 jobs/s at 0.5s each needs 20 slots
+    concurrency, burst = _drive(policy, queue, [40] * 60, concurrency)
+    assert 20 <= concurrency <= 32
+    assert max(d.desired for d in burst) <= 32
+    assert queue.signals().oldest_age is None or queue.signals().oldest_age <= 5
+
+    concurrency, idle = _drive(policy, queue, [0] * 60, concurrency)
+    shrinks = [i for i, d in enumerate(idle) if d.action == "shrink"]
+    assert shrinks and shrinks[0] >= 29
+    assert concurrency == 2
+
+
+def test_noisy_steady_load_does_not_flap():
+    policy = ScalingPolicy(1, 64, target_wait=5, tolerance=0.2, scale_down_delay=30)
+    queue = SimulatedQueue(exec_time=1.0)
+    arrivals = [18, 22, 20, 19, 21] * 40
+
+    concurrency, decisions = _drive(policy, queue, arrivals, 1)
+    settled = decisions[20:]
+    assert sum(d.action != "hold" for d in settled) <= 2
+    assert 18 <= concurrency <= 30
+
+
+def test_falling_behind_and_bounds():
+    policy = ScalingPolicy(2, 8, target_wait=5)
+    behind = policy.decide(4, QueueSignals(backlog=1, running=4, oldest_age=20, exec_time=0.1), 0)
+    assert behind.action == "grow" and behind.desired == 6
+    assert "oldest message" in behind.reason
+
+    flooded = policy.decide(4, QueueSignals(backlog=10000, running=4, exec_time=1), 0)
+    assert flooded.desired == 8 and "bounds" in flooded.reason
+
+
+class _ThreadPool:
+    def __init__(self, limit):
+        self.limit = limit
+        self.executor = ThreadPoolExecutor(max_workers=limit)
+
+
+def test_autoscaler_moves_in_flight_limit_and_records_decisions(monkeypatch):
+    monkeypatch.setattr(worker_loop, "_max_in_flight", None)
+    monkeypatch.setattr(autoscale, "INTERVAL", 0)
+    pool = _ThreadPool(2)
+    scaler = QueueAutoscaler(pool, 16, 2)
+    assert pool.limit == 16 and worker_loop._max_in_flight == 2
+
+    monkeypatch.setattr(scaler, "sample", lambda: QueueSignals(backlog=30, running=2, exec_time=1.0))
+    scaler.maybe_scale()
+    assert scaler.processes == worker_loop._max_in_flight == 8
+
+    info = scaler.info()
+    assert info["current"] == 8
+    assert info["decisions"][-1]["action"] == "grow"
+    assert info["decisions"][-1]["signals"]["backlog"] == 30
+
+    scaler.update(max=4)
+    assert scaler.processes == worker_loop._max_in_flight == 4
@@ -0,0 +1,46 @@
+import contextlib
+
+import httpx
+import pytest
+
+from benchmarks import harness
+from benchmarks.report import compare, summarize
+
+
+def test_summarize_percentiles():
+    result = summarize("status", 10, 4, [float(i) for i in range(1, 101)], elapsed=2.0)
+    assert result["count"] == 100
+    assert result["throughput"] == 50.0
+    assert result["latency_ms"]["p50"] == 50.5
+    assert result["latency_ms"]["max"] == 100.0
+
+
+def test_compare_flags_regressions_beyond_threshold():
+    baseline = [summarize("submit", 10, 1, [10.0] * 10, elapsed=1.0)]
+    slower = [summarize("submit", 10, 1, [10.5] * 10, elapsed=1.05)]
+    much_slower = [summarize("submit", 10, 1, [20.0] * 10, elapsed=2.0)]
+
+    assert not any(row["regression"] for row in compare(baseline, slower, threshold=0.1))
+    flagged = {row["metric"] for row in compare(baseline, much_slower, threshold=0.1) if row["regression"]}
+    assert flagged == {"throughput", "latency_ms.p50", "latency_ms.p99"}
+    # Improvements are never regressions
+    assert not any(row["regression"] for row in compare(much_slower, baseline, threshold=0.1))
+
+
+@pytest.mark.asyncio
+async def test_end_to_end_polls_until_the_job_finishes(monkeypatch):
+    responses = {"result": iter([400, 400, 200])}
+
+    class Client:
+        async def get(self, url, params=None):
+            return httpx.Response(next(responses["result"]), request=httpx.Request("GET", url))
+
+    async def submit(client, body):
+        return 1
+
+    monkeypatch.setattr(harness, "_submit", submit)
+    monkeypatch.setattr(harness.standins, "worker", lambda concurrency: contextlib.nullcontext())
+
+    result = await harness.bench_end_to_end(Client(), size=4, concurrency=1, requests=1)
+    assert result["count"] == 1
+    assert next(responses["result"], None) is None
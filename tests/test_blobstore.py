@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from app.blobstore import LocalBlobStore
+
+
+def test_put_and_open_round_trip(tmp_path):
+    store = LocalBlobStore(str(tmp_path))
+    values = np.arange(1000, dtype=np.float64)
+    handle = store.put(values)
+    assert handle.startswith("file:")
+
+    mapped = store.open(handle)
+    assert isinstance(mapped, np.memmap)
+    assert not mapped.flags.writeable
+    np.testing.assert_array_equal(mapped, values)
+
+
+def test_empty_blob(tmp_path):
+    store = LocalBlobStore(str(tmp_path))
+    assert len(store.open(store.put(np.empty(0)))) == 0
+
+
+def test_delete(tmp_path):
+    store = LocalBlobStore(str(tmp_path))
+    handle = store.put(np.ones(3))
+    store.delete(handle)
+    store.delete(handle)
+    with pytest.raises(FileNotFoundError):
+        store.open(handle)
+
+
+def test_rejects_foreign_handles(tmp_path):
+    store = LocalBlobStore(str(tmp_path))
+    with pytest.raises(ValueError):
+        store.open("s3:bucket/key")
+    with pytest.raises(ValueError):
+        store.open("file:../../etc/passwd")
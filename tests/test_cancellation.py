@@ -0,0 +1,48 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from app import operations, status_cache
+from app.cancellation import CancelToken
+from app.db import JobStatus
+
+
+def test_reduction_stops_between_chunks():
+    checks = []
+
+    def cancelled():
+        checks.append(True)
+        return len(checks) > 2
+
+    with pytest.raises(operations.Cancelled):
+        operations.compute("sum", np.ones(10), chunk_size=2, cancelled=cancelled)
+    assert len(checks) == 3
+
+
+def test_token_expires_at_deadline():
+    token = CancelToken(1, deadline=time.time() - 1)
+    with pytest.raises(operations.Cancelled):
+        token.check()
+    assert token.status == JobStatus.EXPIRED
+    assert not CancelToken(2, deadline=time.time() + 60)()
+
+
+@pytest.mark.asyncio
+async def test_cancel_cuts_sleep_short():
+    token = CancelToken(1)
+    asyncio.get_running_loop().call_later(0.01, token.cancel)
+    started = time.perf_counter()
+    with pytest.raises(operations.Cancelled):
+        await token.sleep(10)
+    assert time.perf_counter() - started < 1
+    assert token.status == JobStatus.CANCELLED
+
+
+def test_cancelled_row_wins_over_buffered_transition():
+    now = datetime(2024, 1, 1)
+    row = {"id": 1, "status": JobStatus.CANCELLED, "result": None, "updated_at": now}
+    pending = {"id": 1, "status": JobStatus.IN_PROGRESS, "result": None, "updated_at": now + timedelta(seconds=1)}
+    assert status_cache._with_pending(row, pending) is row
@@ -0,0 +1,118 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool
+
+from app import db
+from app.api import routes
+from app.db import Base, Job, JobStatus
+
+_PRINT_OPTIONS = """
+import json
+from app import db
+print(json.dumps({
+    url: db._engine_options(url)
+    for url in ["postgresql+asyncpg://db/jobs", "postgresql+psycopg://db/jobs", "sqlite+aiosqlite://"]
+}))
+"""
+
+
+def _engine_options(**env):
+    # The settings are read at import, so each environment needs a fresh interpreter
+    env = {**os.environ, "DATABASE_URL": "sqlite+aiosqlite://", **env}
+    env.pop("DATABASE_READ_URL", None)
+    output = subprocess.run(
+        [sys.executable, "-c", _PRINT_OPTIONS], env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def test_engine_options_from_the_environment():
+    options = _engine_options(
+        ENVIRONMENT="production", DB_POOL_SIZE="7", DB_MAX_OVERFLOW="3", DB_POOL_TIMEOUT="2.5",
+        DB_POOL_RECYCLE="60", DB_STATEMENT_TIMEOUT_MS="1500",
+    )
+
+    assert options["postgresql+asyncpg://db/jobs"] == {
+        "echo": False, "pool_size": 7, "max_overflow": 3, "pool_timeout": 2.5, "pool_recycle": 60,
+        "connect_args": {"server_settings": {"statement_timeout": "1500"}},
+    }
+    # The statement timeout is an asyncpg server setting; SQLite gets no pool options
+    assert "connect_args" not in options["postgresql+psycopg://db/jobs"]
+    assert options["sqlite+aiosqlite://"] == {"echo": False}
+
+
+def test_engine_option_defaults():
+    options = _engine_options(ENVIRONMENT="development", DB_STATEMENT_TIMEOUT_MS="0")
+    assert options["postgresql+asyncpg://db/jobs"] == {
+        "echo": True, "pool_size": 5, "max_overflow": 10, "pool_timeout": 30.0, "pool_recycle": 1800,
+    }
+
+
+@pytest.fixture
+def replica(tmp_path):
+    """Engine of a second, empty database standing in for a lagging replica."""
+    return create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'replica.db'}")
+
+
+def test_is_replica(sessions, replica, monkeypatch):
+    primary = sessions.kw["bind"]
+    monkeypatch.setattr(db, "engine", primary)
+    monkeypatch.setattr(db, "read_engine", primary)
+    assert not db.is_replica(AsyncSession(bind=primary))
+
+    monkeypatch.setattr(db, "read_engine", replica)
+    assert db.is_replica(AsyncSession(bind=replica))
+    assert not db.is_replica(AsyncSession(bind=primary))
+
+
+@pytest.mark.asyncio
+async def test_load_job_falls_back_to_the_primary(sessions, replica, monkeypatch):
+    async def ignore(*args, **kwargs):
+        return None
+
+    async with replica.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with sessions() as session:
+        job = Job(status=JobStatus.PENDING, operation="sum", input_data={"data": [1.0]})
+        session.add(job)
+        await session.commit()
+    monkeypatch.setattr(routes.status_cache, "get", ignore)
+    monkeypatch.setattr(routes.status_cache, "put", ignore)
+    monkeypatch.setattr(routes, "async_session_maker", sessions)
+    monkeypatch.setattr(routes, "is_replica", lambda session: session.bind is replica)
+
+    replica_sessions = sessionmaker(bind=replica, class_=AsyncSession)
+    async with replica_sessions() as session:
+        # The job has not reached the replica yet
+        loaded = await routes._load_job(session, job.id)
+        assert (loaded["id"], loaded["status"]) == (job.id, JobStatus.PENDING)
+        assert await routes._load_job(session, job.id + 1) is None
+    await replica.dispose()
+
+
+@pytest.mark.asyncio
+async def test_pool_stats(tmp_path, monkeypatch):
+    url = f"sqlite+aiosqlite:///{tmp_path / 'jobs.db'}"
+    writer = create_async_engine(url, poolclass=AsyncAdaptedQueuePool, pool_size=2, max_overflow=2)
+    reader = create_async_engine(url, poolclass=NullPool)
+    monkeypatch.setattr(db, "engine", writer)
+    monkeypatch.setattr(db, "read_engine", reader)
+    monkeypatch.setattr(db, "DB_MAX_OVERFLOW", 2)
+
+    async with writer.connect():
+        stats = db.pool_stats()
+    assert stats["writer"] == {"size": 2, "checked_out": 1, "overflow": 0, "capacity": 4, "saturation": 0.25}
+    # A pool without a size only reports its status
+    assert set(stats["reader"]) == {"status"}
+
+    monkeypatch.setattr(db, "read_engine", writer)
+    assert db.pool_stats()["writer"]["checked_out"] == 0
+    assert "reader" not in db.pool_stats()
+    await writer.dispose()
+    await reader.dispose()
@@ -0,0 +1,34 @@
+import csv
+import io
+import json
+from datetime import datetime
+from types import SimpleNamespace
+
+from app import export
+from app.db import JobStatus
+
+
+def _row(job_id, result):
+    return SimpleNamespace(
+        id=job_id, status=JobStatus.SUCCESS, operation="count+max", result=result,
+        deadline=None, created_at=datetime(2024, 1, 1), updated_at=datetime(2024, 1, 1, 0, 0, 1),
+    )
+
+
+def test_ndjson_and_csv_records():
+    records = [
+        export.record(_row(1, {"result": {"value": {"count": 2, "max": 3.0}}, "error": None}), "c1"),
+        export.record(_row(2, None), "c2"),
+    ]
+
+    lines = export._ndjson(records).decode().splitlines()
+    assert json.loads(lines[0]) == {
+        "id": 1, "status": "SUCCESS", "operation": "count+max",
+        "result": {"value": {"count": 2, "max": 3.0}}, "error": None, "deadline": None,
+        "created_at": "2024-01-01T00:00:00", "updated_at": "2024-01-01T00:00:01", "cursor": "c1",
+    }
+
+    rows = list(csv.DictReader(io.StringIO(export._csv(records, header=True).decode())))
+    assert [row["id"] for row in rows] == ["1", "2"]
+    assert json.loads(rows[0]["result"]) == {"value": {"count": 2, "max": 3.0}}
+    assert rows[1]["result"] == "" and rows[1]["cursor"] == "c2"
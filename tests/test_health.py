@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+from app import health
+from app.health import HealthMonitor, Probes
+
+OK = {"ok": True, "latency_ms": 1.0}
+DOWN = {"ok": False, "error": "No answer within 1s"}
+
+
+def _probes(**checks):
+    return Probes(
+        checks={"database": OK, "redis": OK, "workers": OK, **checks},
+        queue_lag={"outbox_seconds": 0.0, "broker_seconds": {"high": 0.0, "normal": 120.0, "low": None}},
+    )
+
+
+@pytest.fixture
+def probed(monitor_probes, monkeypatch):
+    monitor = HealthMonitor(ttl=60)
+
+    async def probe():
+        return monitor_probes
+
+    monkeypatch.setattr(monitor, "probe", probe)
+    monkeypatch.setattr(health, "pool_stats", lambda: {"writer": {"saturation": 0.5}})
+    return monitor
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("monitor_probes", [_probes(workers=DOWN)])
+async def test_workers_and_queue_lag_are_only_reported_by_default(probed):
+    readiness = await probed.readiness()
+    assert readiness["status"] == "ready"
+    assert readiness["checks"]["workers"] == DOWN
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("monitor_probes", [_probes(workers=DOWN)])
+async def test_opt_in_checks(probed, monkeypatch):
+    monkeypatch.setattr(health, "REQUIRE_WORKERS", True)
+    monkeypatch.setattr(health, "MAX_QUEUE_LAG", 60)
+    assert (await probed.readiness())["failing"] == ["workers", "queue_lag"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("monitor_probes", [_probes(redis=DOWN)])
+async def test_not_ready_when_a_dependency_or_pool_fails(probed, monkeypatch):
+    monkeypatch.setattr(health, "pool_stats", lambda: {"writer": {"saturation": 0.95}, "reader": {"status": "NullPool"}})
+    readiness = await probed.readiness()
+    assert readiness["status"] == "not_ready"
+    assert readiness["failing"] == ["redis", "writer_pool_saturation"]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_callers_share_one_probe(monkeypatch):
+    monitor = HealthMonitor(ttl=60)
+    calls = []
+
+    async def probe():
+        calls.append(True)
+        await asyncio.sleep(0.01)
+        return _probes()
+
+    monkeypatch.setattr(monitor, "probe", probe)
+    results = await asyncio.gather(*(monitor.current() for _ in range(10)))
+    await monitor.current()
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+
+
+@pytest.mark.asyncio
+async def test_failed_probe_is_reported_not_raised():
+    async def probe():
+        raise ConnectionError("refused")
+
+    assert await health._timed(probe()) == {"ok": False, "error": "refused"}
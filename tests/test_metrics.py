@@ -0,0 +1,30 @@
+from datetime import datetime, timedelta
+
+from prometheus_client import REGISTRY
+
+from app.db import JobStatus
+from app.metrics import observe_transition
+
+
+def _state_count(from_state, to_state):
+    value = REGISTRY.get_sample_value(
+        "job_state_duration_seconds_count", {"from_state": from_state, "to_state": to_state}
+    )
+    return value or 0
+
+
+def test_time_in_state_follows_transitions():
+    before_pending = _state_count("PENDING", "IN_PROGRESS")
+    before_running = _state_count("IN_PROGRESS", "SUCCESS")
+
+    created_at = datetime.utcnow() - timedelta(seconds=5)
+    observe_transition(-1, JobStatus.IN_PROGRESS, created_at)
+    # A repeated write of the same state (progress update) is not a transition
+    observe_transition(-1, JobStatus.IN_PROGRESS, created_at)
+    observe_transition(-1, JobStatus.SUCCESS, created_at)
+
+    assert _state_count("PENDING", "IN_PROGRESS") == before_pending + 1
+    assert _state_count("IN_PROGRESS", "SUCCESS") == before_running + 1
+    assert REGISTRY.get_sample_value(
+        "job_state_duration_seconds_sum", {"from_state": "PENDING", "to_state": "IN_PROGRESS"}
+    ) >= 5
@@ -0,0 +1,24 @@
+import asyncio
+
+import pytest
+
+from app.notifications import JobEventHub
+
+
+@pytest.mark.asyncio
+async def test_events_reach_only_waiters_for_that_job():
+    hub = JobEventHub()
+    with hub.listen(1) as first, hub.listen(2) as second:
+        assert hub.waiter_count == 2
+        hub.dispatch({"id": 1, "status": "SUCCESS"})
+        event = await asyncio.wait_for(first.get(), 1)
+        assert event == {"id": 1, "status": "SUCCESS"}
+        assert second.empty()
+    assert hub.waiter_count == 0
+
+
+@pytest.mark.asyncio
+async def test_dispatch_without_waiters_is_ignored():
+    hub = JobEventHub()
+    hub.dispatch({"id": 3, "status": "FAILED"})
+    assert hub.waiter_count == 0
@@ -0,0 +1,76 @@
+import json
+
+import numpy as np
+import pytest
+
+from app import operations
+from app.schemas import OperationType
+
+TEST_DATA = [1, 2, 3, 4, 5]
+
+
+def test_registered_operations():
+    assert operations.compute("square_sum", TEST_DATA) == sum(x**2 for x in TEST_DATA)
+    assert operations.compute("cube_sum", TEST_DATA) == sum(x**3 for x in TEST_DATA)
+
+
+def test_chunked_reduction_matches_single_pass():
+    data = np.random.default_rng(0).normal(size=10_001)
+    whole = operations.compute("square_sum", data, chunk_size=len(data))
+    chunked = operations.compute("square_sum", data, chunk_size=97)
+    assert chunked == pytest.approx(whole)
+
+
+def test_empty_input():
+    assert operations.compute("square_sum", []) == 0.0
+
+
+def test_unsupported_operation():
+    with pytest.raises(ValueError, match="Unsupported operation"):
+        operations.compute("invalid_operation", TEST_DATA)
+
+
+def test_operation_type_mirrors_registry():
+    assert {op.value for op in OperationType} == set(operations.OPERATIONS)
+    assert operations.get_operation(OperationType.CUBE_SUM).name == "cube_sum"
+
+
+def test_merged_partials_match_single_pass():
+    data = np.arange(1000, dtype=np.float64)
+    partials = [operations.reduce_partial("cube_sum", data[i:i + 300]) for i in range(0, 1000, 300)]
+    assert operations.merge("cube_sum", partials) == pytest.approx(operations.compute("cube_sum", data))
+
+
+def test_aggregates():
+    assert operations.compute("count", TEST_DATA) == 5
+    assert operations.compute("sum", TEST_DATA) == 15.0
+    assert operations.compute("mean", TEST_DATA, chunk_size=2) == 3.0
+    assert operations.compute("min", TEST_DATA, chunk_size=2) == 1.0
+    assert operations.compute("max", TEST_DATA, chunk_size=2) == 5.0
+    assert operations.compute("mean", []) is None
+    assert operations.compute("max", []) is None
+
+
+def test_fused_operation_matches_separate_jobs():
+    data = np.random.default_rng(1).normal(size=1001)
+    names = ["square_sum", "cube_sum", "count", "mean", "min", "max"]
+    fused = operations.fused_name(names + ["count"])
+    assert fused == "square_sum+cube_sum+count+mean+min+max"
+
+    result = operations.compute(fused, data, chunk_size=97)
+    assert list(result) == names
+    for name in names:
+        assert result[name] == pytest.approx(operations.compute(name, data))
+
+    # Partials survive a JSON round trip (shards, appendable jobs) and merge
+    partials = [json.loads(json.dumps(operations.reduce_partial(fused, data[i:i + 400]))) for i in range(0, 1001, 400)]
+    assert operations.merge(fused, partials)["mean"] == pytest.approx(result["mean"])
+
+
+def test_fused_name_validation():
+    assert operations.fused_name([OperationType.COUNT]) == "count"
+    assert operations.fused_name(OperationType.CUBE_SUM) == "cube_sum"
+    with pytest.raises(ValueError, match="Unsupported operation"):
+        operations.fused_name(["count", "median"])
+    with pytest.raises(ValueError, match="Unsupported operation"):
+        operations.get_operation("count+count")
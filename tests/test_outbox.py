@@ -0,0 +1,194 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import func, select
+
+from app import outbox, tracing
+from app.db import Job, JobOutbox, JobPriority, JobStatus
+from app.outbox import MAX_QUEUED_PER_LANE, OutboxDispatcher, _parse_weights, lane_queue, task_kwargs
+
+
+def test_parse_weights():
+    assert _parse_weights("high=5, normal=2,low=1") == {
+        JobPriority.HIGH: 5, JobPriority.NORMAL: 2, JobPriority.LOW: 1
+    }
+
+
+def test_lane_limits_follow_weights_and_queue_room():
+    dispatcher = OutboxDispatcher(batch_size=100)
+    unknown = dispatcher._lane_limits({priority: None for priority in JobPriority})
+    assert unknown[JobPriority.HIGH] > unknown[JobPriority.NORMAL] > unknown[JobPriority.LOW] > 0
+
+    limits = dispatcher._lane_limits({
+        JobPriority.HIGH: MAX_QUEUED_PER_LANE,
+        JobPriority.NORMAL: MAX_QUEUED_PER_LANE - 3,
+        JobPriority.LOW: 0,
+    })
+    assert limits[JobPriority.HIGH] <= 0
+    assert limits[JobPriority.NORMAL] == 3
+    assert limits[JobPriority.LOW] == unknown[JobPriority.LOW]
+
+
+def test_task_kwargs_and_queue():
+    assert task_kwargs({"data": [1.0]}) == {"data": [1.0]}
+    assert task_kwargs({"blob": "file:abc", "size": 3}) == {"blob": "file:abc"}
+    assert lane_queue(JobPriority.HIGH) == lane_queue("high") == "jobs.high"
+
+
+class _Result:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def all(self):
+        return self._rows
+
+
+class _Session:
+    """Serves ``rows`` to the first outbox SELECT and ``expired`` to the UPDATE."""
+
+    def __init__(self, rows, expired=()):
+        self.rows = list(rows)
+        self.expired = list(expired)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    async def execute(self, stmt):
+        if stmt.is_select:
+            rows, self.rows = self.rows, []
+            return _Result(rows)
+        return _Result(self.expired if stmt.is_update else [])
+
+    async def commit(self):
+        pass
+
+
+def _row(job_id, deadline=None, queued_at=None):
+    return SimpleNamespace(
+        outbox_id=job_id, queued_at=queued_at, traceparent=None, id=job_id, status=JobStatus.PENDING,
+        operation="sum", input_data={"data": [1.0]}, priority="normal", deadline=deadline,
+    )
+
+
+@pytest.fixture
+def drain(monkeypatch):
+    """Runs ``drain_once`` over the given rows; returns the published job ids."""
+    published = []
+
+    async def depths():
+        return {priority: None for priority in JobPriority}
+
+    async def ignore(*args, **kwargs):
+        pass
+
+    monkeypatch.setattr(outbox, "broker_depths", depths)
+    monkeypatch.setattr(outbox, "_publish", lambda jobs, traceparents: published.extend(job.id for job in jobs))
+    monkeypatch.setattr(outbox.status_cache, "put_many", ignore)
+    monkeypatch.setattr(outbox.notifications, "publish_job_event", ignore)
+
+    async def run(rows, expired=()):
+        monkeypatch.setattr(outbox, "async_session_maker", lambda: _Session(rows, expired))
+        await OutboxDispatcher().drain_once()
+        return published
+
+    return run
+
+
+@pytest.mark.asyncio
+async def test_drain_expires_jobs_past_aware_deadlines(drain):
+    # PostgreSQL returns TIMESTAMP WITH TIME ZONE columns aware, not necessarily in UTC
+    plus_two = timezone(timedelta(hours=2))
+    now = datetime.now(plus_two)
+    expired = SimpleNamespace(id=1, _asdict=lambda: {"id": 1, "status": JobStatus.EXPIRED})
+
+    published = await drain(
+        [_row(1, deadline=now - timedelta(seconds=1)), _row(2, deadline=now + timedelta(hours=1)), _row(3)],
+        expired=[expired],
+    )
+    assert published == [2, 3]
+
+
+@pytest.mark.asyncio
+async def test_dispatch_wait_of_aware_queue_times(drain, monkeypatch):
+    observed = []
+    histogram = SimpleNamespace(observe=observed.append)
+    monkeypatch.setattr(outbox.metrics.JOB_DISPATCH_WAIT_SECONDS, "labels", lambda **labels: histogram)
+    queued_at = datetime.now(timezone(timedelta(hours=-5))) - timedelta(seconds=30)
+
+    assert await drain([_row(1, queued_at=queued_at)]) == [1]
+    assert observed == [pytest.approx(30, abs=5)]
+
+
+@pytest.mark.asyncio
+async def test_lane_stats_of_aware_queue_times(monkeypatch):
+    oldest = datetime.now(timezone(timedelta(hours=9))) - timedelta(seconds=60)
+
+    class Session(_Session):
+        async def execute(self, stmt):
+            return _Result([("high", 3, oldest)])
+
+    async def depths():
+        return {priority: 0 for priority in JobPriority}
+
+    monkeypatch.setattr(outbox, "async_session_maker", lambda: Session([]))
+    monkeypatch.setattr(outbox, "broker_depths", depths)
+
+    stats = await outbox.lane_stats()
+    assert stats["high"]["outbox_depth"] == 3
+    assert stats["high"]["oldest_wait_seconds"] == pytest.approx(60, abs=5)
+    assert stats["low"]["oldest_wait_seconds"] is None
+
+
+@pytest.mark.asyncio
+async def test_outbox_wait_span_of_aware_queue_time(drain):
+    exporter = tracing.InMemoryExporter()
+    previous = tracing.set_exporter(exporter)
+    try:
+        await drain([_row(1, queued_at=datetime.now(timezone(timedelta(hours=3))) - timedelta(seconds=20))])
+    finally:
+        tracing.set_exporter(previous)
+    (wait,) = [span for span in exporter.spans if span.name == "outbox.wait"]
+    assert wait.duration == pytest.approx(20, abs=5)
+
+
+@pytest.fixture
+def lane_backlog(sessions, monkeypatch):
+    """Queues ``count`` jobs in the outbox of one lane of the test database."""
+    monkeypatch.setattr(outbox, "async_session_maker", sessions)
+    monkeypatch.setattr(outbox, "_publish", lambda jobs, traceparents: None)
+    monkeypatch.setattr(outbox, "_record_waits", lambda jobs: ({}, []))
+
+    async def add(priority, count):
+        async with sessions() as session:
+            jobs = [
+                Job(status=JobStatus.PENDING, operation="sum", input_data={"data": [1.0]}, priority=priority.value)
+                for _ in range(count)
+            ]
+            session.add_all(jobs)
+            await session.flush()
+            session.add_all(
+                JobOutbox(job_id=job.id, priority=priority.value, vtime=vtime) for vtime, job in enumerate(jobs)
+            )
+            await session.commit()
+
+    return add
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("depth, drained", [(None, 500), (750, 250)])
+async def test_single_busy_lane_gets_the_whole_batch(sessions, lane_backlog, monkeypatch, depth, drained):
+    async def depths():
+        return {priority: depth if priority == JobPriority.NORMAL else None for priority in JobPriority}
+
+    monkeypatch.setattr(outbox, "broker_depths", depths)
+    monkeypatch.setattr(outbox, "MAX_QUEUED_PER_LANE", 1000)
+    await lane_backlog(JobPriority.NORMAL, 600)
+
+    # The lane's own share is 150 rows; the others' is passed on up to its queue room
+    assert await OutboxDispatcher(batch_size=500).drain_once() == drained
+    async with sessions() as session:
+        assert await session.scalar(select(func.count()).select_from(JobOutbox)) == 600 - drained
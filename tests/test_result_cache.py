@@ -0,0 +1,57 @@
+import json
+
+import numpy as np
+import pytest
+from prometheus_client import REGISTRY
+
+from app import result_cache
+from app.result_cache import LRUCache, cache_key, cache_keys
+
+
+def test_cache_key_is_content_addressed():
+    assert cache_key("square_sum", [1, 2, 3]) == cache_key("square_sum", np.array([1.0, 2.0, 3.0]))
+    assert cache_key("square_sum", [1, 2, 3]) != cache_key("cube_sum", [1, 2, 3])
+    assert cache_key("square_sum", [1, 2, 3]) != cache_key("square_sum", [1, 2, 4])
+
+
+def test_lru_eviction():
+    cache = LRUCache(max_entries=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_ttl_expiry():
+    cache = LRUCache(max_entries=2, ttl=0)
+    cache.set("a", 1)
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_cache_keys_of_a_batch():
+    assert cache_keys([("sum", [1, 2]), ("mean", np.array([3.0]))]) == [cache_key("sum", [1, 2]), cache_key("mean", [3.0])]
+
+
+def _lookups(outcome):
+    return REGISTRY.get_sample_value("result_cache_lookups_total", {"outcome": outcome}) or 0.0
+
+
+@pytest.mark.asyncio
+async def test_lookups_are_counted_in_prometheus(monkeypatch):
+    class Redis:
+        async def mget(self, keys):
+            return [json.dumps({"value": 2.0}) if key.endswith("b") else None for key in keys]
+
+    monkeypatch.setattr(result_cache, "get_redis", lambda: Redis())
+    monkeypatch.setattr(result_cache, "local_cache", LRUCache(max_entries=10, ttl=60))
+    result_cache.local_cache.set("a", {"value": 1.0})
+    before = {outcome: _lookups(outcome) for outcome in ["local_hit", "redis_hit", "miss"]}
+
+    assert await result_cache.get_many(["a", "b", "c"]) == [{"value": 1.0}, {"value": 2.0}, None]
+    assert {outcome: _lookups(outcome) - count for outcome, count in before.items()} == {
+        "local_hit": 1, "redis_hit": 1, "miss": 1,
+    }
@@ -0,0 +1,130 @@
+import asyncio
+import gzip
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select
+
+from app import retention
+from app.db import Job, JobStatus
+
+NOW = datetime(2024, 6, 1)
+
+
+@pytest.fixture
+def cleanup(sessions, monkeypatch):
+    """Runs ``cleanup_old_jobs`` on the test database, recording blob deletions and pauses."""
+    deleted_blobs, pauses = [], []
+    sleep = asyncio.sleep
+
+    async def ignore(*args, **kwargs):
+        return None
+
+    async def record_pause(seconds):
+        pauses.append(seconds)
+        await sleep(0)
+
+    monkeypatch.setattr(retention, "async_session_maker", sessions)
+    monkeypatch.setattr(retention, "RETENTION_DAYS", {JobStatus.SUCCESS: 30.0, JobStatus.FAILED: 90.0})
+    monkeypatch.setattr(retention, "ARCHIVE_DIR", None)
+    monkeypatch.setattr(retention.status_cache, "evict_many", ignore)
+    monkeypatch.setattr(retention.blobstore, "delete", deleted_blobs.append)
+    monkeypatch.setattr(retention.asyncio, "sleep", record_pause)
+    return deleted_blobs, pauses
+
+
+async def _add_jobs(sessions, *jobs) -> list:
+    async with sessions() as session:
+        rows = [
+            Job(
+                status=status, operation="sum", input_data=job.get("input_data", {"data": [1.0]}),
+                appendable=job.get("appendable", False),
+                created_at=NOW - timedelta(days=age), updated_at=NOW - timedelta(days=job.get("idle", age)),
+            )
+            for status, age, job in jobs
+        ]
+        session.add_all(rows)
+        await session.commit()
+        return [row.id for row in rows]
+
+
+async def _remaining(sessions) -> set:
+    async with sessions() as session:
+        return set((await session.execute(select(Job.id))).scalars())
+
+
+@pytest.mark.asyncio
+async def test_each_status_is_kept_for_its_window(sessions, cleanup):
+    kept = await _add_jobs(
+        sessions,
+        (JobStatus.SUCCESS, 29, {}),
+        (JobStatus.FAILED, 31, {}),
+        (JobStatus.PENDING, 1000, {}),
+        # Created long ago but still being appended to
+        (JobStatus.SUCCESS, 60, {"appendable": True, "idle": 1}),
+    )
+    gone = await _add_jobs(
+        sessions,
+        (JobStatus.SUCCESS, 31, {}),
+        (JobStatus.FAILED, 91, {}),
+        (JobStatus.SUCCESS, 60, {"appendable": True, "idle": 40}),
+    )
+
+    report = await retention.cleanup_old_jobs(NOW)
+
+    assert report == {"deleted": {"SUCCESS": 2, "FAILED": 1}, "complete": True}
+    assert await _remaining(sessions) == set(kept)
+    assert not set(gone) & await _remaining(sessions)
+
+
+@pytest.mark.asyncio
+async def test_deletes_in_throttled_batches(sessions, cleanup, monkeypatch):
+    _, pauses = cleanup
+    monkeypatch.setattr(retention, "BATCH_SIZE", 2)
+    monkeypatch.setattr(retention, "BATCH_PAUSE", 0.5)
+    await _add_jobs(sessions, *[(JobStatus.SUCCESS, 40, {})] * 5)
+
+    report = await retention.cleanup_old_jobs(NOW)
+
+    assert report["deleted"]["SUCCESS"] == 5
+    # A pause follows each full batch; the last, short batch ends the status
+    assert len(pauses) == 2
+    assert all(pause >= 0.5 for pause in pauses)
+
+
+@pytest.mark.asyncio
+async def test_stops_at_the_max_runtime(sessions, cleanup, monkeypatch):
+    monkeypatch.setattr(retention, "MAX_RUNTIME", 0)
+    job_ids = await _add_jobs(sessions, (JobStatus.SUCCESS, 40, {}))
+
+    assert await retention.cleanup_old_jobs(NOW) == {"deleted": {"SUCCESS": 0}, "complete": False}
+    assert await _remaining(sessions) == set(job_ids)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("archive", [True, False])
+async def test_archives_rows_and_deletes_blobs(sessions, cleanup, monkeypatch, tmp_path, archive):
+    deleted_blobs, _ = cleanup
+    if archive:
+        monkeypatch.setattr(retention, "ARCHIVE_DIR", str(tmp_path / "archive"))
+    job_ids = await _add_jobs(
+        sessions,
+        (JobStatus.SUCCESS, 40, {"input_data": {"blob": "ab12", "size": 3}}),
+        (JobStatus.SUCCESS, 35, {}),
+    )
+
+    await retention.cleanup_old_jobs(NOW)
+
+    assert deleted_blobs == ["ab12"]
+    if not archive:
+        return
+    (path,) = (tmp_path / "archive").iterdir()
+    assert path.name == "jobs-success-20240601T000000.jsonl.gz"
+    with gzip.open(path, "rt") as f:
+        rows = [json.loads(line) for line in f]
+    # Oldest first, with every archived column
+    assert [row["id"] for row in rows] == job_ids
+    assert rows[0]["input_data"] == {"blob": "ab12", "size": 3}
+    assert rows[0]["status"] == "SUCCESS"
+    assert rows[0]["created_at"] == "2024-04-22T00:00:00"
@@ -0,0 +1,298 @@
+import asyncio
+import base64
+import json
+import time
+from datetime import datetime
+
+import httpx
+import pytest
+import pytest_asyncio
+from fastapi.testclient import TestClient
+from sqlalchemy import select, update
+from starlette.websockets import WebSocketDisconnect
+
+from app import admission, notifications, operations, result_cache, status_cache
+from app.api import routes
+from app.db import Job, JobOutbox, JobStatus, get_db, get_read_db
+from app.main import app
+
+JOBS = "/api/v1/jobs"
+
+
+@pytest_asyncio.fixture
+async def api(sessions, monkeypatch):
+    """Client of the API on the test database, with Redis left out."""
+    async def override_get_db():
+        async with sessions() as session:
+            yield session
+
+    async def ignore(*args, **kwargs):
+        return None
+
+    async def current():
+        return None
+
+    monkeypatch.setattr(admission.monitor, "current", current)
+    for name in ["get", "put", "put_many"]:
+        monkeypatch.setattr(status_cache, name, ignore)
+    monkeypatch.setitem(app.dependency_overrides, get_db, override_get_db)
+    monkeypatch.setitem(app.dependency_overrides, get_read_db, override_get_db)
+    async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+        yield client
+
+
+@pytest.fixture
+def cached(monkeypatch):
+    """Result cache contents by key, in place of both cache tiers."""
+    results = {}
+
+    async def get_many(keys):
+        return [results.get(key) for key in keys]
+
+    monkeypatch.setattr(result_cache, "get_many", get_many)
+    return results
+
+
+async def _rows(sessions, model):
+    async with sessions() as session:
+        return (await session.execute(select(model).order_by(model.id))).scalars().all()
+
+
+@pytest.mark.asyncio
+async def test_batch_inserts_every_job_and_queues_only_cache_misses(api, sessions, cached):
+    cached[result_cache.cache_key("sum", [4.0, 5.0])] = {"value": 9.0}
+
+    response = await api.post(f"{JOBS}/batch", json=[
+        {"data": [1, 2], "operation": "square_sum"},
+        {"data": [4, 5], "operation": "sum"},
+        {"data": [3], "operation": "cube_sum", "priority": "high", "tenant": "acme"},
+    ])
+
+    assert response.status_code == 201
+    created = response.json()
+    assert [job["status"] for job in created] == ["PENDING", "SUCCESS", "PENDING"]
+    assert [job["operation"] for job in created] == ["square_sum", "sum", "cube_sum"]
+    jobs = await _rows(sessions, Job)
+    assert [job.id for job in jobs] == [job["id"] for job in created]
+    assert jobs[1].result == {"result": {"value": 9.0}, "error": None}
+    queued = await _rows(sessions, JobOutbox)
+    assert [(row.job_id, row.priority, row.tenant) for row in queued] == [
+        (created[0]["id"], "normal", "default"), (created[2]["id"], "high", "acme"),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_batch_with_an_appendable_job_is_rejected(api, sessions, cached):
+    response = await api.post(f"{JOBS}/batch", json=[
+        {"data": [1, 2], "operation": "sum"},
+        {"data": [3], "operation": "sum", "appendable": True},
+    ])
+
+    assert response.status_code == 422
+    assert await _rows(sessions, Job) == []
+
+
+@pytest.mark.asyncio
+async def test_batch_is_admitted_as_a_whole(api, sessions, cached, monkeypatch):
+    taken = []
+
+    async def take(key, rate, burst, cost=1):
+        taken.append((key, cost))
+        return 0.0 if len(taken) == 1 else 2.5
+
+    monkeypatch.setattr(admission, "take", take)
+    monkeypatch.setattr(admission, "BATCH_RATE", 10)
+    monkeypatch.setattr(admission, "BATCH_BURST", 3)
+    batch = [{"data": [i], "operation": "sum"} for i in range(3)]
+
+    assert (await api.post(f"{JOBS}/batch", json=batch)).status_code == 201
+    # The budget is drawn once, for every job of the batch
+    assert taken == [("batch:addr:127.0.0.1", 3)]
+
+    response = await api.post(f"{JOBS}/batch", json=batch)
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "3"
+    # Over the burst, the batch could never be admitted
+    response = await api.post(f"{JOBS}/batch", json=batch + batch[:1])
+    assert response.status_code == 413
+    # Nothing of a rejected batch is created
+    assert len(await _rows(sessions, Job)) == 3
+
+
+async def _add_job(sessions, **columns) -> int:
+    async with sessions() as session:
+        job = Job(operation="sum", input_data={"data": [1.0]}, **columns)
+        session.add(job)
+        await session.commit()
+        return job.id
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("operation", ["mean", ["count", "sum", "min", "max"]])
+async def test_append_matches_recomputing_over_all_data(api, operation):
+    chunks = [[1.5, -2.0, 8.0], [4.0], [0.25, 3.0]]
+    response = await api.post(f"{JOBS}/", json={"data": chunks[0], "operation": operation, "appendable": True})
+    assert response.status_code == 201
+    job_id = response.json()["id"]
+
+    for chunk in chunks[1:]:
+        response = await api.post(f"{JOBS}/{job_id}/append", json={"data": chunk})
+        assert response.status_code == 200
+
+    name = operations.fused_name(operation)
+    expected = operations.compute(name, [value for chunk in chunks for value in chunk])
+    assert response.json()["status"] == "SUCCESS"
+    assert response.json()["result"] == {"value": pytest.approx(expected)}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("status", [JobStatus.PENDING, JobStatus.SUCCESS, JobStatus.CANCELLED])
+async def test_append_to_a_job_that_is_not_appendable(api, sessions, status):
+    job_id = await _add_job(sessions, status=status)
+
+    response = await api.post(f"{JOBS}/{job_id}/append", json={"data": [1.0]})
+    assert response.status_code == 409
+
+    async with sessions() as session:
+        job = await session.get(Job, job_id)
+    assert (job.status, job.result) == (status, None)
+
+
+@pytest.mark.asyncio
+async def test_append_rejects_bad_input(api, sessions):
+    job_id = await _add_job(
+        sessions, status=JobStatus.SUCCESS, appendable=True,
+        result={"result": {"value": 1.0}, "error": None, "state": 1.0, "count": 1},
+    )
+
+    assert (await api.post(f"{JOBS}/{job_id}/append", json={"data": ["x"]})).status_code == 422
+    assert (await api.post(f"{JOBS}/{job_id}/append", json={"values": [1.0]})).status_code == 422
+    assert (await api.post(f"{JOBS}/{job_id + 1}/append", json={"data": [1.0]})).status_code == 404
+
+
+async def _pages(api, **params):
+    ids, pages, cursor = [], 0, None
+    while True:
+        response = await api.get(f"{JOBS}/", params={**params, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200
+        page = response.json()
+        ids += [job["id"] for job in page["items"]]
+        pages += 1
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return ids, pages
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("order", ["asc", "desc"])
+async def test_list_pages_through_jobs_created_at_the_same_time(api, sessions, order):
+    # Seven jobs share a timestamp, more than fit on a page
+    times = [datetime(2024, 1, 1, 12)] * 7 + [datetime(2024, 1, 1, 11), datetime(2024, 1, 1, 13)]
+    async with sessions() as session:
+        jobs = [Job(status=JobStatus.PENDING, operation="sum", input_data={"data": [1.0]}, created_at=at) for at in times]
+        session.add_all(jobs)
+        await session.commit()
+
+    ids, pages = await _pages(api, limit=3, order=order)
+
+    expected = [job.id for job in sorted(jobs, key=lambda job: (job.created_at, job.id), reverse=order == "desc")]
+    assert ids == expected
+    assert pages == 3
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("raw", [None, b'{"created_at": 1}', b'["noon", 1]', b'[1, 2]', b'["2024-01-01T12:00:00", "x"]'])
+async def test_list_rejects_a_malformed_cursor(api, raw):
+    cursor = "not base64!" if raw is None else base64.urlsafe_b64encode(raw).decode()
+
+    response = await api.get(f"{JOBS}/", params={"cursor": cursor})
+    assert response.status_code == 422
+    assert response.json()["detail"] == "Invalid cursor"
+
+
+@pytest.fixture
+def reads(api, monkeypatch):
+    """Counts completed reads of a job, so a test can tell when a waiter has re-read it."""
+    count = [0]
+    select_job = routes._select_job
+
+    async def counted(db, job_id):
+        row = await select_job(db, job_id)
+        count[0] += 1
+        return row
+
+    monkeypatch.setattr(routes, "_select_job", counted)
+    monkeypatch.setattr(routes, "JOB_RECHECK_INTERVAL", 30)
+    return count
+
+
+async def _until(condition):
+    for _ in range(200):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("Timed out")
+
+
+async def _transition(sessions, job_id, status, reads, result=None):
+    """Move the job to ``status`` and announce it as a worker does, then wait for the re-read."""
+    async with sessions() as session:
+        await session.execute(update(Job).where(Job.id == job_id).values(status=status, result=result))
+        await session.commit()
+    seen = reads[0]
+    notifications.hub.dispatch({"id": job_id, "status": status.value})
+    await _until(lambda: reads[0] > seen)
+
+
+@pytest.mark.asyncio
+async def test_long_poll_wakes_on_the_job_event(api, sessions, reads):
+    job_id = await _add_job(sessions, status=JobStatus.PENDING)
+    started = time.monotonic()
+    polling = asyncio.create_task(api.get(f"{JOBS}/{job_id}/status", params={"wait": 20}))
+    await _until(lambda: reads[0] == 1)
+
+    await _transition(sessions, job_id, JobStatus.SUCCESS, reads, {"result": {"value": 1.0}, "error": None})
+
+    response = await asyncio.wait_for(polling, 5)
+    assert response.json()["status"] == "SUCCESS"
+    # Well before the wait or the periodic re-read would have ended it
+    assert time.monotonic() - started < 5
+    assert notifications.hub.waiter_count == 0
+
+
+@pytest.mark.asyncio
+async def test_event_stream_sends_each_status_and_closes_when_finished(api, sessions, reads):
+    job_id = await _add_job(sessions, status=JobStatus.PENDING)
+    streaming = asyncio.create_task(api.get(f"{JOBS}/{job_id}/events"))
+    # One read answers 404 for an unknown job, the next starts the stream
+    await _until(lambda: reads[0] == 2)
+
+    await _transition(sessions, job_id, JobStatus.IN_PROGRESS, reads)
+    await _transition(sessions, job_id, JobStatus.FAILED, reads, {"result": None, "error": "boom"})
+
+    # The stream ends by itself once the job is terminal
+    response = await asyncio.wait_for(streaming, 5)
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [block.split("\n") for block in response.text.strip().split("\n\n")]
+    assert [lines[0] for lines in events] == ["event: status"] * 3
+    data = [json.loads(lines[1][len("data: "):]) for lines in events]
+    assert [event["status"] for event in data] == ["PENDING", "IN_PROGRESS", "FAILED"]
+    assert data[-1]["error"] == "boom"
+
+
+def test_websocket_closes_with_4404_for_an_unknown_job(sessions, monkeypatch):
+    async def override_get_db():
+        async with sessions() as session:
+            yield session
+
+    async def ignore(*args, **kwargs):
+        return None
+
+    monkeypatch.setattr(status_cache, "get", ignore)
+    monkeypatch.setattr(status_cache, "put", ignore)
+    monkeypatch.setitem(app.dependency_overrides, get_read_db, override_get_db)
+
+    with TestClient(app).websocket_connect(f"{JOBS}/12345/ws") as websocket:
+        with pytest.raises(WebSocketDisconnect) as excinfo:
+            websocket.receive_json()
+    assert excinfo.value.code == 4404
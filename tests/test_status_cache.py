@@ -0,0 +1,69 @@
+from datetime import datetime
+
+import pytest
+from fakeredis import aioredis
+from sqlalchemy import update
+
+from app import status_cache
+from app.api import routes
+from app.db import Job, JobStatus
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    fake = aioredis.FakeRedis()
+    monkeypatch.setattr(status_cache, "get_redis", lambda: fake)
+    monkeypatch.setattr(status_cache, "JOB_STATE_CACHE_ENABLED", True)
+    monkeypatch.setattr(status_cache, "JOB_STATE_WRITE_BEHIND", False)
+    return fake
+
+
+def _job(job_id=1, status=JobStatus.PENDING, **fields):
+    at = datetime(2024, 1, 1, 12)
+    return {
+        "id": job_id, "status": status, "operation": "sum", "result": None, "deadline": None,
+        "created_at": at, "updated_at": at, **fields,
+    }
+
+
+@pytest.mark.asyncio
+async def test_read_through_fill_never_replaces_a_written_state(redis):
+    await status_cache.put(_job(status=JobStatus.SUCCESS, result={"result": {"value": 3.0}, "error": None}))
+    # A reader that loaded the row before the worker's write fills the cache late
+    await status_cache.put(_job(status=JobStatus.IN_PROGRESS), overwrite=False)
+
+    assert (await status_cache.get(1))["status"] == JobStatus.SUCCESS
+
+    await status_cache.put(_job(job_id=2), overwrite=False)
+    assert await status_cache.get(2) == _job(job_id=2)
+
+
+@pytest.mark.asyncio
+async def test_finished_jobs_are_cached_longer(redis, monkeypatch):
+    monkeypatch.setattr(status_cache, "JOB_STATE_CACHE_TERMINAL_TTL", 3600)
+    monkeypatch.setattr(status_cache, "JOB_STATE_CACHE_ACTIVE_TTL", 2)
+    await status_cache.put_many([
+        _job(1, JobStatus.PENDING), _job(2, JobStatus.IN_PROGRESS),
+        _job(3, JobStatus.SUCCESS), _job(4, JobStatus.CANCELLED),
+    ])
+
+    ttls = [await redis.ttl(f"{status_cache.REDIS_KEY_PREFIX}{job_id}") for job_id in range(1, 5)]
+    assert ttls == [2, 2, 3600, 3600]
+
+
+@pytest.mark.asyncio
+async def test_miss_loads_only_the_needed_columns_and_fills_the_cache(redis, sessions):
+    async with sessions() as db:
+        job = Job(status=JobStatus.PENDING, operation="sum", input_data={"data": [1.0] * 1000})
+        db.add(job)
+        await db.commit()
+
+        loaded = await routes._load_job(db, job.id)
+        assert set(loaded) == {column.key for column in status_cache.COLUMNS}
+        assert "input_data" not in loaded
+        assert await redis.ttl(f"{status_cache.REDIS_KEY_PREFIX}{job.id}") == status_cache.JOB_STATE_CACHE_ACTIVE_TTL
+
+        # Later reads are served from the cache until it expires
+        await db.execute(update(Job).where(Job.id == job.id).values(status=JobStatus.IN_PROGRESS))
+        await db.commit()
+        assert (await routes._load_job(db, job.id))["status"] == JobStatus.PENDING
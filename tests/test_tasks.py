@@ -0,0 +1,184 @@
+import pytest
+from fakeredis import aioredis
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+from app import result_cache, tasks, worker_loop
+from app.blobstore import LocalBlobStore
+from app.db import Base, Job, JobStatus
+
+
+@pytest.fixture
+def worker(sessions, monkeypatch):
+    """Runs ``process_job_async`` against the test database without Redis."""
+    computed = []
+
+    async def ignore(*args, **kwargs):
+        return None
+
+    async def not_requested(job_id):
+        return False
+
+    def compute(operation, data, cancelled=None):
+        computed.append(list(data))
+        return sum(data)
+
+    monkeypatch.setattr(tasks, "async_session_maker", sessions)
+    monkeypatch.setattr(tasks, "JOB_PROCESSING_DELAY", 0)
+    monkeypatch.setattr(tasks.operations, "compute", compute)
+    monkeypatch.setattr(tasks.cancellation, "is_requested", not_requested)
+    monkeypatch.setattr(tasks.cancellation.watcher, "poll", ignore)
+    for module, name in [
+        (tasks.status_cache, "put"), (tasks.notifications, "publish_job_event"),
+        (tasks.result_cache, "get"), (tasks.result_cache, "store"), (tasks.admission, "record_drained"),
+    ]:
+        monkeypatch.setattr(module, name, ignore)
+    return computed
+
+
+async def _add_job(sessions, status=JobStatus.PENDING) -> int:
+    async with sessions() as session:
+        job = Job(status=status, operation="sum", input_data={"data": [1.0, 2.0]})
+        session.add(job)
+        await session.commit()
+        return job.id
+
+
+async def _status(sessions, job_id):
+    async with sessions() as session:
+        return (await session.get(Job, job_id)).status
+
+
+@pytest.mark.asyncio
+async def test_duplicate_delivery_runs_the_job_once(sessions, worker):
+    job_id = await _add_job(sessions)
+
+    first = await tasks.process_job_async(job_id, "sum", [1.0, 2.0])
+    # The sweeper re-published the job while its first message was still queued
+    second = await tasks.process_job_async(job_id, "sum", [1.0, 2.0])
+
+    assert first == {"status": "success", "result": 3.0}
+    assert second == {"status": "skipped"}
+    assert worker == [[1.0, 2.0]]
+    assert await _status(sessions, job_id) == JobStatus.SUCCESS
+
+
+@pytest.mark.asyncio
+async def test_late_delivery_does_not_reopen_a_finished_job(sessions, worker):
+    job_id = await _add_job(sessions, JobStatus.FAILED)
+
+    assert await tasks.process_job_async(job_id, "sum", [1.0, 2.0]) == {"status": "skipped"}
+    # A status write of a straggler cannot move it either
+    await tasks.update_job_status(job_id, JobStatus.IN_PROGRESS)
+    assert worker == []
+    assert await _status(sessions, job_id) == JobStatus.FAILED
+
+
+@pytest.fixture
+def shards(tmp_path, monkeypatch):
+    """Sharded jobs run eagerly on the worker loop, with their own database on it."""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'jobs.db'}", poolclass=NullPool)
+
+    async def create():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+    worker_loop.run(create())
+    sessions = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+    calls = {"shards": [], "updates": [], "stored": []}
+    update_job_status = tasks.update_job_status
+    process_shard = tasks._process_shard
+
+    async def ignore(*args, **kwargs):
+        return None
+
+    async def not_requested(job_id):
+        return False
+
+    async def record_update(job_id, status, result=None, error=None, progress=None):
+        calls["updates"].append((status, progress))
+        await update_job_status(job_id, status, result, error, progress)
+
+    def record_shard(job_id, operation, blob, start, stop, total, deadline):
+        calls["shards"].append((start, stop, total))
+        return process_shard(job_id, operation, blob, start, stop, total, deadline)
+
+    async def store(key, result):
+        calls["stored"].append((key, result))
+
+    redis = aioredis.FakeRedis()
+    monkeypatch.setattr(tasks, "async_session_maker", sessions)
+    monkeypatch.setattr(tasks, "get_redis", lambda: redis)
+    monkeypatch.setattr(tasks, "update_job_status", record_update)
+    monkeypatch.setattr(tasks, "_process_shard", record_shard)
+    monkeypatch.setattr(tasks, "JOB_PROCESSING_DELAY", 0)
+    monkeypatch.setattr(tasks, "SHARD_SIZE", 4)
+    monkeypatch.setattr(tasks, "SHARD_MIN_ELEMENTS", 8)
+    monkeypatch.setattr(tasks.blobstore, "_store", LocalBlobStore(str(tmp_path / "blobs")))
+    monkeypatch.setattr(tasks.result_cache, "store", store)
+    monkeypatch.setattr(tasks.cancellation, "is_requested", not_requested)
+    watcher = tasks.cancellation.CancelWatcher()
+    monkeypatch.setattr(watcher, "poll", ignore)
+    monkeypatch.setattr(tasks.cancellation, "watcher", watcher)
+    for module, name in [
+        (tasks.status_cache, "put"), (tasks.notifications, "publish_job_event"),
+        (tasks.result_cache, "get"), (tasks.admission, "record_drained"),
+    ]:
+        monkeypatch.setattr(module, name, ignore)
+    yield sessions, calls
+
+    async def stop():
+        # The watcher's poll loop would outlive the test on the shared loop
+        if watcher._task is not None:
+            watcher._task.cancel()
+        await engine.dispose()
+
+    worker_loop.run(stop())
+
+
+def _add_job_on_worker(sessions, status=JobStatus.PENDING) -> int:
+    return worker_loop.run(_add_job(sessions, status))
+
+
+def _job(sessions, job_id) -> Job:
+    async def load():
+        async with sessions() as session:
+            return await session.get(Job, job_id)
+
+    return worker_loop.run(load())
+
+
+def test_large_job_is_split_into_shards_and_merged(shards):
+    sessions, calls = shards
+    data = [float(value) for value in range(10)]
+    job_id = _add_job_on_worker(sessions)
+
+    assert tasks.process_job.delay(job_id, "sum", data).get() == {"status": "sharded", "shards": 3}
+
+    assert calls["shards"] == [(0, 4, 3), (4, 8, 3), (8, 10, 3)]
+    # Each finished shard reports progress, then the merged result completes the job
+    assert calls["updates"] == [
+        (JobStatus.IN_PROGRESS, {"done": 1, "total": 3}),
+        (JobStatus.IN_PROGRESS, {"done": 2, "total": 3}),
+        (JobStatus.IN_PROGRESS, {"done": 3, "total": 3}),
+        (JobStatus.SUCCESS, None),
+    ]
+    job = _job(sessions, job_id)
+    assert job.status == JobStatus.SUCCESS
+    assert job.result == {"result": {"value": 45.0}, "error": None}
+    assert calls["stored"] == [(result_cache.cache_key("sum", data), {"value": 45.0})]
+
+
+@pytest.mark.parametrize("deadline, status", [(None, JobStatus.FAILED), (1.0, JobStatus.EXPIRED)])
+def test_failed_shard_fails_or_expires_the_job(shards, deadline, status):
+    sessions, _ = shards
+    job_id = _add_job_on_worker(sessions, JobStatus.IN_PROGRESS)
+
+    # Celery calls the chord's errback with the failed shard's request and error
+    tasks.shards_failed(None, ValueError("disk full"), None, job_id=job_id, deadline=deadline)
+
+    job = _job(sessions, job_id)
+    assert job.status == status
+    if status == JobStatus.FAILED:
+        assert job.result["error"] == "Shard failed: disk full"
@@ -0,0 +1,86 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from app import tracing
+
+
+@pytest.fixture
+def spans():
+    exporter = tracing.InMemoryExporter()
+    previous = tracing.set_exporter(exporter)
+    yield exporter.spans
+    tracing.set_exporter(previous)
+
+
+def test_parse_traceparent():
+    assert tracing.parse_traceparent("00-" + "a" * 32 + "-" + "b" * 16 + "-01") == ("a" * 32, "b" * 16)
+    assert tracing.parse_traceparent("00-" + "0" * 32 + "-" + "b" * 16 + "-01") is None
+    assert tracing.parse_traceparent("garbage") is None
+    assert tracing.parse_traceparent(None) is None
+
+
+def test_spans_are_exported_with_their_root(spans):
+    parent = "00-" + "a" * 32 + "-" + "b" * 16 + "-01"
+    with tracing.span("request", parent=parent) as root:
+        with tracing.span("child") as child:
+            assert tracing.current_traceparent() == child.traceparent
+        # Nothing is exported until the outermost span ends
+        assert spans == []
+    assert tracing.current_span() is None
+
+    assert [span.name for span in spans] == ["child", "request"]
+    assert {span.trace_id for span in spans} == {"a" * 32}
+    assert root.parent_id == "b" * 16
+    assert child.parent_id == root.span_id
+
+
+def test_failed_span_records_the_error(spans):
+    with pytest.raises(ValueError):
+        with tracing.span("work"):
+            raise ValueError("boom")
+    assert spans[0].error == "ValueError: boom"
+
+
+def test_task_span_continues_the_published_trace(spans):
+    with tracing.span("publish") as publisher:
+        traceparent = publisher.traceparent
+    request = SimpleNamespace(
+        id="task-1", traceparent=None, published_at=publisher.start,
+        headers={"traceparent": traceparent}, delivery_info={"routing_key": "jobs.high"},
+    )
+
+    with tracing.timeline() as entries:
+        with tracing.task_span(request, "process_job", job_id=7):
+            with tracing.span("compute", phase_of=7):
+                pass
+
+    names = {span.name: span for span in spans}
+    assert names["process_job"].parent_id == publisher.span_id
+    assert names["broker.transit"].attributes["queue"] == "jobs.high"
+    assert names["compute"].parent_id == names["process_job"].span_id
+    assert sorted(entry[0] for _, _, entry in entries) == ["broker.transit", "compute", "process_job"]
+    assert {job_id for job_id, _, _ in entries} == {7}
+
+
+def test_timeline_without_exporter():
+    previous = tracing.set_exporter(tracing.NoopExporter())
+    try:
+        with tracing.timeline() as entries:
+            tracing.record_span("api", 10.0, 10.5, phase_of=[1, 2])
+    finally:
+        tracing.set_exporter(previous)
+    assert [(job_id, entry) for job_id, _, entry in entries] == [(1, ["api", 10.0, 0.5]), (2, ["api", 10.0, 0.5])]
+
+
+def test_file_exporter(tmp_path):
+    path = tmp_path / "spans.jsonl"
+    previous = tracing.set_exporter(tracing.FileExporter(str(path)))
+    try:
+        with tracing.span("work", rows=3):
+            pass
+    finally:
+        tracing.set_exporter(previous)
+    (line,) = path.read_text().splitlines()
+    assert json.loads(line)["attributes"] == {"rows": 3}
@@ -0,0 +1,77 @@
+import msgpack
+import numpy as np
+import pytest
+
+from app import uploads
+
+
+async def _chunks(*parts):
+    for part in parts:
+        yield part
+
+
+@pytest.mark.asyncio
+async def test_octet_stream():
+    values = np.arange(10, dtype="<f8")
+    raw = values.tobytes()
+    parsed = await uploads.read_octet_stream(_chunks(raw[:13], raw[13:]))
+    np.testing.assert_array_equal(parsed, values)
+
+
+@pytest.mark.asyncio
+async def test_octet_stream_rejects_partial_values():
+    with pytest.raises(uploads.UploadError):
+        await uploads.read_octet_stream(_chunks(b"\0" * 9))
+
+
+@pytest.mark.asyncio
+async def test_ndjson_lines_split_across_chunks():
+    parsed = await uploads.read_ndjson(_chunks(b"1\n2.5\n[3,", b"4]\n", b"5"))
+    assert parsed.tolist() == [1, 2.5, 3, 4, 5]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("body", [b"1\nNaN\n", b'"1"\n', b"true\n", b"[1, {}]\n"])
+async def test_ndjson_rejects_invalid_values(body):
+    with pytest.raises(uploads.UploadError):
+        await uploads.read_ndjson(_chunks(body))
+
+
+@pytest.mark.asyncio
+async def test_msgpack_bin_and_array():
+    values = np.array([1.0, 2.0, 3.0])
+    operation, parsed = await uploads.read_msgpack(
+        _chunks(msgpack.packb({"operation": "cube_sum", "data": values.astype("<f8").tobytes()}))
+    )
+    assert operation == "cube_sum"
+    np.testing.assert_array_equal(parsed, values)
+
+    operation, parsed = await uploads.read_msgpack(_chunks(msgpack.packb({"data": [1, 2.0, 3]})))
+    assert operation is None
+    np.testing.assert_array_equal(parsed, values)
+
+
+@pytest.mark.asyncio
+async def test_size_cap(monkeypatch):
+    monkeypatch.setattr(uploads, "JOB_MAX_ELEMENTS", 2)
+    monkeypatch.setattr(uploads, "MAX_BYTES", 16)
+    with pytest.raises(uploads.UploadError) as excinfo:
+        await uploads.read_octet_stream(_chunks(np.zeros(3).tobytes()))
+    assert excinfo.value.status_code == 413
+    with pytest.raises(uploads.UploadError):
+        await uploads.read_ndjson(_chunks(b"1\n2\n3\n"))
+
+
+@pytest.mark.asyncio
+async def test_ndjson_rejects_integers_beyond_float64():
+    with pytest.raises(uploads.UploadError) as excinfo:
+        await uploads.read_ndjson(_chunks(b"1\n" + b"9" * 400 + b"\n"))
+    assert excinfo.value.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_msgpack_rejects_data_without_a_value():
+    # A one-entry map that ends after its "data" key
+    with pytest.raises(uploads.UploadError) as excinfo:
+        await uploads.read_msgpack(_chunks(b"\x81\xa4data"))
+    assert excinfo.value.status_code == 422
@@ -0,0 +1,60 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app import worker_loop
+
+
+def _run_concurrently(coro_factory, count):
+    with ThreadPoolExecutor(max_workers=count) as pool:
+        return list(pool.map(lambda i: worker_loop.run(coro_factory(i)), range(count)))
+
+
+def test_jobs_share_one_loop_and_run_concurrently():
+    async def job(i):
+        await asyncio.sleep(0.2)
+        return asyncio.get_running_loop()
+
+    started = time.monotonic()
+    loops = _run_concurrently(job, 8)
+    assert time.monotonic() - started < 1.0
+    assert all(loop is worker_loop.get_loop() for loop in loops)
+
+
+def test_in_flight_limit(monkeypatch):
+    worker_loop.shutdown()
+    monkeypatch.setattr(worker_loop, "MAX_IN_FLIGHT", 2)
+    state = {"running": 0, "peak": 0}
+
+    async def job(i):
+        state["running"] += 1
+        state["peak"] = max(state["peak"], state["running"])
+        await asyncio.sleep(0.05)
+        state["running"] -= 1
+
+    try:
+        _run_concurrently(job, 6)
+    finally:
+        worker_loop.shutdown()
+    assert state["peak"] == 2
+
+
+def test_in_flight_limit_can_change_while_running(monkeypatch):
+    worker_loop.shutdown()
+    monkeypatch.setattr(worker_loop, "_max_in_flight", None)
+    monkeypatch.setattr(worker_loop, "MAX_IN_FLIGHT", 1)
+    state = {"running": 0, "peak": 0}
+
+    async def job(i):
+        if i == 0:
+            worker_loop.set_max_in_flight(3)
+        state["running"] += 1
+        state["peak"] = max(state["peak"], state["running"])
+        await asyncio.sleep(0.05)
+        state["running"] -= 1
+
+    try:
+        _run_concurrently(job, 6)
+    finally:
+        worker_loop.shutdown()
+    assert state["peak"] == 3
@@ -0,0 +1,116 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app import status_cache, write_behind
+from app.db import JobStatus
+from app.write_behind import StateBuffer
+
+
+@pytest.fixture
+def writes(monkeypatch):
+    batches = []
+
+    async def write(batch):
+        batches.append(list(batch))
+        return []
+
+    monkeypatch.setattr(write_behind, "_write", write)
+    return batches
+
+
+@pytest.mark.asyncio
+async def test_buffered_transitions_coalesce_into_one_batch(writes):
+    buffer = StateBuffer(flush_interval=0.01)
+    buffer.put(1, JobStatus.IN_PROGRESS, None)
+    buffer.put(2, JobStatus.IN_PROGRESS, None)
+    done = buffer.put(1, JobStatus.SUCCESS, {"result": 3})
+    await asyncio.wait_for(done, 1)
+    await buffer.stop()
+
+    assert writes == [[
+        (1, {"status": JobStatus.SUCCESS, "result": {"result": 3}}),
+        (2, {"status": JobStatus.IN_PROGRESS, "result": None}),
+    ]]
+
+
+@pytest.mark.asyncio
+async def test_failed_flush_keeps_newer_transitions(monkeypatch):
+    # The background flusher waits; batches are flushed by hand below
+    buffer = StateBuffer(flush_interval=60)
+    written = []
+
+    async def fail(batch):
+        # A newer transition arrives while the failing write is in flight
+        buffer.put(1, JobStatus.FAILED, {"error": "boom"})
+        raise ConnectionError("database unavailable")
+
+    async def write(batch):
+        written.extend(batch)
+        return []
+
+    monkeypatch.setattr(write_behind, "_write", fail)
+    buffer.put(1, JobStatus.SUCCESS, None)
+    buffer.put(2, JobStatus.IN_PROGRESS, None)
+    assert not await buffer.flush()
+
+    monkeypatch.setattr(write_behind, "_write", write)
+    assert await buffer.flush()
+    assert dict(written) == {
+        1: {"status": JobStatus.FAILED, "result": {"error": "boom"}},
+        2: {"status": JobStatus.IN_PROGRESS, "result": None},
+    }
+    assert len(buffer) == 0
+    await buffer.stop()
+
+
+def test_pending_state_applies_until_row_is_newer():
+    # Rows read from PostgreSQL are aware, in the session's time zone
+    now = datetime(2024, 1, 1, 2, tzinfo=timezone(timedelta(hours=2)))
+    row = {"id": 1, "status": JobStatus.PENDING, "result": None, "updated_at": now}
+    pending = {
+        "id": 1, "status": JobStatus.SUCCESS, "result": {"result": 1},
+        "updated_at": datetime(2024, 1, 1, tzinfo=timezone.utc) + timedelta(seconds=1),
+    }
+
+    assert status_cache._with_pending(row, pending)["status"] == JobStatus.SUCCESS
+    written = {**row, "status": JobStatus.SUCCESS, "updated_at": now + timedelta(seconds=2)}
+    assert status_cache._with_pending(written, pending) is written
+    assert status_cache._with_pending(row, None) is row
+
+    # Rows written by SQLite, and entries buffered before the fix, are naive UTC
+    naive = {**written, "updated_at": datetime(2024, 1, 1, 0, 0, 2)}
+    assert status_cache._with_pending(naive, pending) is naive
+
+
+@pytest.mark.asyncio
+async def test_flush_drops_written_pending_entries(monkeypatch):
+    buffer = StateBuffer(flush_interval=60)
+    cleared = []
+
+    async def write(batch):
+        # Job 2 moves on while its previous state is being written
+        buffer.put(2, JobStatus.SUCCESS, None)
+        return [
+            {"id": job_id, "status": values["status"], "created_at": None}
+            for job_id, values in batch
+        ]
+
+    async def put_many(rows):
+        pass
+
+    async def clear_pending(job_ids):
+        cleared.extend(job_ids)
+
+    monkeypatch.setattr(write_behind, "_write", write)
+    monkeypatch.setattr(status_cache, "put_many", put_many)
+    monkeypatch.setattr(status_cache, "clear_pending", clear_pending)
+    buffer.put(1, JobStatus.SUCCESS, None)
+    buffer.put(2, JobStatus.IN_PROGRESS, None)
+    assert await buffer.flush()
+
+    # Job 2's newer buffered state keeps its entry
+    assert cleared == [1]
+    monkeypatch.setattr(write_behind, "_write", lambda batch: asyncio.sleep(0, []))
+    await buffer.stop()